@@ -31,6 +31,7 @@ parser.add_argument('--date-start', dest='date_start', type=lambda s: datetime.s
 parser.add_argument('--date-end', dest='date_end', type=lambda s: datetime.strptime(f'{s} +0000', '%Y-%m-%d %z'),
                     default='2019-01-01')
 parser.add_argument('--out', default=None)
+parser.add_argument('--events', default=None, help='save orders, fills and trades as {EVENTS}_*.parquet')
 
 args = parser.parse_args()
 
@@ -55,6 +56,9 @@ portvalue = cerebro.broker.getvalue()
 
 print(f"PNL: {portvalue - args.start_cash}")
 
+if args.events:
+    thestrats[0].events.to_parquet(args.events)
+
 cerebro.plot(style='candlestick')
 
 for name, analyzer in list(thestrats[0].analyzers.getitems()):
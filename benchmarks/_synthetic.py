@@ -0,0 +1,14 @@
+"""Dati OHLCV sintetici per i benchmark"""
+import numpy as np
+import pandas as pd
+
+
+def synthetic_ohlcv(n_bars: int, freq: str = '1min', seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2017-01-01', periods=n_bars, freq=freq, tz='UTC', name='timestamp')
+    close = 10000 + np.cumsum(rng.normal(0, 5, n_bars))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) + rng.random(n_bars) * 3
+    low = np.minimum(open_, close) - rng.random(n_bars) * 3
+    volume = rng.random(n_bars) * 100 + 1
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume}, index=index)
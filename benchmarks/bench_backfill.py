@@ -0,0 +1,81 @@
+"""
+Backfill bitmex 1m da exchange finto: loop storico ( DataFrame.append ad ogni round + salvataggio dell'intero
+DataFrame ogni `save_after` round ) contro il download a batch di DataFetcher. Misura tempo e picco di memoria.
+"""
+import argparse
+import logging
+import math
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+
+import pandas as pd
+
+from benchmarks.fake_exchange import FakeBitmex
+from strategies_tester.cache import NpyCache, PartitionedNpyCache
+from strategies_tester.datafetcher import DataFetcher
+
+
+def legacy_backfill(client: FakeBitmex, cache: NpyCache, n_bars: int, save_after: int = 25) -> pd.DataFrame:
+    """riproduce il loop originale di _bitmex_download ( concat equivale al vecchio DataFrame.append )"""
+    oldest_point = client.start.to_pydatetime()
+    rounds = math.ceil(n_bars / DataFetcher.BATCH_SIZE)
+    data_df = pd.DataFrame()
+    save_thread = None
+    for round_num in range(rounds):
+        new_time = oldest_point + timedelta(minutes=round_num * DataFetcher.BATCH_SIZE)
+        data = client.Trade.Trade_getBucketed(symbol='XBTUSD', binSize='1m', count=DataFetcher.BATCH_SIZE,
+                                              startTime=new_time).result()[0]
+        temp_df = pd.DataFrame(data)
+        temp_df['timestamp'] = pd.to_datetime(temp_df['timestamp'], utc=True)
+        temp_df.set_index('timestamp', inplace=True)
+        data_df = pd.concat([data_df, temp_df], sort=True)
+        if round_num % save_after == 0:
+            if save_thread:
+                save_thread.join()
+            save_thread = threading.Thread(target=cache.save, args=('bitmex_XBTUSD_1m', data_df))
+            save_thread.start()
+    if save_thread:
+        save_thread.join()
+    return data_df
+
+
+def measure(label, fn):
+    # tempo e memoria in due esecuzioni separate: tracemalloc rallenta molto le allocazioni
+    t = time.perf_counter()
+    rows = len(fn())
+    elapsed = time.perf_counter() - t
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed:8.2f}s  peak {peak / 2 ** 20:8.1f} MB  rows {rows}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=1000000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    DataFetcher.rate_limits = {'bitmex': (1e9, 1e9)}
+    client = FakeBitmex(n_bars=args.bars)
+    client.history('1m')
+
+    def legacy():
+        with tempfile.TemporaryDirectory() as data_dir:
+            return legacy_backfill(client, NpyCache(data_dir), args.bars)
+
+    def batched():
+        with tempfile.TemporaryDirectory() as data_dir:
+            dfetch = DataFetcher(cache=PartitionedNpyCache(data_dir), bitmex_client=client)
+            return dfetch._bitmex_download('XBTUSD', '1m', cache_name='bitmex_XBTUSD_1m')
+
+    measure('legacy', legacy)
+    measure('batched', batched)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Valutazione a batch: N set di parametri di CrossStrategy con fast_backtest uno alla volta ( indicatori ricalcolati
+ad ogni set ) contro OptunaOptimizeStrategy.backtest_many ( indicatori uguali calcolati una volta ), poi
+un'ottimizzazione optuna su sqlite con study.optimize contro i batch ask/tell di run(batch_size=...).
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import optuna
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_fastbacktest import cross_params
+from strategies_tester.fastbacktest import FastBacktester, fast_backtest
+from strategies_tester.strategies import CrossStrategy, OptimizeCrossStrategy
+
+
+def optimizer(df, storage: str, study_name: str) -> OptimizeCrossStrategy:
+    opt = OptimizeCrossStrategy(study_name, 'bitmex', 'XBTUSD', '1h', [], analyzer='sqn', perc_size=10,
+                                start_cash=10000, optuna_storage=storage, engine='numpy')
+    opt.data = [df]
+    return opt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=20000)
+    parser.add_argument('--sets', type=int, default=200)
+    parser.add_argument('--trials', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    rng = np.random.default_rng(0)
+    params_list = [cross_params(rng) for _ in range(args.sets)]
+    # senza la cache di processo degli indicatori: qui si misura solo la condivisione dentro il batch
+    FastBacktester.indicator_cache = None
+
+    t = time.perf_counter()
+    single = []
+    for params in params_list:
+        try:
+            single.append(fast_backtest(df, CrossStrategy, perc_size=10, start_cash=10000, **params))
+        except Exception:
+            single.append(None)
+    single_time = time.perf_counter() - t
+
+    opt = optimizer(df, None, 'bench')
+    t = time.perf_counter()
+    many = [stats for _, stats, _ in opt.backtest_many(df, params_list)]
+    many_time = time.perf_counter() - t
+
+    same = all(a == b for a, b in zip(single, many))
+    print(f"{args.sets} parameter sets on {args.bars} bars")
+    print(f"{'one by one':<14} {single_time:7.2f}s")
+    print(f"{'backtest_many':<14} {many_time:7.2f}s  speedup x{single_time / many_time:.1f}  same stats: {same}")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = f"sqlite:///{os.path.join(data_dir, 'optuna.db')}"
+        t = time.perf_counter()
+        optimizer(df, storage, 'sequential').run(max_evals=args.trials, n_jobs=1)
+        sequential_time = time.perf_counter() - t
+
+        t = time.perf_counter()
+        optimizer(df, storage, 'batch').run(max_evals=args.trials, batch_size=args.batch_size)
+        batch_time = time.perf_counter() - t
+    print(f"\noptuna {args.trials} trials")
+    print(f"{'optimize':<14} {sequential_time:7.2f}s")
+    print(f"{'ask/tell':<14} {batch_time:7.2f}s  ( batch {args.batch_size} )  speedup x{sequential_time / batch_time:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Confronto tempo di caricamento e dimensione su disco dei backend di cache ( dati sintetici )"""
+import argparse
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.cache import cache_backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_ohlcv(args.bars)
+    with tempfile.TemporaryDirectory() as data_dir:
+        range_from = df.index[len(df) // 2]
+        range_to = range_from + pd.Timedelta(days=61)
+        print(f"{'backend':<12} {'save s':>8} {'load s':>8} {'2 months s':>10} {'MB':>8}")
+        for key, backend_cls in cache_backends.items():
+            backend = backend_cls(data_dir)
+            t = time.perf_counter()
+            backend.save('bench', df)
+            save_time = time.perf_counter() - t
+            load_time = float('inf')
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                backend.load('bench')
+                load_time = min(load_time, time.perf_counter() - t)
+            t = time.perf_counter()
+            backend.load('bench', date_from=range_from, date_to=range_to)
+            range_time = time.perf_counter() - t
+            size = backend.disk_size('bench') / 2 ** 20
+            print(f"{key:<12} {save_time:8.3f} {load_time:8.3f} {range_time:10.3f} {size:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Ottimizzazione distribuita in locale: un `optimize.py coordinator` e N `optimize.py worker` come processi separati
+sullo stesso sqlite ( al posto di postgresql ), con i dati letti dalla cache locale di ogni worker. Il primo worker
+viene ucciso con SIGKILL mentre valuta un trial: il trial RUNNING deve essere ripreso dal coordinatore e rimesso in coda.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import optuna
+from optuna.trial import TrialState
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.cache import PartitionedNpyCache
+from strategies_tester.datafetcher import DataFetcher
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPTIMIZE = os.path.join(ROOT, 'optimize.py')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=3000)
+    parser.add_argument('--trials', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--engine', default='backtrader', choices=['backtrader', 'numpy'])
+    args = parser.parse_args()
+
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    date_end = (df.index[-1] + df.index.freq).strftime('%Y-%m-%d')
+    with tempfile.TemporaryDirectory() as work_dir:
+        # cache locale dei worker: data/bitmex_XBTUSD_1h come dopo un download
+        PartitionedNpyCache(os.path.join(work_dir, DataFetcher.DATA_DIR)).save('bitmex_XBTUSD_1h', df)
+        storage = f"sqlite:///{os.path.join(work_dir, 'optuna.db')}"
+        env = dict(os.environ, OPTUNA_STORAGE=storage, PYTHONPATH=ROOT)
+        common = ['--strategy', 'cross', '--analyzer', 'sqn', '--perc-size', '10', '--start-cash', '10000',
+                  '--date-start', '2017-01-01', '--date-end', date_end, '--engine', args.engine]
+
+        def start(*command, stdout=subprocess.PIPE):
+            return subprocess.Popen([sys.executable, OPTIMIZE, *command], cwd=work_dir, env=env,
+                                    stdout=stdout, stderr=subprocess.STDOUT, text=True)
+
+        t = time.perf_counter()
+        coordinator = start('coordinator', *common, '--max-evals', str(args.trials), '--stale-after', '5',
+                            '--interval', '2')
+        study_name = None
+        for line in coordinator.stdout:
+            if '--study' in line:
+                study_name = line.split('--study', 1)[1].strip()
+                break
+        workers = [start('worker', '--study', study_name, '--heartbeat', '1', stdout=subprocess.DEVNULL)
+                   for _ in range(args.workers)]
+        study = optuna.load_study(study_name=study_name, storage=storage)
+        victim = f':{workers[0].pid}'
+        while not any(t.state == TrialState.RUNNING and t.system_attrs.get('worker', '').endswith(victim)
+                      for t in study.get_trials(deepcopy=False)):
+            time.sleep(0.2)
+        workers[0].send_signal(signal.SIGKILL)
+
+        output = coordinator.communicate()[0]
+        elapsed = time.perf_counter() - t
+        for worker in workers:
+            worker.wait()
+
+        states = {state.name: 0 for state in TrialState}
+        for trial in study.trials:
+            states[trial.state.name] += 1
+        stale = [t.number for t in study.trials if t.system_attrs.get('fail_reason') == 'stale heartbeat']
+        workers_seen = {t.system_attrs.get('worker') for t in study.trials if t.system_attrs.get('worker')}
+
+        print(f"{args.trials} trials on {args.bars} bars, {args.workers} workers ( 1 killed ), {os.cpu_count()} cpu")
+        print(f"elapsed {elapsed:.1f}s  {states['COMPLETE'] * 60 / elapsed:.1f} trials/min")
+        print(f"states: {', '.join(f'{k} {v}' for k, v in states.items() if v)}")
+        print(f"reclaimed trials: {stale}  trials evaluated by {len(workers_seen)} workers")
+        print(f"coordinator: {[l for l in output.splitlines() if 'best result' in l]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Aggiornamento della cache di piu' symbol/bin: download sequenziale contro DataFetcher.download_many ( exchange finti )"""
+import argparse
+import logging
+import tempfile
+import time
+
+from benchmarks.fake_exchange import FakeBinance, FakeBitmex
+from strategies_tester.cache import PartitionedNpyCache
+from strategies_tester.datafetcher import DataFetcher
+
+SPECS = [
+    ('binance', 'BTCUSDT', '1h'),
+    ('binance', 'BTCUSDT', '1d'),
+    ('bitmex', 'XBTUSD', '1d'),
+    ('bitmex', 'XBTUSD', '1h'),
+    ('bitmex', 'XBTUSD', '5m'),
+    ('bitmex', 'XBTUSD', '1m'),
+]
+
+
+def run(concurrent: bool, args) -> float:
+    bitmex = FakeBitmex(n_bars=args.bars, latency=args.latency, max_rate=args.bitmex_rate)
+    binance = FakeBinance(n_bars=args.bars, latency=args.latency, max_rate=args.binance_rate)
+    with tempfile.TemporaryDirectory() as data_dir:
+        dfetch = DataFetcher(cache=PartitionedNpyCache(data_dir), bitmex_client=bitmex, binance_client=binance)
+        t = time.perf_counter()
+        if concurrent:
+            dfetch.download_many(SPECS)
+        else:
+            for spec in SPECS:
+                dfetch.update_cache(*spec)
+        elapsed = time.perf_counter() - t
+    print(f"{'download_many' if concurrent else 'sequential':<14} {elapsed:8.2f}s  "
+          f"bitmex requests {bitmex.requests} ( rejected {bitmex.rejected} )  "
+          f"binance requests {binance.requests} ( rejected {binance.rejected} )")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=20000, help='candles per bin on the fake exchanges')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per request')
+    parser.add_argument('--bitmex-rate', dest='bitmex_rate', type=float, default=20.0, help='server side req/s')
+    parser.add_argument('--binance-rate', dest='binance_rate', type=float, default=50.0, help='server side req/s')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    # il client rispetta un rate un po' inferiore a quello del server finto
+    DataFetcher.rate_limits = {
+        'bitmex': (args.bitmex_rate * 0.9, 1),
+        'binance': (args.binance_rate * 0.9, 1),
+    }
+    sequential = run(False, args)
+    concurrent = run(True, args)
+    print(f"speedup x{sequential / concurrent:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Registro degli eventi di BaseStrategy ( strategies/_events.py ) contro le stringhe di log: costo per notifica di
+notify_order / notify_trade ( stesse notifiche di un backtest MFIStrategy rigiocate sulla strategia finita ) con le
+stringhe formattate ( logger INFO su un NullHandler ), con il registro e senza nulla; memoria di 100k trade chiusi
+come colonne, come stringhe di log e come dizionari; tempo del backtest intero con e senza registro.
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.strategies import EventRecorder, MFIStrategy
+from strategies_tester.strategies._base import __name__ as base_logger
+from strategies_tester.utils_backtest import backtest_strategy
+
+
+class CaptureStrategy(MFIStrategy):
+    """MFIStrategy che tiene le notifiche ricevute per rigiocarle"""
+
+    def __init__(self):
+        super().__init__()
+        self.captured_orders = []
+        self.captured_trades = []
+
+    def notify_order(self, order):
+        super().notify_order(order)
+        self.captured_orders.append(order)
+
+    def notify_trade(self, trade):
+        super().notify_trade(trade)
+        if trade.isclosed:
+            self.captured_trades.append(trade)
+
+
+def per_event(strategy, orders: list, trades: list, repeat: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for order in orders:
+            strategy.notify_order(order)
+        for trade in trades:
+            strategy.notify_trade(trade)
+        best = min(best, time.perf_counter() - t)
+    return best / (len(orders) + len(trades))
+
+
+def traced(build) -> int:
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def backtest_time(df, record_events: bool, repeat: int = 3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        backtest_strategy(df=df, strategy=MFIStrategy, verbose=False, record_events=record_events, start_cash=10000,
+                          perc_size=10, mfi_limit_high=55, mfi_limit_low=45)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=20000)
+    parser.add_argument('--trades', type=int, default=100000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    _, strategies = backtest_strategy(df=df, strategy=CaptureStrategy, verbose=False, record_events=False,
+                                      start_cash=10000, perc_size=10, mfi_limit_high=55, mfi_limit_low=45)
+    strategy = strategies[0]
+    orders, trades = strategy.captured_orders, strategy.captured_trades
+    strategy.notify_order, strategy.notify_trade = MFIStrategy.notify_order.__get__(strategy), \
+        MFIStrategy.notify_trade.__get__(strategy)
+    print(f"MFIStrategy on {args.bars} bars: {len(orders)} order notifications, {len(trades)} closed trades")
+
+    # logger della strategia abilitato ma senza output: resta il costo di formattazione e del LogRecord
+    logger = logging.getLogger(base_logger)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+
+    strategy.log_enabled, strategy.events = False, None
+    nothing = per_event(strategy, orders, trades)
+    strategy.log_enabled, strategy.events = True, None
+    strings = per_event(strategy, orders, trades)
+    strategy.log_enabled, strategy.events = False, EventRecorder()
+    recorder = per_event(strategy, orders, trades)
+    print(f"per notification: log strings {(strings - nothing) * 1e6:.2f}us  event recorder "
+          f"{(recorder - nothing) * 1e6:.2f}us  ( on top of {nothing * 1e6:.2f}us of backtrader )")
+
+    cycle = [trades[i % len(trades)] for i in range(args.trades)]
+
+    def columns():
+        events = EventRecorder()
+        for trade in cycle:
+            events.trade(trade)
+        return events
+
+    def log_strings():
+        return [f'OPERATION PROFIT, GROSS {trade.pnl:.2f}, NET {trade.pnlcomm:.2f}' for trade in cycle]
+
+    def dicts():
+        return [{'ref': t.ref, 'long': t.long, 'dtopen': t.dtopen, 'dtclose': t.dtclose, 'baropen': t.baropen,
+                 'barclose': t.barclose, 'barlen': t.barlen, 'price': t.price, 'pnl': t.pnl, 'pnlcomm': t.pnlcomm,
+                 'commission': t.commission} for t in cycle]
+
+    print(f"\nmemory for {args.trades} closed trades")
+    for name, build in (('event recorder', columns), ('log strings ( pnl only )', log_strings),
+                        ('dicts', dicts)):
+        print(f"{name:<26} {traced(build) / 2 ** 20:7.2f}MB")
+    events = columns()
+    t = time.perf_counter()
+    frame = events.to_frame('trades')
+    print(f"to_frame('trades'): {(time.perf_counter() - t) * 1e3:.1f}ms, {len(frame)} rows")
+
+    print(f"\nwhole backtest, verbose=False: without recorder {backtest_time(df, False):.2f}s  "
+          f"with recorder {backtest_time(df, True):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
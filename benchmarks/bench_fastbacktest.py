@@ -0,0 +1,132 @@
+"""
+Parita' e tempi del backtest NumPy ( strategies_tester.fastbacktest ) contro backtrader: per ogni strategia a segnali
+esegue gli stessi parametri ( default + combinazioni casuali negli intervalli degli ottimizzatori ) con
+OptunaOptimizeStrategy.backtest e .fast_backtest per ogni --perc-sizes e confronta pnl, sqn, vwr, sharpe_ratio e
+winrate con le tolleranze di TOLERANCES. Esce con codice 1 se un risultato e' diverso: vale come test di parita'.
+Va lanciato come modulo dalla radice del repository ( python -m benchmarks.bench_fastbacktest ), la versione
+ridotta e' in tests/test_fastbacktest_parity.py.
+"""
+import argparse
+import logging
+import math
+import sys
+import time
+
+import numpy as np
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.strategies import CrossStrategy, EMASplopeStrategy, MFIStrategy, OptunaOptimizeStrategy
+
+STATS = ['pnl', 'sqn', 'vwr', 'sharpe_ratio', 'winrate']
+# tolleranza relativa per statistica: stessi trade, differenze solo di arrotondamento ( sqn, vwr e sharpe_ratio
+# passano da somme e radici calcolate in ordine diverso )
+TOLERANCES = {'pnl': 1e-6, 'sqn': 1e-6, 'vwr': 1e-6, 'sharpe_ratio': 1e-6, 'winrate': 1e-9}
+
+
+def cross_params(rng):
+    params = {
+        'ma_fast_type': rng.choice(['ema', 'sma']),
+        'ma_fast_period': int(rng.choice([5, 9, 10, 13, 21, 34, 55, 89, 144])),
+        'ma_slow_type': rng.choice(['ema', 'sma']),
+        'ma_slow_period': int(rng.choice([21, 34, 55, 89, 144, 200, 233, 377, 610])),
+        'stop_loss': int(rng.integers(0, 20)) * 10 + 1,
+        'use_mfi': bool(rng.random() < 0.5),
+        'use_filter_fast': bool(rng.random() < 0.8),
+    }
+    if params['use_mfi']:
+        params['mfi_high'] = int(rng.integers(1, 101))
+        params['mfi_low'] = int(rng.integers(1, 101))
+    return params
+
+
+def mfi_params(rng):
+    return {
+        'stop_loss': int(rng.integers(0, 20)) * 10 + 1,
+        'mfi_length': int(rng.integers(5, 201)),
+        'mfi_limit_high': int(rng.integers(1, 101)),
+        'mfi_limit_low': int(rng.integers(1, 101)),
+    }
+
+
+def ema_slope_params(rng):
+    fast, slow = sorted(int(x) for x in rng.choice(np.arange(5, 200), size=2, replace=False))
+    params = {
+        'stop_loss': int(rng.integers(0, 20)) * 10 + 1,
+        'slope_average': rng.choice(['ema', 'sma']),
+        'slope_ma_length': int(rng.integers(5, 611)),
+        'slope_fast_length': fast,
+        'slope_slow_length': slow,
+        'slope_trend_filter_enable': bool(rng.random() < 0.5),
+    }
+    if params['slope_trend_filter_enable']:
+        params['slope_trend_filter_length'] = int(rng.integers(5, 611))
+    return params
+
+
+STRATEGIES = [(CrossStrategy, cross_params), (MFIStrategy, mfi_params), (EMASplopeStrategy, ema_slope_params)]
+
+
+def same_value(a, b, rel: float = 1e-6) -> bool:
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=rel, abs_tol=1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=20000)
+    parser.add_argument('--freq', default='1h')
+    parser.add_argument('--runs', type=int, default=10, help='random parameter sets per strategy ( + defaults )')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--perc-sizes', default='10,50,100',
+                        help='perc_size values, each run with every parameter set ( start cash 1000 for 100 )')
+    args = parser.parse_args()
+    perc_sizes = [int(p) for p in args.perc_sizes.split(',')]
+
+    # gli errori di backtest() ( es. winrate senza trade persi ) vengono loggati: qui conta solo che coincidano
+    logging.basicConfig(level=logging.CRITICAL)
+    df = synthetic_ohlcv(args.bars, freq=args.freq, seed=args.seed)
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'strategy':<20} {'runs':>5} {'same':>5} {'backtrader':>11} {'numpy':>9} {'speedup':>8}")
+    failures = []
+    for strategy, sample in STRATEGIES:
+        # perc_size 10 ( default della classe ) e 100 ( default di optimize.py, passa dai rifiuti per margin )
+        sets = [{}] + [sample(rng) for _ in range(args.runs)]
+        configs = [(params, perc_size, 1000 if perc_size >= 100 else 10000) for params in sets
+                   for perc_size in perc_sizes]
+        same, slow_time, fast_time = 0, 0.0, 0.0
+        for params, perc_size, start_cash in configs:
+            opt = OptunaOptimizeStrategy('bench', 'bitmex', 'XBTUSD', args.freq, [], perc_size=perc_size,
+                                         start_cash=start_cash)
+            opt.strategy = strategy
+
+            t = time.perf_counter()
+            slow = opt.backtest(df, **params)[1]
+            slow_time += time.perf_counter() - t
+
+            t = time.perf_counter()
+            fast = opt.fast_backtest(df, **params)[1]
+            fast_time += time.perf_counter() - t
+
+            if slow is None or fast is None:
+                ok = slow is None and fast is None
+            else:
+                ok = all(same_value(slow[k], fast[k], TOLERANCES[k]) for k in STATS)
+            same += ok
+            if not ok:
+                failures.append((strategy.__name__, params, perc_size, slow, fast))
+        print(f"{strategy.__name__:<20} {len(configs):>5} {same:>5} {slow_time:10.2f}s {fast_time:8.2f}s "
+              f"{slow_time / fast_time:7.1f}x")
+
+    for name, params, perc_size, slow, fast in failures:
+        print(f"\nDIFFERENT {name} perc_size={perc_size} {params}")
+        for k in STATS:
+            print(f"  {k:<13} backtrader {slow and slow[k]}  numpy {fast and fast[k]}")
+    if failures:
+        print(f"\n{len(failures)} results differ")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
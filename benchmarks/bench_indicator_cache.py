@@ -0,0 +1,61 @@
+"""
+Cache degli indicatori tra trial ( strategies_tester.indicator_cache ): N set di parametri di CrossStrategy valutati
+uno per trial con OptunaOptimizeStrategy.fast_backtest senza cache, con la cache in memoria e con una cache su
+disco appena riaperta ( come un nuovo processo ). Stampa tempi, hit rate medio per trial e controlla che le stats
+non cambino.
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_fastbacktest import cross_params
+from strategies_tester.fastbacktest import FastBacktester
+from strategies_tester.indicator_cache import IndicatorCache
+from strategies_tester.strategies import OptimizeCrossStrategy
+
+
+def run_trials(opt, df, params_list):
+    t = time.perf_counter()
+    stats, hit_rates = [], []
+    for params in params_list:
+        _, trial_stats, lookups = opt.fast_backtest(df, **params)
+        stats.append(trial_stats)
+        if lookups and lookups[0]:
+            hit_rates.append(1.0 - lookups[1] / lookups[0])
+    return time.perf_counter() - t, stats, float(np.mean(hit_rates))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=100000)
+    parser.add_argument('--trials', type=int, default=300)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    rng = np.random.default_rng(0)
+    params_list = [cross_params(rng) for _ in range(args.trials)]
+    opt = OptimizeCrossStrategy('bench', 'bitmex', 'XBTUSD', '1h', [], analyzer='sqn', perc_size=10,
+                                start_cash=10000, engine='numpy')
+
+    print(f"{args.trials} trials on {args.bars} bars")
+    print(f"{'cache':<12} {'time':>8} {'hit rate':>9} {'same':>5}")
+    FastBacktester.indicator_cache = None
+    base_time, base, _ = run_trials(opt, df, params_list)
+    print(f"{'none':<12} {base_time:7.2f}s {'-':>9} {'-':>5}")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        for name, cache in [('memory', IndicatorCache()),
+                            ('disk write', IndicatorCache(data_dir=data_dir)),
+                            ('disk reopen', IndicatorCache(data_dir=data_dir))]:
+            FastBacktester.indicator_cache = cache
+            elapsed, stats, hit_rate = run_trials(opt, df, params_list)
+            print(f"{name:<12} {elapsed:7.2f}s {hit_rate:8.0%} {str(stats == base):>5}   {cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Pruning dentro il periodo: la stessa ottimizzazione optuna ( engine backtrader, sqlite ) senza pruning e con il pnl
+riportato ogni --checkpoint-bars barre a MedianPruner e HyperbandPruner. Controlla anche che un checkpoint che non
+ferma nulla lasci le statistiche invariate.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import optuna
+from optuna.trial import TrialState
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.strategies import OptimizeCrossStrategy
+
+
+def optimizer(df, storage: str, study_name: str, **kwargs) -> OptimizeCrossStrategy:
+    opt = OptimizeCrossStrategy(study_name, 'bitmex', 'XBTUSD', '1h', [], analyzer='pnl', perc_size=10,
+                                start_cash=10000, optuna_storage=storage, **kwargs)
+    opt.data = [df]
+    return opt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=10000)
+    parser.add_argument('--trials', type=int, default=40)
+    parser.add_argument('--checkpoint-bars', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+
+    opt = optimizer(df, None, 'parity', checkpoint_bars=args.checkpoint_bars)
+    plain = opt.backtest(df)[1]
+    checked = opt.backtest(df, checkpoint=lambda strategy, bar: False, checkpoint_bars=args.checkpoint_bars)[1]
+    print(f"{args.trials} trials on {args.bars} bars, checkpoint every {args.checkpoint_bars} bars")
+    print(f"checkpoints without pruning give the same stats: {plain == checked}")
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = f"sqlite:///{os.path.join(data_dir, 'optuna.db')}"
+        baseline = None
+        for pruner, checkpoint_bars in (('none', None), ('median', args.checkpoint_bars),
+                                        ('hyperband', args.checkpoint_bars)):
+            opt = optimizer(df, storage, pruner, pruner=pruner, checkpoint_bars=checkpoint_bars)
+            t = time.perf_counter()
+            opt.run(max_evals=args.trials, n_jobs=1)
+            elapsed = time.perf_counter() - t
+            baseline = baseline or elapsed
+            study = optuna.load_study(study_name=pruner, storage=storage)
+            trials = study.get_trials(deepcopy=False)
+            pruned = [t for t in trials if t.state == TrialState.PRUNED]
+            stopped = [t.user_attrs['stopped_at_bar'] for t in pruned if 'stopped_at_bar' in t.user_attrs]
+            bars_saved = sum(args.bars - bar for bar in stopped) / (len(trials) * args.bars)
+            print(f"{pruner:<10} {elapsed:7.2f}s  x{baseline / elapsed:.2f}  {len(trials)} trials, "
+                  f"{len(stopped)} stopped early ( {bars_saved:.0%} bars skipped ), best {study.best_value:.2f}")
+
+
+if __name__ == '__main__':
+    main()
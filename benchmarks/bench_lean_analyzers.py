@@ -0,0 +1,63 @@
+"""
+Costo degli analyzer per trial: backtest_strategy con tutti gli analyzer ( metrics=None, come prima ) contro
+OptunaOptimizeStrategy.backtest ( engine backtrader ) con tutte le metriche salvate come user attrs ( default ) e con
+i soli analyzer necessari all'obiettivo ( user_attrs=[] ). Controlla che il valore dell'obiettivo non cambi.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_fastbacktest import cross_params, same_value
+from strategies_tester.strategies import CrossStrategy, OptimizeCrossStrategy
+from strategies_tester.utils_backtest import backtest_strategy
+
+CONFIGS = [
+    ('all metrics', 'sqn', None),
+    ('sqn', 'sqn', []),
+    ('pnl', 'pnl', []),
+    ('sqn + winrate', 'sqn', ['winrate']),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=10000)
+    parser.add_argument('--trials', type=int, default=6)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    rng = np.random.default_rng(0)
+    params_list = [{}] + [cross_params(rng) for _ in range(args.trials - 1)]
+
+    print(f"{args.trials} trials on {args.bars} bars")
+    print(f"{'metrics':<14} {'per trial':>10} {'saving':>7} {'same':>5}  analyzers")
+    t = time.perf_counter()
+    base = {'sqn': []}
+    for params in params_list:
+        cerebro, thestrats = backtest_strategy(df, CrossStrategy, perc_size=10, start_cash=10000, **params)
+        base['sqn'].append(thestrats[0].analyzers.sqn.get_analysis()['sqn'])
+    base_time = (time.perf_counter() - t) / len(params_list)
+    print(f"{'every analyzer':<14} {base_time:9.3f}s {'':>7} {'':>5}  {', '.join(thestrats[0].analyzers.getnames())}")
+    for name, analyzer, user_attrs in CONFIGS:
+        opt = OptimizeCrossStrategy('bench', 'bitmex', 'XBTUSD', '1h', [], analyzer=analyzer, perc_size=10,
+                                    start_cash=10000, user_attrs=user_attrs)
+        results, elapsed, analyzers = [], 0.0, []
+        for params in params_list:
+            t = time.perf_counter()
+            result, stats, cerebro, thestrats = opt.backtest(df, **params)
+            elapsed += time.perf_counter() - t
+            results.append(stats and stats[analyzer])
+            if thestrats:
+                analyzers = thestrats[0].analyzers.getnames()
+        per_trial = elapsed / len(params_list)
+        same = all(same_value(a, b) for a, b in zip(base[analyzer], results)) if analyzer in base else '-'
+        base.setdefault(analyzer, results)
+        print(f"{name:<14} {per_trial:9.3f}s {1 - per_trial / base_time:6.0%} {str(same):>5}  {', '.join(analyzers)}")
+
+
+if __name__ == '__main__':
+    main()
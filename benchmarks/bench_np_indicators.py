@@ -0,0 +1,111 @@
+"""
+Gemelli NumPy di strategies_tester/strategies/_indicators.py: per ogni indicatore controlla che i valori ( e le barre
+NaN prima del minperiod ) coincidano con backtrader in runonce, poi confronta il tempo di un cerebro con il solo
+indicatore ( quello che lo screening dei segnali si risparmia ) con la chiamata NumPy, il migliore di 3 esecuzioni.
+Esce con codice 1 se una linea ha barre NaN diverse o un errore relativo oltre --max-error: vale come test di parita'.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import backtrader as bt
+import numpy as np
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.strategies import BaseStrategy
+from strategies_tester.strategies import _np_indicators as npi
+from strategies_tester.strategies._indicators import (
+    MFI, STC, Slope, SlopeGrad, Stoch, StochasticSlow, SuperTrend, SuperTrendBand
+)
+from strategies_tester.utils_backtest import backtrader_data
+
+# nome, indicatore backtrader sui dati della strategia, gemello NumPy sulle colonne, linee nell'ordine del gemello
+CASES = [
+    ('MFI', lambda d: MFI(d, period=14), lambda h, l, c, v: npi.mfi(h, l, c, v, 14), ('mfi',)),
+    # periodo lungo: somme mobili O(n) ( RunningSumN e running_sum_n )
+    ('MFI 60', lambda d: MFI(d, period=60), lambda h, l, c, v: npi.mfi(h, l, c, v, 60), ('mfi',)),
+    ('SMA 200', lambda d: bt.ind.SMA(d.close, period=200), lambda h, l, c, v: npi.sma(c, 200), ('sma',)),
+    ('SuperTrendBand', lambda d: SuperTrendBand(d, period=10, multiplier=3),
+     lambda h, l, c, v: npi.supertrend_band(h, l, c, 10, 3),
+     ('basic_ub', 'basic_lb', 'st_upper_level', 'st_lower_level')),
+    ('SuperTrend', lambda d: SuperTrend(d, period=10, multiplier=3),
+     lambda h, l, c, v: npi.supertrend(h, l, c, 10, 3), ('super_trend', 'st_trend')),
+    ('Slope', lambda d: Slope(d.close), lambda h, l, c, v: npi.slope(c), ('slp',)),
+    ('SlopeGrad', lambda d: SlopeGrad(d.close, period=5), lambda h, l, c, v: npi.slope_grad(c, 5), ('slope',)),
+    ('StochasticSlow', lambda d: StochasticSlow(d), lambda h, l, c, v: npi.stochastic_slow(h, l, c), ('k', 'd')),
+    ('Stoch', lambda d: Stoch(d, src=d.close, high=d.high, low=d.low),
+     lambda h, l, c, v: npi.stoch(c, h, l), ('k', 'd')),
+    ('STC', lambda d: STC(d), lambda h, l, c, v: npi.stc(c), ('stc',)),
+]
+
+
+class IndicatorStrategy(BaseStrategy):
+    params = (('factory', None),)
+
+    def __init__(self):
+        super().__init__()
+        self.indicator = self.p.factory(self.data) if self.p.factory else None
+
+
+def run_backtrader(df, factory=None, repeat: int = 3):
+    """indicatore calcolato da cerebro e miglior tempo su `repeat` esecuzioni"""
+    best = float('inf')
+    for _ in range(repeat):
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.adddata(backtrader_data(df))
+        cerebro.addstrategy(IndicatorStrategy, factory=factory, verbose=False)
+        t = time.perf_counter()
+        strategy = cerebro.run()[0]
+        best = min(best, time.perf_counter() - t)
+    return strategy.indicator, best
+
+
+def compare(expected: np.ndarray, actual: np.ndarray, skip: int = 0):
+    """( stesse barre NaN, massimo errore relativo ) ignorando le prime `skip` barre"""
+    expected, actual = expected[skip:], actual[skip:]
+    same_nan = np.array_equal(np.isnan(expected), np.isnan(actual))
+    valid = ~np.isnan(expected) & ~np.isnan(actual)
+    error = np.abs(expected[valid] - actual[valid]) / np.maximum(np.abs(expected[valid]), 1e-12)
+    return same_nan, float(error.max()) if len(error) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=20000)
+    parser.add_argument('--max-error', type=float, default=1e-9, help='max relative error against backtrader')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    h, l, c, v = (df[k].to_numpy() for k in ('high', 'low', 'close', 'volume'))
+    _, empty_time = run_backtrader(df)
+
+    print(f"{args.bars} bars, a cerebro with no indicators takes {empty_time:.2f}s")
+    print(f"{'indicator':<16} {'line':<16} {'same NaN':>8} {'max rel err':>12} {'cerebro':>11} {'numpy':>9} "
+          f"{'speedup':>8}")
+    failures = []
+    for name, bt_factory, np_func, lines in CASES:
+        indicator, bt_time = run_backtrader(df, bt_factory)
+        np_time = float('inf')
+        for _ in range(3):
+            t = time.perf_counter()
+            result = np_func(h, l, c, v)
+            np_time = min(np_time, time.perf_counter() - t)
+        result = result if isinstance(result, tuple) else (result,)
+        for i, (line, values) in enumerate(zip(lines, result)):
+            expected = np.array(getattr(indicator.lines, line).array)[-len(df):]
+            # SlopeGrad: backtrader legge fuori dai dati alla prima barra ( vedi npi.slope_grad )
+            same_nan, error = compare(expected, values, skip=5 if name == 'SlopeGrad' else 0)
+            timing = f"{bt_time:10.3f}s {np_time:8.4f}s {bt_time / np_time:7.0f}x" if i == 0 else ''
+            print(f"{name if i == 0 else '':<16} {line:<16} {str(same_nan):>8} {error:12.2e} {timing}")
+            if not same_nan or error > args.max_error:
+                failures.append(f"{name}.{line}")
+
+    if failures:
+        print(f"\ndifferent from backtrader: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
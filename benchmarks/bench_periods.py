@@ -0,0 +1,82 @@
+"""
+Valutazione multi periodo ( walk-forward ): con l'engine numpy i periodi valutati uno per uno ( un dataset e
+indicatori per periodo ) contro shared_warmup ( indicatori calcolati una volta sull'unione e tagliati per periodo ),
+al crescere del numero di periodi; con backtrader un'ottimizzazione con i periodi in sequenza contro period_workers.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import optuna
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_fastbacktest import cross_params
+from strategies_tester.fastbacktest import FastBacktester
+from strategies_tester.strategies import OptimizeCrossStrategy
+
+
+def walk_forward(df, n: int) -> list:
+    bounds = np.linspace(0, len(df), n + 1).astype(int)
+    return [(df.index[lo].to_pydatetime(), df.index[hi - 1].to_pydatetime()) for lo, hi in zip(bounds, bounds[1:])]
+
+
+def optimizer(df, periods: list, shared_warmup=False, storage: str = None, study_name: str = 'bench',
+              **kwargs) -> OptimizeCrossStrategy:
+    opt = OptimizeCrossStrategy(study_name, 'bitmex', 'XBTUSD', '1h', [], analyzer='sqn', perc_size=10,
+                                start_cash=10000, optuna_storage=storage, shared_warmup=shared_warmup, **kwargs)
+    opt.time_periods = periods
+    opt.data = [df] if shared_warmup else [df.loc[start:end] for start, end in periods]
+    return opt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=40000)
+    parser.add_argument('--sets', type=int, default=100)
+    parser.add_argument('--periods', type=int, nargs='*', default=[1, 2, 4, 8])
+    parser.add_argument('--trials', type=int, default=8)
+    parser.add_argument('--period-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    rng = np.random.default_rng(0)
+    params_list = [cross_params(rng) for _ in range(args.sets)]
+    # solo la condivisione tra periodi, senza la cache di processo degli indicatori
+    FastBacktester.indicator_cache = None
+
+    print(f"numpy engine, {args.sets} parameter sets on {args.bars} bars")
+    for n in args.periods:
+        periods = walk_forward(df, n)
+        t = time.perf_counter()
+        one_by_one = optimizer(df, periods, engine='numpy')._evaluate_many(params_list)
+        one_by_one_time = time.perf_counter() - t
+        t = time.perf_counter()
+        shared = optimizer(df, periods, shared_warmup=True, engine='numpy')._evaluate_many(params_list)
+        shared_time = time.perf_counter() - t
+        # il primo periodo parte dall'inizio dei dati in entrambi i casi: stesse statistiche
+        same_first = all(a[0][1] == b[0][1] for a, b in zip(one_by_one, shared))
+        print(f"{n} periods  one by one {one_by_one_time:6.2f}s  shared warm-up {shared_time:6.2f}s  "
+              f"x{one_by_one_time / shared_time:.1f}  same first period: {same_first}")
+
+    periods = walk_forward(df.iloc[:args.bars // 4], args.period_workers)
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = f"sqlite:///{os.path.join(data_dir, 'optuna.db')}"
+        timings = {}
+        for name, workers in (('sequential', None), ('period_workers', args.period_workers)):
+            opt = optimizer(df, periods, storage=storage, study_name=name, period_workers=workers)
+            t = time.perf_counter()
+            opt.run(max_evals=args.trials, n_jobs=1)
+            timings[name] = time.perf_counter() - t
+    print(f"\nbacktrader engine, {args.trials} trials, {len(periods)} periods of {args.bars // 4 // len(periods)} bars, "
+          f"{os.cpu_count()} cpu")
+    print(f"sequential {timings['sequential']:6.2f}s  period_workers={args.period_workers} "
+          f"{timings['period_workers']:6.2f}s  x{timings['sequential'] / timings['period_workers']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Ottimizzazione su sqlite con engine backtrader: study.optimize con n_jobs=1 ( quello che _default_n_jobs impone con
+sqlite ) contro run(processes=N), con i backtest nei processi worker e un solo processo che scrive nello storage.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import optuna
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.mapped import MappedOHLCV
+from strategies_tester.strategies import OptimizeCrossStrategy
+
+
+def optimize(data, storage: str, study_name: str, trials: int, **kwargs) -> float:
+    opt = OptimizeCrossStrategy(study_name, 'bitmex', 'XBTUSD', '1h', [], analyzer='sqn', perc_size=10,
+                                start_cash=10000, optuna_storage=storage)
+    opt.data = [data]
+    t = time.perf_counter()
+    opt.run(max_evals=trials, **kwargs)
+    return time.perf_counter() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=5000)
+    parser.add_argument('--trials', type=int, default=16)
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = f"sqlite:///{os.path.join(data_dir, 'optuna.db')}"
+        # MappedOHLCV per entrambi ( stesso feed ): i worker ricevono solo il percorso e condividono le pagine
+        mapped = MappedOHLCV.create(df, os.path.join(data_dir, 'bench.npyd'))
+        print(f"{args.trials} trials on {args.bars} bars, {os.cpu_count()} cpu")
+        sequential = optimize(mapped, storage, 'sequential', args.trials, n_jobs=1)
+        print(f"{'n_jobs=1':<16} {sequential:7.2f}s  {args.trials / sequential:5.2f} trials/s")
+        pool = optimize(mapped, storage, 'processes', args.trials, processes=args.processes)
+        print(f"{f'processes={args.processes}':<16} {pool:7.2f}s  {args.trials / pool:5.2f} trials/s  "
+              f"speedup x{sequential / pool:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Finestre mobili al variare del periodo ( 5 - 610 ): bt.ind.SumN / Highest / Lowest ( somma o max/min della finestra
+ad ogni barra ) contro RunningSumN / RunningHighest / RunningLowest di _indicators ( somma corrente e deque monotona,
+O(n) in runonce ), sia in runonce che evento per evento. Tempo cpu di --copies finestre di ogni tipo al netto di un
+cerebro senza indicatori, miglior di 3, e massimo errore relativo rispetto a backtrader.
+"""
+import argparse
+import logging
+import time
+
+import backtrader as bt
+import numpy as np
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.strategies._indicators import RunningHighest, RunningLowest, RunningSumN
+from strategies_tester.utils_backtest import backtrader_data
+
+IMPLEMENTATIONS = {
+    'backtrader': (bt.ind.SumN, bt.ind.Highest, bt.ind.Lowest),
+    'running': (RunningSumN, RunningHighest, RunningLowest),
+}
+
+
+class WindowsStrategy(bt.Strategy):
+    params = (('classes', None), ('period', 14), ('copies', 1))
+
+    def __init__(self):
+        self.windows = []
+        if self.p.classes:
+            sum_n, highest, lowest = self.p.classes
+            for _ in range(self.p.copies):
+                self.windows += [sum_n(self.data.volume, period=self.p.period),
+                                 highest(self.data.high, period=self.p.period),
+                                 lowest(self.data.low, period=self.p.period)]
+
+
+def run(df, runonce: bool, classes=None, period: int = 14, copies: int = 1, repeat: int = 3):
+    best = float('inf')
+    for _ in range(repeat):
+        cerebro = bt.Cerebro(stdstats=False)
+        cerebro.adddata(backtrader_data(df))
+        cerebro.addstrategy(WindowsStrategy, classes=classes, period=period, copies=copies)
+        t = time.process_time()
+        strategy = cerebro.run(runonce=runonce)[0]
+        best = min(best, time.process_time() - t)
+    values = [np.array(window.lines[0].array)[-len(df):] for window in strategy.windows[:3]]
+    return values, best
+
+
+def max_error(expected: list, actual: list) -> float:
+    error = 0.0
+    for e, a in zip(expected, actual):
+        if not np.array_equal(np.isnan(e), np.isnan(a)):
+            return float('inf')
+        valid = ~np.isnan(e)
+        error = max(error, float((np.abs(e[valid] - a[valid]) / np.maximum(np.abs(e[valid]), 1e-12)).max()))
+    return error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=20000)
+    parser.add_argument('--periods', type=int, nargs='*', default=[5, 14, 55, 200, 610])
+    parser.add_argument('--copies', type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    print(f"{args.bars} bars, {args.copies} x ( SumN + Highest + Lowest ), cpu seconds without an empty cerebro")
+    print(f"{'mode':<8} {'period':>6} {'backtrader':>11} {'running':>9} {'speedup':>8} {'max rel err':>12}")
+    for runonce in (True, False):
+        mode = 'runonce' if runonce else 'next'
+        _, empty = run(df, runonce)
+        for period in args.periods:
+            expected, bt_time = run(df, runonce, IMPLEMENTATIONS['backtrader'], period, args.copies)
+            actual, running_time = run(df, runonce, IMPLEMENTATIONS['running'], period, args.copies)
+            bt_time, running_time = max(bt_time - empty, 1e-6), max(running_time - empty, 1e-6)
+            print(f"{mode:<8} {period:>6} {bt_time:10.3f}s {running_time:8.3f}s {bt_time / running_time:7.1f}x "
+                  f"{max_error(expected, actual):12.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Strategie incluse su dati 1m: ciclo evento per evento ( runonce=False ) contro runonce automatico.
+Controlla prima che gli indicatori con once() diano gli stessi valori nei due modi, poi confronta tempi e risultati.
+Esce con codice 1 se una linea o il risultato di una strategia e' diverso.
+"""
+import argparse
+import logging
+import sys
+import time
+
+import backtrader as bt
+import numpy as np
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.strategies import BaseStrategy, CrossStrategy, EMASplopeStrategy, MFIStrategy, RSI2Startegy
+from strategies_tester.strategies._indicators import STC, Slope, SlopeGrad, SuperTrend, SuperTrendBand
+from strategies_tester.utils_backtest import backtest_strategy, backtrader_data
+
+STRATEGIES = [CrossStrategy, MFIStrategy, EMASplopeStrategy, RSI2Startegy]
+
+
+class IndicatorsStrategy(BaseStrategy):
+    def __init__(self):
+        super().__init__()
+        self.indicators = {
+            'slope': Slope(self.data.close),
+            'slope_grad': SlopeGrad(self.data.close, period=5),
+            'super_trend_band': SuperTrendBand(period=10, multiplier=3),
+            'super_trend': SuperTrend(period=10, multiplier=3),
+            'stc': STC(),
+        }
+
+
+def indicator_values(df, runonce: bool) -> dict:
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(backtrader_data(df))
+    cerebro.addstrategy(IndicatorsStrategy, verbose=False)
+    strategy = cerebro.run(runonce=runonce)[0]
+    values = {}
+    for name, indicator in strategy.indicators.items():
+        for line_name in indicator.lines.getlinealiases():
+            values[f'{name}.{line_name}'] = np.array(getattr(indicator.lines, line_name).array)
+    return values
+
+
+def check_indicators(df) -> list:
+    """linee con valori diversi tra runonce=False e runonce=True"""
+    slow = indicator_values(df, runonce=False)
+    fast = indicator_values(df, runonce=True)
+    different = []
+    for name in slow:
+        same = np.allclose(slow[name], fast[name], equal_nan=True)
+        print(f"{name:<32} {'ok' if same else 'DIFFERENT'}")
+        if not same:
+            different.append(name)
+    return different
+
+
+def run(df, strategy, runonce: bool):
+    t = time.perf_counter()
+    cerebro, thestrats = backtest_strategy(df, strategy, runonce=runonce, verbose=False)
+    elapsed = time.perf_counter() - t
+    trades = thestrats[0].analyzers.trade.get_analysis()
+    return elapsed, cerebro.broker.getvalue(), trades.get('total', {}).get('total', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=50000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    df = synthetic_ohlcv(args.bars, freq='1min')
+
+    failures = check_indicators(df.iloc[:20000])
+    print()
+    print(f"{'strategy':<20} {'runnext':>9} {'runonce':>9} {'speedup':>8}  same result")
+    for strategy in STRATEGIES:
+        slow_time, slow_value, slow_trades = run(df, strategy, runonce=False)
+        fast_time, fast_value, fast_trades = run(df, strategy, runonce=True)
+        same = np.isclose(slow_value, fast_value) and slow_trades == fast_trades
+        print(f"{strategy.__name__:<20} {slow_time:8.2f}s {fast_time:8.2f}s {slow_time / fast_time:7.1f}x  {same}")
+        if not same:
+            failures.append(strategy.__name__)
+
+    if failures:
+        print(f"\ndifferent between runnext and runonce: {', '.join(failures)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Overhead per barra di BaseStrategy rispetto a un bt.Strategy nudo ( stessa logica, stessi ordini ), del logging
+delle notifiche e del writer csv che backtest_strategy aggiungeva anche in modalita' silenziosa ( su /dev/null ).
+"""
+import argparse
+import logging
+import os
+import time
+
+import backtrader as bt
+
+from benchmarks._synthetic import synthetic_ohlcv
+from strategies_tester.strategies import BaseStrategy
+from strategies_tester.utils_backtest import backtrader_data
+
+
+class BareCross(bt.Strategy):
+    """incrocio di medie sempre a mercato: molti ordini e quindi molte notifiche"""
+    params = (('verbose', False),)
+
+    def __init__(self):
+        super().__init__()
+        self.cross = bt.ind.CrossOver(bt.ind.SMA(period=5), bt.ind.SMA(period=20))
+
+    def next(self):
+        if self.cross > 0 and self.position.size <= 0:
+            self.close()
+            self.buy()
+        elif self.cross < 0 and self.position.size >= 0:
+            self.close()
+            self.sell()
+
+
+class BaseCross(BaseStrategy):
+    def __init__(self):
+        super().__init__()
+        self.cross = bt.ind.CrossOver(bt.ind.SMA(period=5), bt.ind.SMA(period=20))
+
+    next = BareCross.next
+
+
+class EagerLogCross(BaseCross):
+    """notify_order com'era prima: formatta ogni notifica e poi la scarta in log()"""
+
+    def notify_order(self, order):
+        bt.SignalStrategy.notify_order(self, order)
+        price = f'{order.executed.price:.2f}'
+        value = f'{order.executed.value:.2f}'
+        comm = f'{order.executed.comm:.2f}'
+        type = order.getordername()
+        dir = order.ordtypename()
+        id = order.ref
+        pos_size = self.position.size * self.position.price
+        if order.status == order.Completed:
+            self.eager_log(f'Order #{id} - {type} {dir} - EXECUTED, Price: {price}, Cost: {value}, Comm: {comm}, '
+                           f'Pos. Size: {pos_size}')
+        elif order.status in (order.Submitted, order.Accepted):
+            self.eager_log(f'Order #{id} - {type} {dir} - {order.getstatusname()}: Price {price}, Cost: {value}, '
+                           f' Pos. Size: {pos_size}')
+        else:
+            self.eager_log(f'Order #{id} - {type} {dir} - {order.getstatusname()} - Pos. Size: {pos_size}')
+
+    def eager_log(self, txt):
+        dt = self.datas[0].datetime.date(0)
+        if self.p.verbose:
+            self.logger.info(f'{dt.isoformat()}, {txt}')
+
+
+def run(df, strategy, writer: bool = False, **kwargs):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(backtrader_data(df))
+    cerebro.addstrategy(strategy, **kwargs)
+    cerebro.addsizer(bt.sizers.PercentSizer, percents=10)
+    devnull = open(os.devnull, 'w') if writer else None
+    if writer:
+        cerebro.addwriter(bt.WriterFile, csv=True, out=devnull)
+    # tempo cpu del processo: meno sensibile al carico della macchina
+    t = time.process_time()
+    cerebro.run()
+    elapsed = time.process_time() - t
+    if devnull:
+        devnull.close()
+    return elapsed, cerebro.broker.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    # logging a WARNING come nelle ottimizzazioni: i messaggi INFO delle strategie verbose vengono scartati
+    logging.basicConfig(level=logging.WARNING)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    configs = [
+        ('bt.Strategy', BareCross, {}),
+        ('BaseStrategy quiet', BaseCross, {'verbose': False}),
+        ('BaseStrategy verbose', BaseCross, {'verbose': True}),
+        ('eager formatting', EagerLogCross, {'verbose': False}),
+        ('quiet + csv writer', BaseCross, {'verbose': False, 'writer': True}),
+    ]
+
+    print(f"{args.bars} bars, best of {args.repeat}")
+    print(f"{'strategy':<22} {'time':>8} {'us/bar':>8} {'overhead':>9}  value")
+    # ripetizioni alternate tra le configurazioni: gc e cache della cpu pesano allo stesso modo su tutte
+    best = {}
+    for _ in range(args.repeat):
+        for name, strategy, kwargs in configs:
+            best[name] = min(best.get(name, (float('inf'), None)), run(df, strategy, **kwargs))
+    bare = None
+    for name, strategy, kwargs in configs:
+        elapsed, value = best[name]
+        per_bar = elapsed / args.bars * 1e6
+        bare = bare if bare is not None else per_bar
+        print(f"{name:<22} {elapsed:7.2f}s {per_bar:8.1f} {per_bar - bare:+8.1f}us  {value:.2f}")
+
+
+if __name__ == '__main__':
+    main()
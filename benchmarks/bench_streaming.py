@@ -0,0 +1,103 @@
+"""
+Streaming delle strategie a segnali ( strategies_tester.streaming ): le candele della cache ( --data-dir/--dataset, o
+candele sintetiche da 1m salvate in una cache temporanea ) passano una alla volta negli indicatori incrementali.
+Controlla che i segnali coincidano con fast_signals ( default + parametri casuali ) e mostra tempo per barra e memoria
+allocata ( tracemalloc ) lungo il flusso per CrossStrategy con ma_slow_period=610, contro il picco del calcolo batch.
+Esce con codice 1 se i segnali di una strategia sono diversi.
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_fastbacktest import STRATEGIES
+from strategies_tester.cache import PartitionedNpyCache
+from strategies_tester.fastbacktest import fast_data
+from strategies_tester.strategies import CrossStrategy
+from strategies_tester.strategies._np_indicators import SharedIndicators
+from strategies_tester.streaming import StreamingSignals, replay_check, stream_bars
+
+
+def load(args):
+    if args.data_dir:
+        return PartitionedNpyCache(args.data_dir).load(args.dataset)
+    with tempfile.TemporaryDirectory() as data_dir:
+        cache = PartitionedNpyCache(data_dir)
+        cache.save(args.dataset, synthetic_ohlcv(args.bars, freq='1min'))
+        return cache.load(args.dataset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--data-dir', default=None)
+    parser.add_argument('--dataset', default='bitmex_XBTUSD_1m')
+    parser.add_argument('--bars', type=int, default=200000)
+    parser.add_argument('--sets', type=int, default=5)
+    parser.add_argument('--parity-bars', type=int, default=50000)
+    parser.add_argument('--chunks', type=int, default=8)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    df = load(args)
+    print(f"{args.dataset}: {len(df)} bars")
+
+    parity = df.iloc[:args.parity_bars]
+    rng = np.random.default_rng(0)
+    print(f"\nsignals against fast_signals on {len(parity)} bars")
+    mismatches = 0
+    for strategy, random_params in STRATEGIES:
+        params_list = [{}] + [random_params(rng) for _ in range(args.sets)]
+        reports = [replay_check(strategy, parity, **params) for params in params_list]
+        failed = [(params, report) for params, report in zip(params_list, reports) if not report.ok]
+        print(f"{strategy.__name__:<20} {len(reports) - len(failed)}/{len(reports)} identical")
+        for params, report in failed:
+            print(f"    {params}: {report}")
+        mismatches += len(failed)
+    if mismatches:
+        sys.exit(1)
+
+    params = {'ma_slow_period': 610}
+    chunk = len(df) // args.chunks
+    timings = []
+    stream = StreamingSignals(CrossStrategy, **params)
+    t = time.process_time()
+    for bar in stream_bars(df):
+        stream.push(bar)
+        if stream.bars % chunk == 0:
+            timings.append(time.process_time() - t)
+            t = time.process_time()
+
+    # secondo passaggio con tracemalloc ( rallenta ): memoria ancora allocata dagli indicatori incrementali
+    memory = []
+    tracemalloc.start()
+    stream = StreamingSignals(CrossStrategy, **params)
+    for bar in stream_bars(df):
+        stream.push(bar)
+        if stream.bars % chunk == 0:
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, '*_stream_indicators.py')])
+            memory.append(sum(stat.size for stat in snapshot.statistics('filename')))
+    tracemalloc.stop()
+
+    print(f"\nCrossStrategy {params} pushed bar by bar")
+    print(f"{'bars':>9} {'us/bar':>7} {'indicator state':>16}")
+    for i, (elapsed, size) in enumerate(zip(timings, memory)):
+        print(f"{(i + 1) * chunk:>9} {elapsed / chunk * 1e6:7.2f} {size / 1024:14.1f}KB")
+
+    data = fast_data(df)
+    tracemalloc.start()
+    t = time.process_time()
+    CrossStrategy.fast_signals(data, CrossStrategy.fast_params(**params), SharedIndicators(data))
+    elapsed = time.process_time() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"batch fast_signals: {elapsed / len(df) * 1e6:.2f} us/bar, peak {peak / 2 ** 20:.1f}MB "
+          f"( grows with the bars )")
+
+
+if __name__ == '__main__':
+    main()
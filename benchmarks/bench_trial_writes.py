@@ -0,0 +1,95 @@
+"""
+Query allo storage optuna per trial: la stessa ottimizzazione ( engine numpy, --periods periodi, sqlite ) con ogni
+user attr e valore intermedio in una sua transazione ( buffered_writes=False ), con le scritture di un trial in una
+transazione ( TrialWriter ) e, con batch_size, con il write-behind. Conta gli statement SQL ( tutti e solo le
+scritture ) e i commit con gli eventi di SQLAlchemy; il sampler ha un seed fisso, cosi' i casi senza write-behind
+valutano gli stessi trial.
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+
+import optuna
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_periods import walk_forward
+from strategies_tester.strategies import OptimizeCrossStrategy
+
+counts = Counter()
+
+
+class SeededTPESampler(optuna.samplers.TPESampler):
+    def __init__(self, seed=0, **kwargs):
+        super().__init__(seed=seed, **kwargs)
+
+
+# stessi parametri campionati in ogni caso: optuna.create_study usa samplers.TPESampler() senza seed
+optuna.samplers.TPESampler = SeededTPESampler
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counts['queries'] += 1
+    if statement.lstrip().split(' ', 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+        counts['writes'] += 1
+
+
+@event.listens_for(Engine, 'commit')
+def _count_commit(conn):
+    counts['commits'] += 1
+
+
+def optimizer(df, periods: list, storage: str, study_name: str, **kwargs) -> OptimizeCrossStrategy:
+    opt = OptimizeCrossStrategy(study_name, 'bitmex', 'XBTUSD', '1h', [], analyzer='sqn', perc_size=10,
+                                start_cash=10000, optuna_storage=storage, engine='numpy', **kwargs)
+    opt.time_periods = periods
+    opt.data = [df.loc[start:end] for start, end in periods]
+    return opt
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bars', type=int, default=8000)
+    parser.add_argument('--periods', type=int, default=4)
+    parser.add_argument('--trials', type=int, default=60)
+    parser.add_argument('--batch-size', type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    df = synthetic_ohlcv(args.bars, freq='1h')
+    periods = walk_forward(df, args.periods)
+
+    cases = [
+        ('study.optimize', 'unbuffered', {'buffered_writes': False}, {}),
+        ('study.optimize', 'buffered', {}, {}),
+        ('study.optimize median', 'unbuffered', {'buffered_writes': False, 'pruner': 'median'}, {}),
+        ('study.optimize median', 'buffered', {'pruner': 'median'}, {}),
+        (f'batch_size={args.batch_size}', 'unbuffered', {'buffered_writes': False}, {'batch_size': args.batch_size}),
+        (f'batch_size={args.batch_size}', 'buffered', {}, {'batch_size': args.batch_size}),
+        (f'batch_size={args.batch_size}', 'write-behind', {'write_behind': True}, {'batch_size': args.batch_size}),
+    ]
+    print(f"{args.trials} trials, {args.periods} periods of {args.bars // args.periods} bars, sqlite")
+    print(f"{'mode':<22} {'writes':<13} {'queries/trial':>13} {'writes/trial':>13} {'commits/trial':>14} "
+          f"{'time':>7}  best")
+    with tempfile.TemporaryDirectory() as data_dir:
+        storage = f"sqlite:///{os.path.join(data_dir, 'optuna.db')}"
+        for i, (mode, writes, kwargs, run_kwargs) in enumerate(cases):
+            opt = optimizer(df, periods, storage, f'study-{i}', **kwargs)
+            counts.clear()
+            t = time.perf_counter()
+            opt.run(max_evals=args.trials, n_jobs=1, **run_kwargs)
+            elapsed = time.perf_counter() - t
+            study = optuna.load_study(study_name=f'study-{i}', storage=storage)
+            n = len(study.trials)
+            print(f"{mode:<22} {writes:<13} {counts['queries'] / n:13.1f} {counts['writes'] / n:13.1f} "
+                  f"{counts['commits'] / n:14.1f} {elapsed:6.2f}s  {study.best_value:.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Client finti di Bitmex e Binance per provare DataFetcher offline.
+Espongono solo i metodi usati da DataFetcher, generano candele deterministiche, simulano la latenza di rete e
+rispondono 'too many requests' se interrogati piu' velocemente del rate limit configurato.
+"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from binance.exceptions import BinanceAPIException
+from bravado.exception import HTTPTooManyRequests
+
+BIN_FREQ = {
+    '1m': '1min',
+    '5m': '5min',
+    '1h': '1h',
+    '1d': '1D',
+}
+
+
+class _FakeResponse(object):
+    status_code = 429
+    text = 'too many requests'
+
+    def json(self):
+        return {'code': -1003, 'msg': self.text}
+
+
+class FakeExchange(object):
+    """storico di `n_bars` candele per bin a partire da `start`, servito con latenza e rate limit server-side"""
+
+    def __init__(self, start='2019-01-01', n_bars=100000, latency=0.0, max_rate=None):
+        self.start = pd.Timestamp(start, tz='UTC')
+        self.n_bars = n_bars
+        self.latency = latency
+        self.max_rate = max_rate
+        self.requests = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+        self._history = {}
+
+    def history(self, bin_size: str):
+        if bin_size not in self._history:
+            index = pd.date_range(self.start, periods=self.n_bars, freq=BIN_FREQ[bin_size], tz='UTC')
+            rng = np.random.default_rng(len(bin_size))
+            close = 10000 + np.cumsum(rng.normal(0, 5, self.n_bars))
+            open_ = np.r_[close[0], close[:-1]]
+            self._history[bin_size] = (
+                index,
+                index.to_pydatetime(),
+                open_,
+                np.maximum(open_, close) + 1,
+                np.minimum(open_, close) - 1,
+                close,
+                rng.random(self.n_bars) * 100 + 1,
+            )
+        return self._history[bin_size]
+
+    def _request(self):
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            too_fast = self.max_rate and now - self._last_request < 1.0 / self.max_rate
+            self._last_request = now
+            if too_fast:
+                self.rejected += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return not too_fast
+
+
+class _Result(object):
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value, None
+
+
+class _FakeTrade(object):
+    def __init__(self, exchange: FakeExchange):
+        self.exchange = exchange
+
+    def Trade_getBucketed(self, symbol, binSize, count=100, reverse=False, startTime=None, endTime=None,
+                          partial=False):
+        if not self.exchange._request():
+            raise HTTPTooManyRequests(_FakeResponse())
+        index, datetimes, open_, high, low, close, volume = self.exchange.history(binSize)
+        if reverse:
+            rows = range(len(index) - count, len(index))[::-1]
+        else:
+            start = 0 if startTime is None else index.searchsorted(pd.Timestamp(startTime))
+            end = len(index) if endTime is None else index.searchsorted(pd.Timestamp(endTime), side='right')
+            rows = range(start, min(start + count, end))
+        return _Result([{
+            'timestamp': datetimes[i],
+            'symbol': symbol,
+            'open': open_[i],
+            'high': high[i],
+            'low': low[i],
+            'close': close[i],
+            'trades': 10,
+            'volume': volume[i],
+            'vwap': close[i],
+        } for i in rows])
+
+
+class FakeBitmex(FakeExchange):
+    """sostituto di `bitmex.bitmex()`: client.Trade.Trade_getBucketed(...).result()"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.Trade = _FakeTrade(self)
+
+
+class FakeBinance(FakeExchange):
+    """sostituto di `binance.client.Client`"""
+    KLINES_LIMIT = 1000
+
+    def get_klines(self, symbol, interval, startTime=None, endTime=None, limit=500):
+        if not self._request():
+            raise BinanceAPIException(_FakeResponse())
+        index, _, open_, high, low, close, volume = self.history(interval)
+        ms = index.asi8 // 10 ** 6
+        start = 0 if startTime is None else int(np.searchsorted(ms, startTime, side='left'))
+        end = len(ms) if endTime is None else int(np.searchsorted(ms, endTime, side='right'))
+        if startTime is None:
+            start = max(0, end - limit)
+        end = min(end, start + min(limit, self.KLINES_LIMIT))
+        step = int(ms[1] - ms[0]) if len(ms) > 1 else 60000
+        # stesso formato dell'api: prezzi come stringhe
+        return [[int(ms[i]), f'{open_[i]:.8f}', f'{high[i]:.8f}', f'{low[i]:.8f}', f'{close[i]:.8f}',
+                 f'{volume[i]:.8f}', int(ms[i]) + step - 1, '0.0', 10, '0.0', '0.0', '0']
+                for i in range(start, end)]
+
+    def get_historical_klines(self, symbol, interval, start_str, end_str=None, limit=500):
+        start = int(pd.Timestamp(start_str, tz='UTC').value // 10 ** 6)
+        end = None if end_str is None else int(pd.Timestamp(end_str, tz='UTC').value // 10 ** 6)
+        klines = []
+        while True:
+            batch = self.get_klines(symbol=symbol, interval=interval, startTime=start, endTime=end, limit=limit)
+            klines.extend(batch)
+            if len(batch) < limit:
+                return klines
+            start = batch[-1][0] + 1
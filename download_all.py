@@ -8,20 +8,17 @@ logger = logging.getLogger(__name__)
 
 dfetch = DataFetcher()
 
-logger.info("downloading binance BTCUSDT 1h")
-dfetch.download_data(exchange='binance', symbol='BTCUSDT', bin_size='1h')
-
-logger.info("downloading binance BTCUSDT 1d")
-dfetch.download_data(exchange='binance', symbol='BTCUSDT', bin_size='1d')
-
-logger.info("downloading bitmex XBTUSD 1d")
-dfetch.download_data(exchange='bitmex', symbol='XBTUSD', bin_size='1d')
-
-logger.info("downloading bitmex XBTUSD 1h")
-dfetch.download_data(exchange='bitmex', symbol='XBTUSD', bin_size='1h')
-
-logger.info("downloading bitmex XBTUSD 5m")
-dfetch.download_data(exchange='bitmex', symbol='XBTUSD', bin_size='5m')
-
-logger.info("downloading bitmex XBTUSD 1m")
-dfetch.download_data(exchange='bitmex', symbol='XBTUSD', bin_size='1m')
+specs = [
+    ('binance', 'BTCUSDT', '1h'),
+    ('binance', 'BTCUSDT', '1d'),
+    ('bitmex', 'XBTUSD', '1d'),
+    ('bitmex', 'XBTUSD', '1h'),
+    ('bitmex', 'XBTUSD', '5m'),
+    ('bitmex', 'XBTUSD', '1m'),
+]
+
+logger.info(f"downloading {', '.join(' '.join(spec) for spec in specs)}")
+results = dfetch.download_many(specs)
+
+for (exchange, symbol, bin_size), n_bars in results.items():
+    logger.info(f"{exchange} {symbol} {bin_size}: {n_bars} new candles")
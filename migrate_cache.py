@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+import argparse
+import logging
+
+from strategies_tester.cache import cache_backends, migrate_csv_cache
+
+logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO, datefmt='%d/%m/%Y %H:%M:%S')
+
+parser = argparse.ArgumentParser(description='Convert csv data cache to a columnar backend')
+parser.add_argument('--data-dir', dest='data_dir', default='data')
+parser.add_argument('--backend', dest='backend', choices=cache_backends.keys(), default='partitioned')
+parser.add_argument('--remove-csv', dest='remove_csv', action='store_true', help='delete csv files after conversion')
+
+args = parser.parse_args()
+
+migrated = migrate_csv_cache(
+    data_dir=args.data_dir,
+    backend=cache_backends[args.backend](args.data_dir),
+    remove_csv=args.remove_csv
+)
+
+print(f"migrated: {migrated}")
@@ -9,11 +9,15 @@ from __future__ import (
 import argparse
 import logging
 import os
+import sys
 from datetime import datetime
 
 from dotenv import load_dotenv, find_dotenv
 
 from strategies_tester.datafetcher import DataFetcher
+from strategies_tester.distributed import OptimizeCoordinator, OptimizeWorker
+from strategies_tester.fastbacktest import FastBacktester
+from strategies_tester.indicator_cache import IndicatorCache
 from strategies_tester.strategies import *
 
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO, datefmt='%d/%m/%Y %H:%M:%S')
@@ -24,8 +28,10 @@ optuna_storage = os.getenv("OPTUNA_STORAGE", "sqlite:///data/optuna.db")
 
 parser = argparse.ArgumentParser(description='Optimize strategy with optuna')
 
-parser.add_argument('--strategy', dest='strategy_name', help='strategy to optimize', choices=strategy_optimizers.keys(),
-                    required=True)
+parser.add_argument('command', nargs='?', default='run', choices=['run', 'worker', 'coordinator'],
+                    help='run: optimize in this process, coordinator: create the study and follow the workers, '
+                         'worker: evaluate trials of a study created by a coordinator ( any host, same storage )')
+parser.add_argument('--strategy', dest='strategy_name', help='strategy to optimize', choices=strategy_optimizers.keys())
 parser.add_argument('--analyzer', dest='analyzer', help='analyzer used in optimization', default='sharpe_ratio',
                     choices=['sharpe_ratio', 'sqn', 'vwr', 'pnl', 'winrate'])
 parser.add_argument('--start-cash', dest='start_cash', type=int, default=1000)
@@ -41,11 +47,65 @@ parser.add_argument('--date-start', dest='date_start', type=lambda s: datetime.s
                     default='2017-01-01')
 parser.add_argument('--date-end', dest='date_end', type=lambda s: datetime.strptime(f'{s} +0000', '%Y-%m-%d %z'),
                     default='2019-01-01')
+parser.add_argument('--engine', dest='engine', help='backtest engine used for the trials ( numpy: fast pre-screen )',
+                    default='backtrader', choices=['backtrader', 'numpy'])
+parser.add_argument('--batch-size', dest='batch_size', type=int, default=None,
+                    help='trials sampled and evaluated together ( optuna ask/tell + backtest_many ), '
+                         'indicators are shared between the trials of a batch only with --engine numpy')
+parser.add_argument('--processes', dest='processes', type=int, default=None,
+                    help='worker processes running the backtests ( one coordinator writes to the storage, sqlite too )')
+parser.add_argument('--user-attrs', dest='user_attrs', nargs='*', default=None,
+                    choices=['pnl', 'sqn', 'vwr', 'sharpe_ratio', 'winrate'],
+                    help='metrics saved in every trial ( default all, --user-attrs alone: only the objective is computed )')
+parser.add_argument('--indicator-cache', dest='indicator_cache', default=None,
+                    help='numpy engine only: directory where the indicators are persisted ( e.g. data/indicators, '
+                         'worker: used when the study runs with the numpy engine )')
+parser.add_argument('--pruner', dest='pruner', default='none', choices=['none', 'median', 'hyperband'],
+                    help='optuna pruner, with --checkpoint-bars it can stop a trial inside a period')
+parser.add_argument('--checkpoint-bars', dest='checkpoint_bars', type=int, default=None,
+                    help='backtrader engine: report the running pnl to the pruner every N bars')
+parser.add_argument('--walk-forward', dest='walk_forward', type=int, default=1,
+                    help='split the date range in N consecutive periods, every trial is evaluated on all of them')
+parser.add_argument('--shared-warmup', dest='shared_warmup', action='store_true',
+                    help='numpy engine: compute the indicators once over all the periods and slice them per period')
+parser.add_argument('--period-workers', dest='period_workers', type=int, default=None,
+                    help='evaluate the periods of a trial in parallel with N processes')
+parser.add_argument('--unbuffered-writes', dest='buffered_writes', action='store_false',
+                    help='write every user attribute and intermediate value of a trial in its own transaction')
+parser.add_argument('--write-behind', dest='write_behind', action='store_true',
+                    help='with --batch-size or --processes: queue finished trials and write them together ( sqlite )')
+parser.add_argument('--study', dest='study', default=None, help='worker: name of the study printed by the coordinator')
+parser.add_argument('--heartbeat', dest='heartbeat', type=float, default=10.0,
+                    help='worker: seconds between heartbeats of the running trial')
+parser.add_argument('--update-data', dest='update_data', action='store_true',
+                    help='worker: download new candles before starting ( default: local cache only )')
+parser.add_argument('--stale-after', dest='stale_after', type=float, default=60.0,
+                    help='coordinator: seconds without heartbeat after which a running trial is reclaimed')
+parser.add_argument('--interval', dest='interval', type=float, default=10.0,
+                    help='coordinator: seconds between status reports')
 
 args = parser.parse_args()
 
+if args.indicator_cache:
+    # il worker prende l'engine dalla configurazione dello studio
+    if args.command != 'worker' and args.engine != 'numpy':
+        parser.error('--indicator-cache is used only with --engine numpy')
+    FastBacktester.indicator_cache = IndicatorCache(data_dir=args.indicator_cache)
+
+if args.command == 'worker':
+    if not args.study:
+        parser.error('worker: --study is required')
+    OptimizeWorker(optuna_storage, args.study, heartbeat_interval=args.heartbeat, update_data=args.update_data).run()
+    sys.exit(0)
+
+if not args.strategy_name:
+    parser.error(f'{args.command}: --strategy is required')
+
+# --walk-forward N: N periodi consecutivi della stessa durata
+period_length = (args.date_end - args.date_start) / args.walk_forward
 time_periods = [
-    (args.date_start, args.date_end),
+    (args.date_start + period_length * i, args.date_start + period_length * (i + 1))
+    for i in range(args.walk_forward)
 ]
 analyzer = args.analyzer
 tf = args.tf
@@ -59,6 +119,32 @@ strategy_name = args.strategy_name
 StrategyOptimizeClass = strategy_optimizers[strategy_name]
 
 study_name = f"{strategy_name}-{symbol}-{analyzer}-{tf}-{args.date_start.strftime('%Y-%m-%d')}-{args.date_end.strftime('%Y-%m-%d')}"
+if args.walk_forward > 1:
+    study_name += f"-wf{args.walk_forward}"
+
+if args.command == 'coordinator':
+    coordinator = OptimizeCoordinator(optuna_storage, study_name, stale_after=args.stale_after, interval=args.interval)
+    # i worker ricostruiscono l'ottimizzatore da questa configurazione, salvata nello studio
+    coordinator.create({
+        'strategy': strategy_name,
+        'exchange': exchange,
+        'symbol': symbol,
+        'bin_size': tf,
+        'analyzer': analyzer,
+        'perc_size': perc_size,
+        'commission': commission,
+        'start_cash': start_cash,
+        'engine': args.engine,
+        'user_attrs': args.user_attrs,
+        'pruner': args.pruner,
+        'checkpoint_bars': args.checkpoint_bars,
+        'shared_warmup': args.shared_warmup,
+        'time_periods': [(start.isoformat(), end.isoformat()) for start, end in time_periods],
+        'max_evals': max_evals,
+    })
+    print(f"start the workers with: optimize.py worker --study {study_name}")
+    print(f"best result: {coordinator.run()}")
+    sys.exit(0)
 
 opt = StrategyOptimizeClass(
     study_name=study_name,
@@ -70,10 +156,20 @@ opt = StrategyOptimizeClass(
     commission=commission,
     start_cash=start_cash,
     optuna_storage=optuna_storage,
-    time_periods=time_periods
+    time_periods=time_periods,
+    engine=args.engine,
+    user_attrs=args.user_attrs,
+    pruner=args.pruner,
+    checkpoint_bars=args.checkpoint_bars,
+    shared_warmup=args.shared_warmup,
+    period_workers=args.period_workers,
+    buffered_writes=args.buffered_writes,
+    write_behind=args.write_behind,
+    # i worker ricevono i dati come MappedOHLCV: solo il percorso, le pagine sono condivise
+    use_mmap=args.processes is not None
 )
 
-best = opt.run(max_evals=max_evals)
+best = opt.run(max_evals=max_evals, batch_size=args.batch_size, processes=args.processes)
 
 print(f"best result: {best}")
 
@@ -0,0 +1,453 @@
+"""Backend di persistenza per la cache OHLCV di DataFetcher"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['CacheBackend', 'CSVCache', 'NpyCache', 'PartitionedNpyCache', 'cache_backends', 'merge_ohlcv',
+           'migrate_csv_cache']
+
+
+class CacheBackend(object):
+    """
+    Interfaccia comune dei backend di cache.
+    Un dataset e' identificato da un nome ( es. 'bitmex_XBTUSD_1m' ) ed e' un DataFrame indicizzato per timestamp UTC.
+    """
+    TIMESTAMP_COLUMN = 'timestamp'
+    OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, data_dir: str = 'data'):
+        self.data_dir = data_dir
+        self.logger = logging.getLogger(__name__)
+
+    def path(self, name: str) -> str:
+        raise NotImplementedError()
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def load(self, name: str, date_from=None, date_to=None) -> pd.DataFrame:
+        """righe tra `date_from` e `date_to` inclusi ( UTC se senza timezone ), anche se il file non e' ordinato"""
+        df = self._load(name)
+        if date_from is not None or date_to is not None:
+            df = df[_in_range(df.index, date_from, date_to)]
+        return df
+
+    def _load(self, name: str) -> pd.DataFrame:
+        raise NotImplementedError()
+
+    def save(self, name: str, df: pd.DataFrame):
+        raise NotImplementedError()
+
+    def append(self, name: str, df: pd.DataFrame):
+        """aggiunge nuove candele al dataset; in caso di timestamp duplicati vince la candela piu' recente"""
+        if len(df) == 0:
+            return
+        if self.exists(name):
+            df = merge_ohlcv(self._load(name), df)
+        self.save(name, df)
+
+    def replace(self, name: str, df: pd.DataFrame, date_from=None, date_to=None):
+        """
+        sostituisce con `df` le righe del dataset tra `date_from` e `date_to` ( inclusi, None: dall'inizio / fino
+        alla fine ), es. un intervallo letto e riparato; le righe fuori dall'intervallo restano
+        """
+        if self.exists(name) and (date_from is not None or date_to is not None):
+            old = self._load(name)
+            df = merge_ohlcv(old[~_in_range(old.index, date_from, date_to)], df)
+        self.save(name, df)
+
+    def timestamps(self, name: str) -> np.ndarray:
+        """solo i timestamp ( int64 ns UTC ) del dataset"""
+        return NpyCache._timestamps(self._load(name).index)
+
+    def rows(self, name: str, date_to=None) -> int:
+        """numero di righe salvate fino a `date_to` incluso"""
+        timestamps = self.timestamps(name)
+        if date_to is None:
+            return len(timestamps)
+        return int(np.searchsorted(timestamps, _to_timestamp(date_to).value, side='right'))
+
+    def bounds(self, name: str) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """primo e ultimo timestamp salvati, None se il dataset e' vuoto o non esiste"""
+        if not self.exists(name):
+            return None
+        df = self._load(name)
+        if len(df) == 0:
+            return None
+        return df.index[0], df.index[-1]
+
+    def version(self, name: str) -> Optional[tuple]:
+        """identifica il contenuto su disco del dataset ( inode, mtime, size ): cambia ad ogni scrittura"""
+        try:
+            stat = os.stat(self._version_path(name))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _version_path(self, name: str) -> str:
+        # csv e npyd vengono sostituiti per rename ad ogni salvataggio
+        return self.path(name)
+
+    def disk_size(self, name: str) -> int:
+        path = self.path(name)
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        return os.path.getsize(path)
+
+    def _makedirs(self):
+        if not os.path.exists(self.data_dir):
+            os.makedirs(self.data_dir)
+
+
+class CSVCache(CacheBackend):
+    """formato storico: un unico csv riscritto per intero ad ogni salvataggio"""
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.data_dir, f'{name}.csv')
+
+    def _load(self, name: str) -> pd.DataFrame:
+        df = pd.read_csv(self.path(name)).dropna()
+        df[self.TIMESTAMP_COLUMN] = pd.to_datetime(df[self.TIMESTAMP_COLUMN], utc=True)
+        df.set_index(self.TIMESTAMP_COLUMN, inplace=True)
+        return df
+
+    def save(self, name: str, df: pd.DataFrame):
+        self._makedirs()
+        fd, tmpfn = tempfile.mkstemp(dir=self.data_dir)
+        with os.fdopen(fd, 'w') as f:
+            df.to_csv(f)
+        shutil.move(tmpfn, self.path(name))
+
+
+class NpyCache(CacheBackend):
+    """
+    Formato colonnare: una directory per dataset con un file .npy per colonna.
+    Il timestamp e' salvato come int64 ( ns UTC ), le colonne OHLCV come float64; np.load non fa parsing.
+    """
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.data_dir, f'{name}.npyd')
+
+    def exists(self, name: str) -> bool:
+        self._recover(self.path(name))
+        return super().exists(name)
+
+    def _load(self, name: str) -> pd.DataFrame:
+        self._recover(self.path(name))
+        return self._read_columns(self.path(name))
+
+    def save(self, name: str, df: pd.DataFrame):
+        self._makedirs()
+        self._write_columns(self.path(name), df)
+
+    def _read_columns(self, path: str, date_from: int = None, date_to: int = None) -> pd.DataFrame:
+        return self._frame(*self._read_arrays(path, date_from, date_to))
+
+    def _read_arrays(self, path: str, date_from: int = None, date_to: int = None) -> Tuple[np.ndarray, dict]:
+        columns = {}
+        for filename in sorted(os.listdir(path)):
+            column, ext = os.path.splitext(filename)
+            if ext == '.npy':
+                columns[column] = np.load(os.path.join(path, filename), allow_pickle=False)
+        timestamps = columns.pop(self.TIMESTAMP_COLUMN)
+        if date_from is not None or date_to is not None:
+            start = 0 if date_from is None else np.searchsorted(timestamps, date_from, side='left')
+            end = len(timestamps) if date_to is None else np.searchsorted(timestamps, date_to, side='right')
+            timestamps = timestamps[start:end]
+            columns = {k: v[start:end] for k, v in columns.items()}
+        return timestamps, columns
+
+    def _frame(self, timestamps: np.ndarray, columns: dict) -> pd.DataFrame:
+        index = pd.DatetimeIndex(timestamps, tz='UTC', name=self.TIMESTAMP_COLUMN)
+        order = [c for c in self.OHLCV_COLUMNS if c in columns] + [c for c in columns if c not in self.OHLCV_COLUMNS]
+        return pd.DataFrame(columns, index=index, columns=order)
+
+    def _write_columns(self, path: str, df: pd.DataFrame):
+        tmpdir = tempfile.mkdtemp(dir=os.path.dirname(path))
+        try:
+            self._save_arrays(tmpdir, df)
+            self._replace_dir(tmpdir, path)
+        finally:
+            if os.path.exists(tmpdir):
+                shutil.rmtree(tmpdir)
+
+    def _save_arrays(self, path: str, df: pd.DataFrame):
+        np.save(os.path.join(path, f'{self.TIMESTAMP_COLUMN}.npy'), self._timestamps(df.index))
+        for column in df.columns:
+            np.save(os.path.join(path, f'{column}.npy'), self._column_values(df[column]), allow_pickle=False)
+
+    def _replace_dir(self, src: str, path: str):
+        """
+        rename di `src` su `path`: una directory non vuota non si sostituisce atomicamente, quindi la vecchia viene
+        spostata in `{path}.old` e cancellata solo dopo il rename ( rimessa al suo posto se fallisce ). Dopo un crash
+        a meta' la ripristina `_recover`
+        """
+        self._recover(path)
+        old = f'{path}.old'
+        if os.path.exists(path):
+            os.rename(path, old)
+        try:
+            os.rename(src, path)
+        except Exception:
+            if os.path.exists(old):
+                os.rename(old, path)
+            raise
+        if os.path.exists(old):
+            shutil.rmtree(old)
+
+    @staticmethod
+    def _recover(path: str):
+        old = f'{path}.old'
+        if not os.path.exists(old):
+            return
+        if os.path.exists(path):
+            # crash dopo il rename: `path` e' gia' la versione nuova
+            shutil.rmtree(old)
+        else:
+            os.rename(old, path)
+
+    @staticmethod
+    def _timestamps(index: pd.Index) -> np.ndarray:
+        index = pd.DatetimeIndex(index)
+        if index.tz is None:
+            index = index.tz_localize('UTC')
+        return index.tz_convert('UTC').asi8
+
+    def _column_values(self, column: pd.Series) -> np.ndarray:
+        if column.name in self.OHLCV_COLUMNS or np.issubdtype(column.dtype, np.number):
+            return column.to_numpy(dtype=np.float64)
+        # le kline di binance arrivano come stringhe numeriche
+        numeric = pd.to_numeric(column, errors='coerce')
+        if numeric.notna().sum() == column.notna().sum():
+            return numeric.to_numpy(dtype=np.float64)
+        # colonne testuali ( es. symbol ): array unicode a larghezza fissa, niente pickle
+        return column.astype(str).to_numpy(dtype=str)
+
+
+class PartitionedNpyCache(NpyCache):
+    """
+    Dataset suddiviso in partizioni mensili in formato NpyCache ( `{name}.parts/YYYY-MM.xxxxxx/` ).
+    `index.json` contiene per ogni mese la directory, primo/ultimo timestamp ( ns ) e numero di righe della partizione:
+    una lettura per intervallo di date apre solo le partizioni che lo intersecano e un append riscrive solo le partizioni
+    toccate dalle nuove candele. Una partizione riscritta va sempre in una directory nuova: il rename atomico
+    dell'indice e' il commit, le directory non piu' indicizzate vengono cancellate dopo ( o alla scrittura successiva,
+    dopo un crash ).
+    """
+    INDEX_FILENAME = 'index.json'
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.data_dir, f'{name}.parts')
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(self.path(name))
+
+    def disk_size(self, name: str) -> int:
+        size = 0
+        for root, _, files in os.walk(self.path(name)):
+            size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        return size
+
+    def _version_path(self, name: str) -> str:
+        # le partizioni non cambiano mai in place, l'indice viene sempre riscritto per ultimo
+        return os.path.join(self.path(name), self.INDEX_FILENAME)
+
+    def partitions(self, name: str) -> dict:
+        index_path = os.path.join(self.path(name), self.INDEX_FILENAME)
+        if not os.path.exists(index_path):
+            return {}
+        with open(index_path) as fd:
+            return json.load(fd)['partitions']
+
+    def partition_path(self, name: str, key: str, part: dict) -> str:
+        # gli indici scritti prima delle directory versionate usano il mese come nome
+        return os.path.join(self.path(name), part.get('dir', key))
+
+    def load(self, name: str, date_from=None, date_to=None) -> pd.DataFrame:
+        ts_from = None if date_from is None else _to_timestamp(date_from).value
+        ts_to = None if date_to is None else _to_timestamp(date_to).value
+        chunks = []
+        for key, part in sorted(self.partitions(name).items()):
+            if ts_from is not None and part['end'] < ts_from:
+                continue
+            if ts_to is not None and part['start'] > ts_to:
+                continue
+            chunks.append(self._read_arrays(self.partition_path(name, key, part), ts_from, ts_to))
+        if not chunks:
+            return pd.DataFrame()
+        timestamps = np.concatenate([c[0] for c in chunks])
+        # solo le colonne presenti in tutte le partizioni lette
+        keys = [k for k in chunks[-1][1].keys() if all(k in c[1] for c in chunks)]
+        columns = {k: np.concatenate([c[1][k] for c in chunks]) for k in keys}
+        return self._frame(timestamps, columns)
+
+    def _load(self, name: str) -> pd.DataFrame:
+        return self.load(name)
+
+    def timestamps(self, name: str) -> np.ndarray:
+        chunks = [
+            np.load(os.path.join(self.partition_path(name, key, part), f'{self.TIMESTAMP_COLUMN}.npy'),
+                    allow_pickle=False)
+            for key, part in sorted(self.partitions(name).items())
+        ]
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def rows(self, name: str, date_to=None) -> int:
+        # dall'indice: si legge al piu' la colonna timestamp della partizione che contiene `date_to`
+        ts_to = None if date_to is None else _to_timestamp(date_to).value
+        rows = 0
+        for key, part in self.partitions(name).items():
+            if ts_to is None or part['end'] <= ts_to:
+                rows += part['rows']
+            elif part['start'] <= ts_to:
+                timestamps = np.load(os.path.join(self.partition_path(name, key, part), f'{self.TIMESTAMP_COLUMN}.npy'),
+                                     mmap_mode='r')
+                rows += int(np.searchsorted(timestamps, ts_to, side='right'))
+        return rows
+
+    def save(self, name: str, df: pd.DataFrame):
+        """sostituisce l'intero dataset: le partizioni vecchie restano valide fino alla scrittura del nuovo indice"""
+        os.makedirs(self.path(name), exist_ok=True)
+        self._write_partitions(name, {}, self._months(merge_ohlcv(df.iloc[:0], df)))
+
+    def append(self, name: str, df: pd.DataFrame):
+        if len(df) == 0:
+            return
+        os.makedirs(self.path(name), exist_ok=True)
+        partitions = self.partitions(name)
+        months = self._months(merge_ohlcv(df.iloc[:0], df))
+        for key, new_rows in months.items():
+            if key in partitions:
+                months[key] = merge_ohlcv(self._read_columns(self.partition_path(name, key, partitions[key])), new_rows)
+        self._write_partitions(name, partitions, months)
+
+    def replace(self, name: str, df: pd.DataFrame, date_from=None, date_to=None):
+        """come CacheBackend.replace, ma riscrive solo le partizioni il cui contenuto cambia"""
+        if not self.exists(name):
+            self.save(name, df)
+            return
+        ts_from = None if date_from is None else _to_timestamp(date_from).value
+        ts_to = None if date_to is None else _to_timestamp(date_to).value
+        partitions = self.partitions(name)
+        months = self._months(merge_ohlcv(df.iloc[:0], df))
+        changed, removed = {}, []
+        for key, part in sorted(partitions.items()):
+            if (ts_from is not None and part['end'] < ts_from) or (ts_to is not None and part['start'] > ts_to):
+                continue
+            old = self._read_columns(self.partition_path(name, key, part))
+            rows = old[~_in_range(old.index, date_from, date_to)]
+            if key in months:
+                rows = merge_ohlcv(rows, months.pop(key))
+            if len(rows) == 0:
+                removed.append(key)
+            elif not rows.equals(old):
+                changed[key] = rows
+        # mesi senza partizione ( non dovrebbero esserci: `df` viene dallo stesso intervallo )
+        changed.update(months)
+        if changed or removed:
+            self._write_partitions(name, {k: v for k, v in partitions.items() if k not in removed}, changed)
+
+    @staticmethod
+    def _months(df: pd.DataFrame) -> dict:
+        return {
+            f'{month // 100:04d}-{month % 100:02d}': rows
+            for month, rows in df.groupby(np.asarray(df.index.year * 100 + df.index.month), sort=True)
+        }
+
+    def _write_partitions(self, name: str, partitions: dict, months: dict):
+        """scrive i mesi `months` in directory nuove e poi l'indice: `partitions` sono le partizioni che restano"""
+        path = self.path(name)
+        partitions = dict(partitions)
+        for key, rows in months.items():
+            part_path = tempfile.mkdtemp(prefix=f'{key}.', dir=path)
+            self._save_arrays(part_path, rows)
+            partitions[key] = {
+                'dir': os.path.basename(part_path),
+                'start': int(rows.index[0].value),
+                'end': int(rows.index[-1].value),
+                'rows': len(rows),
+            }
+        self._write_index(name, partitions)
+        self._remove_unindexed(name, partitions)
+
+    def _remove_unindexed(self, name: str, partitions: dict):
+        # partizioni sostituite o rimaste da una scrittura interrotta
+        keep = {part.get('dir', key) for key, part in partitions.items()}
+        for entry in os.listdir(self.path(name)):
+            entry_path = os.path.join(self.path(name), entry)
+            if entry not in keep and os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+
+    def bounds(self, name: str) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+        partitions = self.partitions(name)
+        if not partitions:
+            return None
+        keys = sorted(partitions.keys())
+        return (pd.Timestamp(partitions[keys[0]]['start'], tz='UTC'),
+                pd.Timestamp(partitions[keys[-1]]['end'], tz='UTC'))
+
+    def _write_index(self, name: str, partitions: dict):
+        # l'indice e' l'ultima cosa scritta: rename atomico
+        fd, tmpfn = tempfile.mkstemp(dir=self.path(name))
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'partitions': partitions}, f, sort_keys=True)
+        os.replace(tmpfn, os.path.join(self.path(name), self.INDEX_FILENAME))
+
+
+def _to_timestamp(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        return ts.tz_localize('UTC')
+    return ts.tz_convert('UTC')
+
+
+def _in_range(index: pd.DatetimeIndex, date_from=None, date_to=None) -> np.ndarray:
+    mask = np.ones(len(index), dtype=bool)
+    if date_from is not None:
+        mask &= index >= _to_timestamp(date_from)
+    if date_to is not None:
+        mask &= index <= _to_timestamp(date_to)
+    return mask
+
+
+def merge_ohlcv(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """unisce due blocchi di candele: ordinati per timestamp, sui duplicati vince `new`"""
+    df = pd.concat([old, new], sort=False) if len(old) > 0 else new
+    df = df[~df.index.duplicated(keep='last')]
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    return df
+
+
+cache_backends = {
+    'csv': CSVCache,
+    'npy': NpyCache,
+    'partitioned': PartitionedNpyCache,
+}
+
+
+def migrate_csv_cache(data_dir: str = 'data', backend: CacheBackend = None, remove_csv: bool = False) -> list:
+    """converte tutti i csv presenti in `data_dir` nel formato del backend indicato ( default PartitionedNpyCache )"""
+    logger = logging.getLogger(__name__)
+    csv_cache = CSVCache(data_dir)
+    backend = backend or PartitionedNpyCache(data_dir)
+    migrated = []
+    for filename in sorted(os.listdir(data_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext != '.csv':
+            continue
+        logger.info(f"migrating {filename}")
+        backend.save(name, csv_cache.load(name))
+        if remove_csv:
+            os.remove(csv_cache.path(name))
+        migrated.append(name)
+    return migrated
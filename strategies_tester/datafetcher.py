@@ -4,29 +4,132 @@ __copyright__ = "Copyright 2020, Liquidator"
 import logging
 import math
 import os
-import tempfile
 import threading
-import time
 import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import timedelta, datetime
-from typing import Tuple
+from typing import Tuple, Iterable, Dict, List
 
+import numpy as np
 import pandas as pd
 from binance.client import Client as BinanceClient
+from binance.exceptions import BinanceAPIException
 from bitmex import bitmex
 from bravado.exception import HTTPTooManyRequests
 from tqdm.auto import tqdm
 
+from strategies_tester.cache import CacheBackend, CSVCache, NpyCache, PartitionedNpyCache, _to_timestamp
+from strategies_tester.journal import SyncJournal
+from strategies_tester.mapped import MappedOHLCV
+from strategies_tester.ratelimit import TokenBucket
+from strategies_tester.validation import validate_ohlcv
+
 # suppress bitmex client warnings
 warnings.filterwarnings("ignore")
 
-__all__ = ['DataFetcher']
+__all__ = ['DataFetcher', 'DatasetCache']
+
+
+class DatasetCache(object):
+    """
+    Cache LRU di processo dei dataset letti da un CacheBackend, limitata a `max_bytes`.
+    Ogni entry e' l'intervallo di date effettivamente letto dal disco ( con il pushdown del backend: solo le
+    partizioni che lo intersecano ); una richiesta coperta da un'entry gia' in memoria ritorna una slice, le altre
+    leggono dal disco solo il proprio intervallo. Le entry sono scartate quando cambia la versione su disco
+    ( `CacheBackend.version` ). I DataFrame ritornati condividono i dati con la cache: vanno trattati in sola lettura.
+    """
+
+    def __init__(self, max_bytes: int = 1 << 30):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # ( backend, data_dir, name, inizio, fine ) -> ( versione, DataFrame, byte ); inizio/fine in ns o None
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def load(self, cache: CacheBackend, name: str, date_from=None, date_to=None, prepare=None) -> pd.DataFrame:
+        """
+        `date_from` / `date_to` inclusi ( UTC se senza timezone ). `prepare(df, date_from, date_to)` viene applicato
+        una volta sola all'intervallo appena letto dal disco ( es. validazione )
+        """
+        date_from = None if date_from is None else _to_timestamp(date_from)
+        date_to = None if date_to is None else _to_timestamp(date_to)
+        version = cache.version(name)
+        if version is None:
+            df = cache.load(name, date_from, date_to)
+            return prepare(df, date_from, date_to) if prepare and len(df) else df
+        dataset = (type(cache).__name__, os.path.abspath(cache.data_dir), name)
+        bounds = (None if date_from is None else date_from.value, None if date_to is None else date_to.value)
+        with self._lock:
+            key = self._covering(dataset, version, *bounds)
+            if key is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                df = self._entries[key][1]
+            else:
+                self.misses += 1
+                df = None
+        if df is None:
+            df = cache.load(name, date_from, date_to)
+            if len(df) == 0:
+                return df
+            if prepare:
+                df = prepare(df, date_from, date_to)
+                # prepare puo' riscrivere il dataset ( riparazioni ): la versione da associare e' quella successiva
+                version = cache.version(name)
+            self._put(dataset + bounds, version, df)
+        # sempre un nuovo oggetto: chi lo riceve puo' aggiungere o togliere colonne senza toccare la cache
+        return df.loc[date_from:date_to]
+
+    def _covering(self, dataset: tuple, version, ts_from: int, ts_to: int):
+        """chiave dell'entry aggiornata che contiene tutto l'intervallo richiesto ( la piu' recente )"""
+        for key in reversed(self._entries):
+            if key[:3] == dataset and self._entries[key][0] == version and _covers(key[3], key[4], ts_from, ts_to):
+                return key
+        return None
+
+    def _put(self, key, version, df: pd.DataFrame):
+        size = int(df.memory_usage(index=True).sum())
+        with self._lock:
+            # entry dello stesso dataset ormai inutili: versione vecchia o intervallo contenuto nel nuovo
+            for old_key in [k for k in self._entries if k[:3] == key[:3]]:
+                if self._entries[old_key][0] != version or _covers(key[3], key[4], old_key[3], old_key[4]):
+                    self._size -= self._entries.pop(old_key)[2]
+            if size > self.max_bytes:
+                return
+            while self._entries and self._size + size > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+            self._entries[key] = (version, df, size)
+            self._size += size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self._size}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+def _covers(start: int, end: int, ts_from: int, ts_to: int) -> bool:
+    """l'intervallo [ start, end ] contiene [ ts_from, ts_to ] ( ns, None: illimitato )"""
+    if start is not None and (ts_from is None or ts_from < start):
+        return False
+    if end is not None and (ts_to is None or ts_to > end):
+        return False
+    return True
 
 
 class DataFetcher(object):
     TIMESTAMP_COLUMN = 'timestamp'
     BATCH_SIZE = 750
+    BINANCE_KLINES_LIMIT = 1000
     DATA_DIR = 'data'
+    MMAP_DIR = os.path.join(DATA_DIR, 'mmap')
 
     binsize_str_int = {
         "1m": 1,
@@ -68,206 +171,532 @@ class DataFetcher(object):
         "1d": 60 * 24
     }
 
+    # richieste al secondo e burst per exchange ( bitmex: 60 req/min, binance: 1200 weight/min, klines = 1 )
+    rate_limits = {
+        "bitmex": (1.0, 1),
+        "binance": (10.0, 10),
+    }
+    # un limiter per exchange condiviso da tutte le istanze ( e thread ) del processo
+    _rate_limiters = {}
+    # finestre binance scaricate in parallelo da ogni download ( il limiter resta l'unico vincolo sul rate )
+    binance_workers = 8
+    _rate_limiters_lock = threading.Lock()
+
+    # dataset gia' letti, condivisi da tutte le istanze del processo
+    datasets = DatasetCache()
+    # ultimo ValidationReport di ogni dataset letto dal disco
+    reports = {}
+    # candele consecutive a volume zero oltre le quali la validazione segnala la sequenza
+    ZERO_VOLUME_RUN = 5
+
     _save_lock = None
     _save_thread = None
 
-    _bitmex_sleep_time = 1
-
-    def __init__(self, save_after=25):
+    def __init__(self, save_after=25, cache: CacheBackend = None, bitmex_client=None, binance_client=None):
         self.logger = logging.getLogger(__name__)
         self.save_after = save_after
+        self.cache = cache or PartitionedNpyCache(self.DATA_DIR)
+        # client iniettabili ( es. exchange finti per test e benchmark )
+        self.bitmex_client = bitmex_client
+        self.binance_client = binance_client
         self._save_lock = threading.RLock()
+        self._journals = {}
 
-    def download_data(self, exchange: str, symbol: str, bin_size: str, date_from=None, date_to=None) -> pd.DataFrame:
-        cache_filename = f'{exchange}_{symbol}_{self.avaiable_bin_size[bin_size]}.csv'
-        cache_filepath = os.path.join(self.DATA_DIR, cache_filename)
+    @classmethod
+    def rate_limiter(cls, exchange: str) -> TokenBucket:
+        with cls._rate_limiters_lock:
+            if exchange not in cls._rate_limiters:
+                rate, capacity = cls.rate_limits[exchange]
+                cls._rate_limiters[exchange] = TokenBucket(rate=rate, capacity=capacity)
+            return cls._rate_limiters[exchange]
+
+    def _rate_limited(self, exchange: str, request):
+        """esegue `request()` rispettando il rate limit dell'exchange; se rifiutata per troppe richieste riprova"""
+        limiter = self.rate_limiter(exchange)
+        while True:
+            limiter.acquire()
+            try:
+                result = request()
+            except HTTPTooManyRequests:
+                self.logger.warning(f"{exchange}: HTTPTooManyRequests, backoff {limiter.backoff()}s")
+                continue
+            except BinanceAPIException as e:
+                if e.status_code not in (418, 429):
+                    raise
+                self.logger.warning(f"{exchange}: {e.status_code} too many requests, backoff {limiter.backoff()}s")
+                continue
+            limiter.reset_backoff()
+            return result
 
+    def cache_name(self, exchange: str, symbol: str, bin_size: str) -> str:
+        return f'{exchange}_{symbol}_{self.avaiable_bin_size[bin_size]}'
+
+    def load_cache(self, cache_name: str, date_from=None, date_to=None) -> pd.DataFrame:
         try:
-            if not os.path.exists(cache_filepath):
-                raise Exception(f"{cache_filepath}: file not found")
-            df = pd.read_csv(cache_filepath).dropna()
-            df[self.TIMESTAMP_COLUMN] = pd.to_datetime(df[self.TIMESTAMP_COLUMN], utc=True)
-            df.set_index(self.TIMESTAMP_COLUMN, inplace=True)
+            if not self.cache.exists(cache_name):
+                self._migrate_legacy_cache(cache_name)
+            if not self.cache.exists(cache_name):
+                raise Exception(f"{self.cache.path(cache_name)}: file not found")
+            return self._dataset(cache_name, date_from=date_from, date_to=date_to)
         except Exception as e:
             self.logger.error(e)
-            df = pd.DataFrame()
+            return pd.DataFrame()
+
+    def _dataset(self, cache_name: str, date_from=None, date_to=None) -> pd.DataFrame:
+        return self.datasets.load(self.cache, cache_name, date_from=date_from, date_to=date_to,
+                                  prepare=lambda df, start, end: self.validate(df, cache_name, start, end))
+
+    def validate(self, df: pd.DataFrame, cache_name: str, date_from=None, date_to=None) -> pd.DataFrame:
+        """
+        controlla un dataset appena letto ( vedi `validate_ohlcv` ): duplicati, ordine e candele non valide vengono
+        corretti anche nella cache su disco, buchi e sequenze a volume zero solo segnalati in `reports[cache_name]`.
+        `date_from` / `date_to`: l'intervallo letto, il solo riscritto dalla riparazione ( `CacheBackend.replace` )
+        """
+        bin_minutes = self.real_bin_size.get(cache_name.rsplit('_', 1)[-1])
+        df, report = validate_ohlcv(df, bin_minutes=bin_minutes, zero_volume_run=self.ZERO_VOLUME_RUN)
+        self.reports[cache_name] = report
+        if report.repaired:
+            self.logger.warning(f"{cache_name}: repaired, {report.summary()}")
+            with self._save_lock:
+                self.cache.replace(cache_name, df, date_from, date_to)
+        elif not report.ok:
+            self.logger.info(f"{cache_name}: {report.summary()}")
+        return df
+
+    def _migrate_legacy_cache(self, cache_name: str):
+        # conversione one-shot delle vecchie cache ( csv o npy non partizionato ) nel backend configurato
+        for legacy_cls in (NpyCache, CSVCache):
+            legacy = legacy_cls(self.cache.data_dir)
+            if type(self.cache) is legacy_cls or not legacy.exists(cache_name):
+                continue
+            self.logger.info(f"migrating {legacy.path(cache_name)} to {self.cache.path(cache_name)}")
+            self.cache.save(cache_name, legacy.load(cache_name))
+            return
+
+    def last_timestamp(self, cache_name: str):
+        if not self.cache.exists(cache_name):
+            self._migrate_legacy_cache(cache_name)
+        bounds = self.cache.bounds(cache_name)
+        return None if bounds is None else bounds[1]
+
+    def journal(self, cache_name: str) -> SyncJournal:
+        if cache_name not in self._journals:
+            self._journals[cache_name] = SyncJournal(self.cache, cache_name)
+        return self._journals[cache_name]
+
+    def update_cache(self, exchange: str, symbol: str, bin_size: str) -> int:
+        """scarica nella cache le candele mancanti; ritorna il numero di candele scaricate"""
+        cache_name = self.cache_name(exchange, symbol, bin_size)
+        # riparte dall'ultimo batch scritto nel journal se l'esecuzione precedente e' stata interrotta
+        self.journal(cache_name).recover()
+        last_timestamp = self.last_timestamp(cache_name)
 
+        new_data = pd.DataFrame()
         if exchange == "bitmex":
-            df = self._bitmex_download(
+            new_data = self._bitmex_download(
                 symbol=symbol,
                 bin_size=bin_size,
-                data_df=df,
-                cache_filepath=cache_filepath
+                last_timestamp=last_timestamp,
+                cache_name=cache_name
             )
         elif exchange == "binance":
-            df = self._binance_download(
+            new_data = self._binance_download(
                 symbol=symbol,
                 bin_size=bin_size,
-                data_df=df,
-                cache_filepath=cache_filepath
+                last_timestamp=last_timestamp,
+                cache_name=cache_name
             )
+        self.wait_save()
+        self.journal(cache_name).commit()
+        return len(new_data)
+
+    def find_gaps(self, cache_name: str, bin_size: str) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """buchi interni della cache: ritorna (start, end) delle candele mancanti tra due candele presenti"""
+        if not self.cache.exists(cache_name):
+            return []
+        timestamps = self.cache.timestamps(cache_name)
+        step = self.binsize_str_int[bin_size] * 60 * 10 ** 9
+        holes = np.flatnonzero(np.diff(timestamps) > step)
+        return [
+            (pd.Timestamp(int(timestamps[i]) + step, tz='UTC'), pd.Timestamp(int(timestamps[i + 1]) - step, tz='UTC'))
+            for i in holes
+        ]
+
+    def sync(self, exchange: str, symbol: str, bin_size: str, fill_gaps: bool = True) -> int:
+        """
+        update_cache piu' il riempimento dei buchi interni della cache; i buchi gia' riscaricati ( anche se l'exchange
+        non ha restituito dati, es. manutenzione ) sono segnati nel journal e non vengono richiesti di nuovo.
+        Ritorna il numero di candele scaricate.
+        """
+        rows = self.update_cache(exchange, symbol, bin_size)
+        if not fill_gaps:
+            return rows
+
+        cache_name = self.cache_name(exchange, symbol, bin_size)
+        journal = self.journal(cache_name)
+        checked = journal.checked_gaps()
+        for start, end in self.find_gaps(cache_name, bin_size):
+            if (start.value, end.value) in checked:
+                continue
+            self.logger.info(f"{cache_name}: filling gap {start} - {end}")
+            if exchange == "bitmex":
+                data = self._bitmex_fetch(symbol, bin_size, start, end, cache_name=cache_name)
+            else:
+                data = self._binance_fetch(symbol, bin_size, start, end, cache_name=cache_name)
+            self.wait_save()
+            journal.commit()
+            journal.mark_gap_checked(start, end)
+            rows += len(data)
+        return rows
+
+    def download_many(self, specs: Iterable[Tuple[str, str, str]], max_workers: int = None) -> Dict[Tuple[str, str, str], int]:
+        """
+        aggiorna in parallelo la cache di piu' (exchange, symbol, bin_size).
+        I job dello stesso exchange condividono il rate limiter, quindi il tempo totale e' dato dal rate limit e non
+        dalla somma dei singoli download. Ritorna il numero di candele scaricate per ogni spec.
+        """
+        jobs = {}
+        for spec in specs:
+            exchange, symbol, bin_size = spec
+            # bin diversi possono condividere la stessa cache ( es. 5m e 15m ): basta scaricarla una volta
+            jobs.setdefault(self.cache_name(exchange, symbol, bin_size), spec)
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers or len(jobs) or 1) as executor:
+            futures = {
+                spec: executor.submit(self._clone().update_cache, *spec)
+                for spec in jobs.values()
+            }
+            for spec, future in futures.items():
+                try:
+                    results[spec] = future.result()
+                except Exception as e:
+                    self.logger.error(f"{spec}: {e}")
+                    results[spec] = None
+        return results
+
+    def _clone(self) -> 'DataFetcher':
+        # ogni job ha il proprio thread di salvataggio
+        return type(self)(
+            save_after=self.save_after,
+            cache=self.cache,
+            bitmex_client=self.bitmex_client,
+            binance_client=self.binance_client
+        )
+
+    def download_data(self, exchange: str, symbol: str, bin_size: str, date_from=None, date_to=None) -> pd.DataFrame:
+        cache_name = self.cache_name(exchange, symbol, bin_size)
+        self.update_cache(exchange, symbol, bin_size)
 
         if self.avaiable_bin_size[bin_size] != bin_size:
-            df = self.resample_to_interval(df, self.real_bin_size[bin_size])
-
-        return df[date_from:date_to]
-
-    def resample_to_interval(self, dataframe, interval):
-        df = dataframe.copy(deep=True)
-        # df.set_index(pd.DatetimeIndex(df[self.TIMESTAMP_COLUMN]), inplace=True)
-        ohlc_dict = {
-            # self.TIMESTAMP_COLUMN: 'first',
-            'open': 'first',
-            'high': 'max',
-            'low': 'min',
-            'close': 'last',
-            'volume': 'sum',
-        }
-
-        df = df.resample(f'{interval}min', label="right", closed="right").agg(ohlc_dict)
-        df = df.dropna(subset=['open', 'high', 'low', 'close', 'volume'])
-        # df.set_index(pd.DatetimeIndex(df[self.TIMESTAMP_COLUMN]), inplace=True)
+            derived_name = self.update_derived(exchange, symbol, bin_size)
+            df = self.load_cache(derived_name, date_from=date_from, date_to=date_to)
+            if 'bars' in df:
+                del df['bars']
+            return df
+
+        return self.load_cache(cache_name, date_from=date_from, date_to=date_to)
+
+    def load_data(self, exchange: str, symbol: str, bin_size: str, date_from=None, date_to=None) -> pd.DataFrame:
+        """come download_data ma solo dalla cache locale, senza contattare l'exchange ( es. worker distribuiti )"""
+        cache_name = self.cache_name(exchange, symbol, bin_size)
+        if self.avaiable_bin_size[bin_size] != bin_size:
+            cache_name = self.derived_cache_name(exchange, symbol, bin_size)
+        df = self.load_cache(cache_name, date_from=date_from, date_to=date_to)
+        if len(df) == 0:
+            raise Exception(f"{cache_name}: no cached data, download it first")
+        if 'bars' in df:
+            del df['bars']
+        return df
+
+    def derived_cache_name(self, exchange: str, symbol: str, bin_size: str) -> str:
+        return f'{exchange}_{symbol}_{bin_size}'
+
+    def update_derived(self, exchange: str, symbol: str, bin_size: str) -> str:
+        """
+        aggiorna nella cache il timeframe derivato `bin_size` ( es. 4h dalle candele 1h ) e ne ritorna il nome.
+        Ricalcola solo i bucket dall'ultimo salvato in poi ( l'ultimo puo' essere parziale ); se la colonna `bars`
+        non torna con le candele base ( es. buchi riempiti da sync ) ricostruisce tutto.
+        """
+        base_name = self.cache_name(exchange, symbol, bin_size)
+        derived_name = self.derived_cache_name(exchange, symbol, bin_size)
+        interval = self.real_bin_size[bin_size]
+        base_bounds = self.cache.bounds(base_name)
+        if base_bounds is None:
+            return derived_name
+        # bucket allineati alla mezzanotte del primo giorno della cache base, come il resample dell'intera serie
+        origin = base_bounds[0].floor('D')
+
+        derived_bounds = self.cache.bounds(derived_name) if self.cache.exists(derived_name) else None
+        if derived_bounds is not None:
+            last_label = derived_bounds[1]
+            base_rows = self.cache.rows(base_name, last_label)
+            derived_bars = self._dataset(derived_name)['bars'].sum() if base_rows else -1
+            if derived_bars == base_rows:
+                if base_bounds[1] <= last_label and derived_bars:
+                    return derived_name
+                # le candele base del bucket `last_label` iniziano subito dopo la chiusura del bucket precedente
+                since = last_label - timedelta(minutes=interval) + pd.Timedelta(1, 'ns')
+                df = self._resample(self._dataset(base_name, date_from=since), interval, origin=origin)
+                self.cache.append(derived_name, df)
+                return derived_name
+            self.logger.info(f"{derived_name}: base data changed, rebuilding")
+
+        df = self._resample(self._dataset(base_name), interval, origin=origin)
+        self.cache.save(derived_name, df)
+        return derived_name
+
+    def mapped_data(self, exchange: str, symbol: str, bin_size: str, date_from=None, date_to=None) -> MappedOHLCV:
+        """
+        come download_data ma ritorna un MappedOHLCV in sola lettura: va prodotto una volta sola e passato ai processi
+        worker, che lo riaprono in memory-map senza copiare i dati. Il file e' riusato solo per le stesse candele: il
+        nome contiene l'impronta del contenuto ( un buco riempito o una riparazione nello stesso intervallo ne crea
+        uno nuovo )
+        """
+        df = self.download_data(exchange, symbol, bin_size, date_from=date_from, date_to=date_to)
+        if len(df) == 0:
+            raise Exception(f"{exchange} {symbol} {bin_size}: no data")
+        name = f"{exchange}_{symbol}_{bin_size}_{df.index[0].strftime('%Y%m%d%H%M')}_" \
+               f"{df.index[-1].strftime('%Y%m%d%H%M')}_{MappedOHLCV.fingerprint(df)}"
+        path = os.path.join(self.MMAP_DIR, f'{name}.npyd')
+        if os.path.exists(path):
+            return MappedOHLCV(path)
+        if not os.path.exists(self.MMAP_DIR):
+            os.makedirs(self.MMAP_DIR)
+        return MappedOHLCV.create(df, path)
+
+    def resample_to_interval(self, dataframe, interval, origin=None):
+        return self._resample(dataframe, interval, origin=origin).drop(columns=['bars'])
+
+    def _resample(self, dataframe, interval, origin=None) -> pd.DataFrame:
+        """
+        candele da `interval` minuti come `resample(label="right", closed="right")` ma con `np.*.reduceat` sulle
+        colonne, senza copiare il DataFrame; `dataframe` deve essere ordinato. `origin` fissa l'allineamento dei
+        bucket ( default mezzanotte UTC del primo giorno ). La colonna `bars` conta le candele base di ogni bucket.
+        """
+        columns = ['open', 'high', 'low', 'close', 'volume']
+        if len(dataframe) == 0:
+            return pd.DataFrame(columns=columns + ['bars'])
+        timestamps = dataframe.index.asi8
+        step = interval * 60 * 10 ** 9
+        day = 24 * 60 * 60 * 10 ** 9
+        origin = timestamps[0] - timestamps[0] % day if origin is None else pd.Timestamp(origin).value
+        # label = fine del bucket ( intervallo chiuso a destra )
+        labels = origin - (origin - timestamps) // step * step
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+        ends = np.r_[starts[1:], len(timestamps)]
+
+        values = {c: dataframe[c].to_numpy(dtype=np.float64) for c in columns}
+        df = pd.DataFrame({
+            'open': values['open'][starts],
+            'high': np.maximum.reduceat(values['high'], starts),
+            'low': np.minimum.reduceat(values['low'], starts),
+            'close': values['close'][ends - 1],
+            'volume': np.add.reduceat(values['volume'], starts),
+            'bars': ends - starts,
+        }, index=pd.DatetimeIndex(labels[starts], tz='UTC', name=self.TIMESTAMP_COLUMN))
         return df
 
-    def _save_df(self, df: pd.DataFrame, cache_filepath: str):
-        import shutil
+    def _save_df(self, journal: SyncJournal):
         with self._save_lock:  # wait other threads ( mutex )
             try:
-                if not os.path.exists(self.DATA_DIR):
-                    os.mkdir(self.DATA_DIR)
-                _, tmpfn = tempfile.mkstemp()
-                with open(tmpfn, 'w') as fd:
-                    df.to_csv(fd)
-                shutil.move(tmpfn, cache_filepath)
+                journal.commit()
             except Exception as e:
                 self.logger.error(f"_save_df: {e}")
 
-    def save_df(self, df: pd.DataFrame, cache_filepath: str, i: int = 0):
+    def save_df(self, df: pd.DataFrame, cache_name: str, i: int = 0) -> bool:
+        """
+        scrive subito `df` nel journal ( un segmento per batch, sopravvive a un crash ) e ogni `save_after` round
+        compatta in background i segmenti nella cache
+        """
+        journal = self.journal(cache_name)
+        journal.write(df)
         if i % self.save_after != 0:
-            return
+            return False
         self.logger.info(f"saving ( {i} )")
+        self.wait_save()
+        self._save_thread = threading.Thread(target=self._save_df, args=(journal,))
+        self._save_thread.start()
+        return True
+
+    def wait_save(self):
         if self._save_thread and self._save_thread.is_alive():
             self._save_thread.join()
-        self._save_thread = threading.Thread(target=self._save_df, args=(df, cache_filepath))
-        self._save_thread.start()
 
     def _bitmex_client(self, api_key=None, api_secret=None) -> bitmex:
+        if self.bitmex_client is not None:
+            return self.bitmex_client
         return bitmex(test=False, api_key=api_key, api_secret=api_secret)
 
     def _binance_client(self, api_key=None, api_secret=None) -> BinanceClient:
+        if self.binance_client is not None:
+            return self.binance_client
         return BinanceClient(api_key=api_key, api_secret=api_secret)
 
-    def _minutes_of_new_data(self, symbol, kline_size: str, data, exchange) -> Tuple[datetime, datetime]:
+    def _minutes_of_new_data(self, symbol, kline_size: str, last_timestamp, exchange) -> Tuple[datetime, datetime]:
         old, new = None, None
         # old
-        if len(data) > 0:
-            old = data.index[-1]
-            old = pd.to_datetime(old, utc=True).to_pydatetime()
+        if last_timestamp is not None:
+            old = pd.to_datetime(last_timestamp, utc=True).to_pydatetime()
         elif exchange == "binance":
-            old = datetime(2017, 1, 1)
+            # prima candela disponibile: evita di richiedere finestre vuote prima del listing del symbol
+            old = pd.to_datetime(
+                self._rate_limited("binance", lambda: self._binance_client().get_klines(
+                    symbol=symbol,
+                    interval=kline_size,
+                    startTime=0,
+                    limit=1
+                ))[0][0],
+                unit='ms'
+            ).to_pydatetime()
         elif exchange == "bitmex":
-            old = self._bitmex_client().Trade.Trade_getBucketed(
+            old = self._rate_limited("bitmex", lambda: self._bitmex_client().Trade.Trade_getBucketed(
                 symbol=symbol,
                 binSize=kline_size,
                 count=1,
                 reverse=False
-            ).result()[0][0][self.TIMESTAMP_COLUMN]
+            ).result())[0][0][self.TIMESTAMP_COLUMN]
 
         # new
         if exchange == "binance":
             new = pd.to_datetime(
-                self._binance_client().get_klines(
+                self._rate_limited("binance", lambda: self._binance_client().get_klines(
                     symbol=symbol,
                     interval=kline_size
-                )[-1][0],
+                ))[-1][0],
                 unit='ms'
             )
         if exchange == "bitmex":
-            new = self._bitmex_client().Trade.Trade_getBucketed(
+            new = self._rate_limited("bitmex", lambda: self._bitmex_client().Trade.Trade_getBucketed(
                 symbol=symbol,
                 binSize=kline_size,
                 count=1,
                 partial=False,
                 reverse=True
-            ).result()[0][0][self.TIMESTAMP_COLUMN]
+            ).result())[0][0][self.TIMESTAMP_COLUMN]
 
         return old, new
 
-    def _bitmex_download(self, symbol, bin_size: str, data_df=pd.DataFrame(), cache_filepath=None) -> pd.DataFrame:
-        oldest_point, newest_point = self._minutes_of_new_data(symbol, self.avaiable_bin_size[bin_size], data_df,
+    def _bitmex_download(self, symbol, bin_size: str, last_timestamp=None, cache_name=None) -> pd.DataFrame:
+        """scarica le candele successive a `last_timestamp` accodandole alla cache; ritorna solo i nuovi dati"""
+        oldest_point, newest_point = self._minutes_of_new_data(symbol, self.avaiable_bin_size[bin_size], last_timestamp,
                                                                exchange="bitmex")
-        delta_min = (newest_point - oldest_point).total_seconds() / 60
-        available_data = math.ceil(delta_min / self.binsize_str_int[bin_size])
+        return self._bitmex_fetch(symbol, bin_size, oldest_point, newest_point, cache_name=cache_name)
+
+    def _bitmex_fetch(self, symbol, bin_size: str, start, end, cache_name=None) -> pd.DataFrame:
+        """scarica le candele tra `start` e `end` ( inclusi ) scrivendo ogni batch nel journal di `cache_name`"""
+        start = pd.Timestamp(start).to_pydatetime()
+        end = pd.Timestamp(end).to_pydatetime()
+        delta_min = (end - start).total_seconds() / 60
+        available_data = math.ceil(delta_min / self.binsize_str_int[bin_size]) + 1
         rounds = math.ceil(available_data / self.BATCH_SIZE)
-        if rounds <= 0:
-            return data_df
+        if delta_min < 0 or rounds <= 0:
+            return pd.DataFrame()
 
-        for round_num in tqdm(range(rounds)):
-            success = False
-            t = time.time()
-            while not success:
-                try:
-                    t_diff = timedelta(minutes=round_num * self.BATCH_SIZE * self.binsize_str_int[bin_size])
-                    new_time = (oldest_point + t_diff)
-                    data = self._bitmex_client().Trade.Trade_getBucketed(
-                        symbol=symbol,
-                        binSize=self.avaiable_bin_size[bin_size],
-                        count=self.BATCH_SIZE,
-                        startTime=new_time
-                    ).result()[0]
-                    t = time.time()
-
-                    temp_df = pd.DataFrame(data)
-                    temp_df.dropna(
-                        subset=[self.TIMESTAMP_COLUMN, 'close', 'high', 'low', 'open', 'volume'],
-                        inplace=True
-                    )
-                    temp_df[self.TIMESTAMP_COLUMN] = pd.to_datetime(temp_df[self.TIMESTAMP_COLUMN], utc=True)
-                    temp_df.set_index(self.TIMESTAMP_COLUMN, inplace=True)
-                    data_df = data_df.append(temp_df, sort=True)
-                    success = True
-
-                    if cache_filepath and rounds > 0:
-                        self.save_df(data_df, cache_filepath, round_num)
-                except HTTPTooManyRequests:
-                    self.logger.warning("HTTPTooManyRequests")
-                    success = False
-                finally:
-                    dt = time.time() - t
-                    if dt < self._bitmex_sleep_time:
-                        s = self._bitmex_sleep_time - dt
-                        self.logger.debug(f"sleeping {s}")
-                        time.sleep(s)  # cooldown
-
-        return data_df
-
-    def _binance_download(self, symbol, bin_size: str, data_df: pd.DataFrame = None,
-                          cache_filepath=None) -> pd.DataFrame:
-        if data_df is None:
-            data_df = pd.DataFrame()
-        oldest_point, newest_point = self._minutes_of_new_data(symbol, bin_size, data_df, exchange="binance")
-        klines = self._binance_client().get_historical_klines(
-            symbol,
-            bin_size,
-            oldest_point.strftime("%d %b %Y %H:%M:%S"),
-            newest_point.strftime("%d %b %Y %H:%M:%S")
-        )
-        columns = ['close', 'high', 'low', 'open', 'volume']
+        # i batch restano in lista ( nessuna copia per round ) e il DataFrame completo viene costruito una sola volta
+        # alla fine; ogni batch e' gia' su disco nel journal appena scaricato
+        batches = []
+        for round_num in tqdm(range(rounds), desc=cache_name):
+            t_diff = timedelta(minutes=round_num * self.BATCH_SIZE * self.binsize_str_int[bin_size])
+            new_time = (start + t_diff)
+            data = self._rate_limited("bitmex", lambda: self._bitmex_client().Trade.Trade_getBucketed(
+                symbol=symbol,
+                binSize=self.avaiable_bin_size[bin_size],
+                count=self.BATCH_SIZE,
+                startTime=new_time,
+                endTime=end
+            ).result()[0])
+            if not data:
+                continue
+
+            temp_df = pd.DataFrame(data)
+            temp_df.dropna(
+                subset=[self.TIMESTAMP_COLUMN, 'close', 'high', 'low', 'open', 'volume'],
+                inplace=True
+            )
+            temp_df[self.TIMESTAMP_COLUMN] = pd.to_datetime(temp_df[self.TIMESTAMP_COLUMN], utc=True)
+            temp_df.set_index(self.TIMESTAMP_COLUMN, inplace=True)
+            batches.append(temp_df)
+
+            if cache_name:
+                self.save_df(temp_df, cache_name, round_num)
+
+        if cache_name:
+            self.wait_save()
+            self.journal(cache_name).commit()
+        if not batches:
+            return pd.DataFrame()
+        return pd.concat(batches, sort=True)
+
+    def _binance_download(self, symbol, bin_size: str, last_timestamp=None, cache_name=None) -> pd.DataFrame:
+        """scarica le candele successive a `last_timestamp` accodandole alla cache; ritorna solo i nuovi dati"""
+        oldest_point, newest_point = self._minutes_of_new_data(symbol, self.avaiable_bin_size[bin_size],
+                                                               last_timestamp, exchange="binance")
+        return self._binance_fetch(symbol, bin_size, oldest_point, newest_point, cache_name=cache_name)
+
+    def _binance_fetch(self, symbol, bin_size: str, start, end, cache_name=None) -> pd.DataFrame:
+        """
+        scarica le candele tra `start` e `end` ( inclusi ) scrivendole nel journal di `cache_name`.
+        L'intervallo e' diviso in finestre da BINANCE_KLINES_LIMIT candele ( una richiesta ciascuna ) scaricate in
+        parallelo sotto il rate limiter condiviso; ogni finestra diventa subito colonne NumPy tipizzate.
+        """
+        interval = self.avaiable_bin_size[bin_size]
+        step = self.binsize_str_int[bin_size] * 60 * 1000
+        start_ms = int(pd.Timestamp(start).timestamp() * 1000)
+        end_ms = int(pd.Timestamp(end).timestamp() * 1000)
+        if end_ms < start_ms:
+            return pd.DataFrame()
+        window = self.BINANCE_KLINES_LIMIT * step
+        windows = [(w, min(w + window - step, end_ms)) for w in range(start_ms, end_ms + 1, window)]
+
+        def fetch(w_start, w_end):
+            klines = self._rate_limited("binance", lambda: self._binance_client().get_klines(
+                symbol=symbol,
+                interval=interval,
+                startTime=w_start,
+                endTime=w_end,
+                limit=self.BINANCE_KLINES_LIMIT
+            ))
+            return self._binance_klines_to_numpy(klines)
+
+        parts = []
+        with ThreadPoolExecutor(max_workers=min(self.binance_workers, len(windows))) as executor:
+            futures = [executor.submit(fetch, *w) for w in windows]
+            for future in tqdm(as_completed(futures), total=len(futures), desc=cache_name):
+                timestamps, values = future.result()
+                if not len(timestamps):
+                    continue
+                parts.append((timestamps, values))
+                if cache_name:
+                    self.save_df(self._binance_frame(symbol, timestamps, values), cache_name, len(parts) - 1)
+
+        if cache_name:
+            self.wait_save()
+            self.journal(cache_name).commit()
+        if not parts:
+            return pd.DataFrame()
+
+        # le finestre arrivano in ordine sparso: ordina e tiene l'ultima copia di ogni timestamp
+        timestamps = np.concatenate([p[0] for p in parts])
+        values = np.concatenate([p[1] for p in parts])
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+        keep = np.r_[timestamps[1:] != timestamps[:-1], True]
+        return self._binance_frame(symbol, timestamps[keep], values[keep])
+
+    @staticmethod
+    def _binance_klines_to_numpy(klines) -> Tuple[np.ndarray, np.ndarray]:
+        # kline: [open_time, open, high, low, close, volume, close_time, ...], prezzi come stringhe
+        if not klines:
+            return np.empty(0, dtype=np.int64), np.empty((0, 5), dtype=np.float64)
+        rows = np.array([k[:6] for k in klines], dtype=object)
+        return rows[:, 0].astype(np.int64), rows[:, 1:6].astype(np.float64)
+
+    def _binance_frame(self, symbol, timestamps: np.ndarray, values: np.ndarray) -> pd.DataFrame:
         data = pd.DataFrame(
-            klines,
-            columns=[self.TIMESTAMP_COLUMN, ] + columns +
-                    ['close_time', 'quote_av', 'trades', 'tb_base_av', 'tb_quote_av', 'ignore']
-        ).dropna(
-            subset=[self.TIMESTAMP_COLUMN, ] + columns
+            values,
+            columns=['open', 'high', 'low', 'close', 'volume'],
+            index=pd.DatetimeIndex(pd.to_datetime(timestamps, unit='ms', utc=True), name=self.TIMESTAMP_COLUMN)
         )
         data['symbol'] = symbol
-        data[self.TIMESTAMP_COLUMN] = pd.to_datetime(data[self.TIMESTAMP_COLUMN], unit='ms', utc=True)
-        data.set_index(self.TIMESTAMP_COLUMN, inplace=True)
-        if cache_filepath:
-            self.save_df(data, cache_filepath)
-        if len(data_df) > 0:
-            data_df = data_df.append(data)
-        else:
-            data_df = data
-        data_df.dropna(subset=columns, inplace=True)
-        return data_df[columns + ['symbol']]
+        return data
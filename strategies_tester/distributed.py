@@ -0,0 +1,225 @@
+"""
+Ottimizzazione distribuita attraverso lo storage di optuna: un coordinatore crea lo studio con la sua
+configurazione, tanti worker ( processi o host diversi ) prendono i trial dallo stesso storage.
+"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+import optuna
+import optuna.storages
+from optuna.trial import TrialState
+
+from strategies_tester.strategies import OptunaOptimizeStrategy, strategy_optimizers
+
+__all__ = ['OptimizeCoordinator', 'OptimizeWorker', 'study_storage']
+
+# user attrs dello studio: configurazione dell'ottimizzazione e richiesta di stop ai worker
+CONFIG_ATTR = 'optimize_config'
+STOP_ATTR = 'stop'
+# system attrs dei trial: chi lo sta valutando e ultimo segno di vita ( time.time() )
+WORKER_ATTR = 'worker'
+HEARTBEAT_ATTR = 'heartbeat'
+
+
+def study_storage(url: str) -> optuna.storages.RDBStorage:
+    """storage condiviso da coordinatore e worker: con sqlite attende i lock degli altri processi invece di fallire"""
+    engine_kwargs = {'connect_args': {'timeout': 60}} if url.startswith('sqlite') else None
+    return optuna.storages.RDBStorage(url, engine_kwargs=engine_kwargs)
+
+
+def _completed(study: optuna.Study) -> int:
+    return sum(1 for t in study.get_trials(deepcopy=False) if t.state == TrialState.COMPLETE)
+
+
+class OptimizeWorker(object):
+    """
+    Prende un trial alla volta dallo studio finche' non ci sono `max_evals` trial completati o il coordinatore
+    chiede lo stop. I dati vengono caricati una volta sola dalla cache locale ( `update_data` li scarica prima ) e
+    durante la valutazione un thread aggiorna l'heartbeat del trial, cosi' il coordinatore riconosce i worker morti.
+    """
+
+    def __init__(self, storage_url: str, study_name: str, heartbeat_interval: float = 10.0,
+                 update_data: bool = False):
+        self.logger = logging.getLogger(__name__)
+        self.storage = study_storage(storage_url)
+        self.study = optuna.load_study(study_name=study_name, storage=self.storage)
+        self.config = self.study.user_attrs.get(CONFIG_ATTR)
+        if self.config is None:
+            raise Exception(f"{study_name}: no optimization config, start the coordinator first")
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.optimizer = self._optimizer(storage_url, update_data)
+        # il pruner non e' salvato nello studio: load_study userebbe MedianPruner. I worker valutano periodi interi
+        # ( _evaluate_many ): gli step sono i periodi, senza checkpoint
+        if self.config.get('checkpoint_bars'):
+            self.logger.warning("checkpoint_bars: workers evaluate whole periods, intermediate pruning is not used")
+        self.study.pruner = self.optimizer.make_pruner(checkpoints=False)
+        self.trials = 0
+        self._trial_id = None
+        self._stop = threading.Event()
+
+    def _optimizer(self, storage_url: str, update_data: bool) -> OptunaOptimizeStrategy:
+        config = dict(self.config)
+        optimizer_class = strategy_optimizers[config.pop('strategy')]
+        config.pop('max_evals')
+        time_periods = [(datetime.fromisoformat(start), datetime.fromisoformat(end))
+                        for start, end in config.pop('time_periods')]
+        return optimizer_class(study_name=self.study.study_name, optuna_storage=storage_url,
+                               time_periods=time_periods, update_data=update_data, **config)
+
+    def stopped(self) -> bool:
+        study_attrs = self.storage.get_study_user_attrs(self.study._study_id)
+        return bool(study_attrs.get(STOP_ATTR)) or _completed(self.study) >= self.config['max_evals']
+
+    def run(self) -> int:
+        """ritorna il numero di trial valutati"""
+        heartbeat = threading.Thread(target=self._heartbeat, name='heartbeat', daemon=True)
+        heartbeat.start()
+        self.logger.info(f"worker {self.worker_id}: study {self.study.study_name}")
+        try:
+            while not self.stopped():
+                self._run_trial()
+        finally:
+            self._stop.set()
+            heartbeat.join()
+        self.logger.info(f"worker {self.worker_id}: {self.trials} trials")
+        return self.trials
+
+    def _run_trial(self):
+        opt, study = self.optimizer, self.study
+        trials, params = opt._ask_parameters(study, 1)
+        if not trials:
+            return
+        trial = trials[0]
+        self.storage.set_trial_system_attr(trial._trial_id, WORKER_ATTR, self.worker_id)
+        self.storage.set_trial_system_attr(trial._trial_id, HEARTBEAT_ATTR, time.time())
+        self._trial_id = trial._trial_id
+        try:
+            periods = opt._evaluate_many(params)[0]
+        finally:
+            self._trial_id = None
+        try:
+            opt._finish_trial(study, trial, periods)
+        except RuntimeError as e:
+            # il coordinatore lo ha gia' chiuso come stale ( worker troppo lento ): i parametri sono stati rimessi in coda
+            self.logger.warning(f"trial {trial.number}: {e}")
+            return
+        self.trials += 1
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            trial_id = self._trial_id
+            if trial_id is None:
+                continue
+            try:
+                self.storage.set_trial_system_attr(trial_id, HEARTBEAT_ATTR, time.time())
+            except Exception as e:
+                self.logger.debug(f"heartbeat of trial {trial_id}: {e}")
+
+
+class OptimizeCoordinator(object):
+    """
+    Crea lo studio con la configurazione dei worker, ne mostra l'andamento ( trial al minuto ), rimette in coda i
+    trial RUNNING senza heartbeat da `stale_after` secondi e, raggiunti `max_evals` trial completati, ferma i worker.
+    """
+
+    def __init__(self, storage_url: str, study_name: str, stale_after: float = 60.0, interval: float = 10.0):
+        self.logger = logging.getLogger(__name__)
+        self.storage = study_storage(storage_url)
+        self.study_name = study_name
+        self.stale_after = stale_after
+        self.interval = interval
+        self.study = None
+        self.reclaimed = 0
+
+    def create(self, config: dict) -> optuna.Study:
+        """`config`: argomenti di OptunaOptimizeStrategy ( senza studio e storage ) + 'strategy' e 'max_evals'"""
+        self.study = optuna.create_study(
+            study_name=self.study_name,
+            direction='maximize',
+            storage=self.storage,
+            load_if_exists=True,
+            pruner=optuna.pruners.NopPruner()
+        )
+        self.study.set_user_attr(CONFIG_ATTR, config)
+        self.study.set_user_attr(STOP_ATTR, False)
+        return self.study
+
+    @property
+    def max_evals(self) -> int:
+        return self.study.user_attrs[CONFIG_ATTR]['max_evals']
+
+    def status(self, window: float = 60.0) -> dict:
+        trials = self.study.get_trials(deepcopy=False)
+        states = {state: 0 for state in TrialState}
+        for t in trials:
+            states[t.state] += 1
+        since = datetime.now().timestamp() - window
+        recent = sum(1 for t in trials if t.datetime_complete and t.datetime_complete.timestamp() >= since)
+        running = [t for t in trials if t.state == TrialState.RUNNING]
+        complete = [t for t in trials if t.state == TrialState.COMPLETE and t.value is not None]
+        return {
+            'complete': states[TrialState.COMPLETE],
+            'pruned': states[TrialState.PRUNED],
+            'failed': states[TrialState.FAIL],
+            'running': states[TrialState.RUNNING],
+            'waiting': states[TrialState.WAITING],
+            'workers': len({t.system_attrs.get(WORKER_ATTR) for t in running}),
+            'trials_per_minute': recent * 60.0 / window,
+            'best_value': max(t.value for t in complete) if complete else None,
+        }
+
+    def reclaim_stale(self, requeue: bool = True) -> int:
+        """chiude come FAIL i trial RUNNING senza heartbeat recente e ne rimette in coda i parametri"""
+        now = time.time()
+        reclaimed = 0
+        for t in self.study.get_trials(deepcopy=False):
+            if t.state != TrialState.RUNNING:
+                continue
+            last = t.system_attrs.get(HEARTBEAT_ATTR, t.datetime_start.timestamp())
+            if now - last < self.stale_after:
+                continue
+            try:
+                self.storage.set_trial_system_attr(t._trial_id, 'fail_reason', 'stale heartbeat')
+                self.storage.set_trial_state(t._trial_id, TrialState.FAIL)
+            except RuntimeError:
+                continue  # finito nel frattempo
+            self.logger.warning(f"trial {t.number}: no heartbeat from {t.system_attrs.get(WORKER_ATTR)} "
+                                f"for {now - last:.0f}s, reclaimed")
+            if requeue and t.params:
+                self.study.enqueue_trial(t.params)
+            reclaimed += 1
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    def run(self, timeout: Optional[float] = None) -> dict:
+        """
+        Controlla lo studio ogni `interval` secondi fino a `max_evals` trial completati, poi chiede lo stop e aspetta
+        che i worker chiudano i trial in corso. Ritorna i parametri migliori.
+        """
+        started = time.time()
+        stopping = False
+        while True:
+            self.reclaim_stale(requeue=not stopping)
+            status = self.status()
+            self.logger.info(
+                f"{self.study_name}: {status['complete']}/{self.max_evals} complete, {status['pruned']} pruned, "
+                f"{status['failed']} failed, {status['running']} running on {status['workers']} workers, "
+                f"{status['trials_per_minute']:.1f} trials/min, best {status['best_value']}")
+            if not stopping and (status['complete'] >= self.max_evals or
+                                 (timeout is not None and time.time() - started > timeout)):
+                self.study.set_user_attr(STOP_ATTR, True)
+                stopping = True
+            if stopping and not status['running']:
+                break
+            time.sleep(self.interval)
+        return self.study.best_params
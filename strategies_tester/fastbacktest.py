@@ -0,0 +1,591 @@
+"""
+Backtest NumPy per le strategie a segnali: market all'incrocio, stop a distanza fissa, PercentSizer, commissione
+percentuale. Pensato come pre-screen delle ottimizzazioni: stessi parametri e stesso dizionario `stats` di
+OptunaOptimizeStrategy.backtest, senza cerebro.
+"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import math
+import threading
+import weakref
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple, Type, Union
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from strategies_tester.indicator_cache import IndicatorCache, fingerprint
+from strategies_tester.mapped import MappedOHLCV
+from strategies_tester.strategies import BaseStrategy
+from strategies_tester.strategies._np_indicators import SharedIndicators, first_valid
+from strategies_tester.utils_backtest import bar_delta, infer_timeframe
+
+__all__ = ['STATS', 'FastData', 'FastBroker', 'FastBacktester', 'StatsPeriods', 'date_bounds', 'fast_data',
+           'fast_backtest', 'fast_stats', 'fast_supported', 'new_periods', 'stats_periods']
+
+# metriche di OptunaOptimizeStrategy calcolate da fast_stats
+STATS = ('pnl', 'sqn', 'vwr', 'sharpe_ratio', 'winrate')
+
+NS_PER_MINUTE = 60 * 10 ** 9
+NS_PER_DAY = 1440 * NS_PER_MINUTE
+
+
+class FastData(NamedTuple):
+    timestamp: np.ndarray  # int64 ns UTC
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+
+def fast_data(df: Union[pd.DataFrame, MappedOHLCV], date_from: datetime = None, date_to: datetime = None) -> FastData:
+    """array float64 delle candele tra `date_from` e `date_to` ( inclusi, come fromdate/todate di backtrader )"""
+    if isinstance(df, MappedOHLCV):
+        timestamp = np.asarray(df.timestamp)
+        columns = [np.asarray(getattr(df, c), dtype=np.float64) for c in MappedOHLCV.COLUMNS]
+    else:
+        timestamp = df.index.asi8
+        columns = [df[c].to_numpy(dtype=np.float64) for c in MappedOHLCV.COLUMNS]
+    start, end = date_bounds(timestamp, date_from, date_to)
+    return FastData(timestamp[start:end], *(c[start:end] for c in columns))
+
+
+def date_bounds(timestamp: np.ndarray, date_from: datetime = None, date_to: datetime = None) -> Tuple[int, int]:
+    """indici [ start, end ) delle barre tra `date_from` e `date_to` inclusi"""
+    start = 0 if date_from is None else int(np.searchsorted(timestamp, pd.Timestamp(date_from).value, side='left'))
+    end = len(timestamp) if date_to is None else int(np.searchsorted(timestamp, pd.Timestamp(date_to).value,
+                                                                     side='right'))
+    return start, end
+
+
+def fast_supported(strategy: Type[BaseStrategy]) -> bool:
+    return strategy.fast_signals.__func__ is not BaseStrategy.fast_signals.__func__
+
+
+class _Order(object):
+    __slots__ = ('ref', 'size', 'stop', 'price', 'bar', 'alive')
+
+    def __init__(self, ref: int, size: float, stop: bool, price: float, bar: int):
+        self.ref = ref
+        self.size = size  # > 0 buy, < 0 sell
+        self.stop = stop
+        self.price = price  # created.price: close della barra per i market, prezzo di stop per gli stop
+        self.bar = bar
+        self.alive = True
+
+
+def _update_position(size: float, price: float, delta: float, exprice: float):
+    """Position.update di backtrader: ( size, price, opened, closed )"""
+    oldsize = size
+    size += delta
+    if not size:
+        return size, 0.0, 0, delta
+    if not oldsize:
+        return size, exprice, delta, 0
+    if oldsize > 0:
+        if delta > 0:
+            return size, (price * oldsize + delta * exprice) / size, delta, 0
+        if size > 0:
+            return size, price, 0, delta
+        return size, exprice, size, -oldsize
+    if delta < 0:
+        return size, (price * oldsize + delta * exprice) / size, delta, 0
+    if size < 0:
+        return size, price, 0, delta
+    return size, exprice, size, -oldsize
+
+
+class FastBroker(object):
+    """
+    Replica di BackBroker ( checksubmit, gruppi OCO, margin ) + PercentSizer + next() delle strategie a segnali.
+    Il ciclo visita solo le barre dove puo' succedere qualcosa: segnali utili per la posizione corrente, ordini
+    appena inviati e barre in cui uno stop pendente viene toccato ( cercate a blocchi con NumPy ).
+    """
+
+    def __init__(self, data: FastData, perc_size: float = 10, commission: float = 0.00075,
+                 start_cash: float = 10000):
+        self.data = data
+        self.percents = perc_size
+        self.commission = commission
+        self.start_cash = start_cash
+
+        self.cash = start_cash
+        self.size = 0.0
+        self.price = 0.0
+        self.submitted = deque()
+        self.pending = deque()
+        self._ref = 0
+        self._ocos = {}
+        self._ocol = defaultdict(list)
+
+        self.market_order = None
+        self.stop_order = None
+
+        self.trade = None  # [size, pnl, commission, isclosed]
+        self.trades_pnlcomm = []  # pnlcomm dei trade chiusi, in ordine
+
+        self._changes = []  # ( barra, cash, size ) dopo ogni barra che li modifica
+
+    # strategia
+
+    def run(self, long_signal: np.ndarray, short_signal: np.ndarray, start: int, stop_loss: float) -> np.ndarray:
+        """esegue il backtest dalla barra `start` ( primo next() della strategia ), ritorna il valore per barra"""
+        n = len(self.data.close)
+        self.stop_loss = stop_loss
+        longs = np.flatnonzero(np.nan_to_num(long_signal[start:]) != 0.0) + start
+        shorts = np.flatnonzero(np.nan_to_num(short_signal[start:]) != 0.0) + start
+        is_long = np.zeros(n, dtype=bool)
+        is_long[longs] = True
+        is_short = np.zeros(n, dtype=bool)
+        is_short[shorts] = True
+
+        t = start
+        while t < n:
+            if self.submitted or self.pending:
+                self._broker_next(t)
+            self._strategy_next(t, is_long[t], is_short[t])
+
+            if self.submitted:
+                t += 1
+                continue
+            nxt = n
+            if self.size <= 0:
+                i = int(np.searchsorted(longs, t, side='right'))
+                if i < len(longs):
+                    nxt = min(nxt, int(longs[i]))
+            if self.size >= 0:
+                i = int(np.searchsorted(shorts, t, side='right'))
+                if i < len(shorts):
+                    nxt = min(nxt, int(shorts[i]))
+            for order in self.pending:
+                nxt = self._first_trigger(order, t + 1, nxt)
+            t = nxt
+
+        return self._values()
+
+    def _strategy_next(self, t: int, long_signal: bool, short_signal: bool):
+        if long_signal and self.size <= 0:
+            if self.market_order is not None and self.market_order.size < 0:
+                self._close(t, oco=self.market_order)
+            if self.stop_order is not None and self.stop_order.size > 0:
+                self._cancel(self.stop_order)
+            self.market_order = self._submit(t, self._sizing(t), oco=None)
+            self.stop_order = None
+
+        if short_signal and self.size >= 0:
+            if self.market_order is not None and self.market_order.size > 0:
+                self._close(t, oco=self.market_order)
+            if self.stop_order is not None and self.stop_order.size < 0:
+                self._cancel(self.stop_order)
+            self.market_order = self._submit(t, -self._sizing(t), oco=None)
+            self.stop_order = None
+
+        if self.stop_order is None and self.size != 0:
+            if self.size > 0:
+                self.stop_order = self._submit(t, -self._sizing(t), oco=self.market_order,
+                                               stop_price=self.price - self.stop_loss)
+            else:
+                self.stop_order = self._submit(t, self._sizing(t), oco=self.market_order,
+                                               stop_price=self.price + self.stop_loss)
+
+    def _sizing(self, t: int) -> float:
+        """PercentSizer: abs() come in Strategy.buy/sell"""
+        if not self.size:
+            return abs(self.cash / self.data.close[t] * (self.percents / 100))
+        return abs(self.size)
+
+    def _close(self, t: int, oco: _Order):
+        if self.size > 0:
+            self._submit(t, -abs(self.size), oco=oco)
+        elif self.size < 0:
+            self._submit(t, abs(self.size), oco=oco)
+
+    def _submit(self, t: int, size: float, oco: _Order = None, stop_price: float = None):
+        if not size:
+            return None
+        self._ref += 1
+        stop = stop_price is not None
+        order = _Order(self._ref, size, stop, stop_price if stop else float(self.data.close[t]), t)
+        if oco is None:
+            self._ocos[order.ref] = order.ref
+            self._ocol[order.ref].append(order.ref)
+        else:
+            leader = self._ocos[oco.ref]
+            self._ocos[order.ref] = leader
+            self._ocol[leader].append(order.ref)
+        self.submitted.append(order)
+        return order
+
+    def _cancel(self, order: _Order):
+        try:
+            self.pending.remove(order)
+        except ValueError:
+            return
+        order.alive = False
+        self._ococheck(order)
+
+    # broker
+
+    def _ococheck(self, order: _Order):
+        group = self._ocol.pop(self._ocos[order.ref], None)
+        if group:
+            for i in range(len(self.pending) - 1, -1, -1):
+                o = self.pending[i]
+                if o is not None and o.ref in group:
+                    del self.pending[i]
+                    o.alive = False
+
+    def _broker_next(self, t: int):
+        before = (self.cash, self.size)
+        if self.submitted:
+            self._check_submitted()
+
+        self.pending.append(None)
+        while True:
+            order = self.pending.popleft()
+            if order is None:
+                break
+            self._try_exec(order, t)
+            if order.alive:
+                self.pending.append(order)
+
+        if (self.cash, self.size) != before:
+            self._changes.append((t, self.cash, self.size))
+
+    def _check_submitted(self):
+        """esecuzione simulata al prezzo di creazione: gli ordini che portano la cassa sotto zero vanno in Margin"""
+        cash = self.cash
+        size, price = self.size, self.price
+        while self.submitted:
+            order = self.submitted.popleft()
+            size, price, opened, closed = _update_position(size, price, order.size, order.price)
+            if closed:
+                cash += -closed * order.price
+                cash -= abs(closed) * self.commission * order.price
+            if opened:
+                cash -= opened * order.price
+                cash -= abs(opened) * self.commission * order.price
+            if cash >= 0.0:
+                self.pending.append(order)
+                continue
+            order.alive = False
+            self._ococheck(order)
+
+    def _try_exec(self, order: _Order, t: int):
+        data = self.data
+        if not order.stop:
+            if t > order.bar:
+                self._execute(order, float(data.open[t]))
+        elif order.size > 0:
+            if data.open[t] >= order.price:
+                self._execute(order, float(data.open[t]))
+            elif data.high[t] >= order.price:
+                self._execute(order, order.price)
+        else:
+            if data.open[t] <= order.price:
+                self._execute(order, float(data.open[t]))
+            elif data.low[t] <= order.price:
+                self._execute(order, order.price)
+
+    def _execute(self, order: _Order, price: float):
+        pprice_orig = self.price
+        psize, pprice, opened, closed = _update_position(self.size, self.price, order.size, price)
+        pnl = -closed * (price - pprice_orig)
+
+        cash = self.cash
+        closedcomm = openedcomm = 0.0
+        if closed:
+            cash += -closed * pprice_orig + pnl
+            closedcomm = abs(closed) * self.commission * price
+            cash -= closedcomm
+            self.cash = cash
+
+        popened = opened
+        if opened:
+            cash -= opened * price
+            openedcomm = abs(opened) * self.commission * price
+            cash -= openedcomm
+            if cash < 0.0:
+                opened = 0
+                openedcomm = 0.0
+            else:
+                self.cash = cash
+
+        order.alive = False  # completato, oppure margin sulla parte da aprire
+        execsize = closed + opened
+        if execsize:
+            self.size, self.price, _, _ = _update_position(self.size, self.price, execsize, price)
+            self._update_trades(closed, closedcomm, opened, openedcomm, pnl)
+            self._ococheck(order)
+        if popened and not opened:
+            self._ococheck(order)
+
+    def _update_trades(self, closed, closedcomm, opened, openedcomm, pnl):
+        """Strategy._addnotification + Trade.update: pnl solo sulle riduzioni, commissioni di apertura e chiusura"""
+        if self.trade is None:
+            self.trade = [0.0, 0.0, 0.0, False]
+        if closed:
+            self._trade_update(closed, closedcomm, pnl)
+        if opened:
+            if self.trade[3]:
+                self.trade = [0.0, 0.0, 0.0, False]
+            self._trade_update(opened, openedcomm, pnl)
+
+    def _trade_update(self, size, commission, pnl):
+        trade = self.trade
+        trade[2] += commission
+        oldsize = trade[0]
+        trade[0] += size
+        trade[3] = bool(oldsize and not trade[0])
+        if abs(trade[0]) <= abs(oldsize):
+            trade[1] += pnl
+        if trade[3]:
+            self.trades_pnlcomm.append(trade[1] - trade[2])
+
+    def _first_trigger(self, order: _Order, lo: int, hi: int) -> int:
+        """prima barra in [lo, hi) che tocca lo stop pendente, hi se nessuna"""
+        chunk = 64
+        while lo < hi:
+            end = min(hi, lo + chunk)
+            if order.size > 0:
+                hit = self.data.high[lo:end] >= order.price
+            else:
+                hit = self.data.low[lo:end] <= order.price
+            if hit.any():
+                return lo + int(hit.argmax())
+            lo = end
+            chunk *= 4
+        return hi
+
+    def _values(self) -> np.ndarray:
+        """valore del portafoglio a fine barra: cash + size * close, a tratti costanti tra le barre con esecuzioni"""
+        n = len(self.data.close)
+        bars = np.array([0] + [c[0] for c in self._changes], dtype=np.int64)
+        cash = np.array([self.start_cash] + [c[1] for c in self._changes], dtype=np.float64)
+        size = np.array([0.0] + [c[2] for c in self._changes], dtype=np.float64)
+        lengths = np.diff(np.r_[bars, n])
+        return np.repeat(cash, lengths) + np.repeat(size, lengths) * self.data.close
+
+
+def _average(x, bessel=False) -> float:
+    return math.fsum(x) / (len(x) - bessel)
+
+
+def _standarddev(x, avgx: float, bessel=False) -> float:
+    return math.sqrt(_average((np.asarray(x) - avgx) ** 2.0, bessel=bessel))
+
+
+def new_periods(timestamp: np.ndarray, timeframe: int, compression: int = 1) -> np.ndarray:
+    """
+    True sulle barre che aprono un periodo degli analyzer TimeFrameAnalyzerBase ( Returns, VWR, TimeReturn ).
+    Un periodo nuovo inizia solo se la chiave supera la massima vista: come _get_subday_cmpkey l'ultimo blocco
+    del giorno torna a inizio giornata e resta nel periodo precedente ( es. 23:00 con 22:00 su 1h ).
+    """
+    if timeframe == bt.TimeFrame.Minutes:
+        minute = (timestamp % NS_PER_DAY) // NS_PER_MINUTE
+        point = (minute // compression + 1) * compression
+        point = (point // 60 % 24) * 60 + point % 60
+        cmpkey = timestamp - timestamp % NS_PER_DAY + (point - 1) * NS_PER_MINUTE
+    elif timeframe == bt.TimeFrame.Days:
+        cmpkey = timestamp // NS_PER_DAY
+    else:
+        raise Exception(f"{bt.TimeFrame.getname(timeframe)}: timeframe not supported")
+    return np.r_[True, cmpkey[1:] > np.maximum.accumulate(cmpkey)[:-1]]
+
+
+class StatsPeriods(NamedTuple):
+    new: np.ndarray  # barre che aprono un periodo di Returns/VWR ( timeframe dei dati )
+    day_last: np.ndarray  # ultima barra di ogni giorno ( TimeReturn giornaliero di SharpeRatio )
+    tann: float  # annualizzazione di Returns per il timeframe dei dati
+
+
+def stats_periods(timestamp: np.ndarray, timeframe: int, compression: int = 1) -> StatsPeriods:
+    return StatsPeriods(
+        new=new_periods(timestamp, timeframe, compression),
+        day_last=np.r_[new_periods(timestamp, bt.TimeFrame.Days)[1:], True],
+        tann=bt.analyzers.Returns._TANN.get(timeframe, 1.0),
+    )
+
+
+def fast_stats(values: np.ndarray, trades_pnlcomm: List[float], start_cash: float, periods: StatsPeriods,
+               metrics: Iterable[str] = STATS) -> dict:
+    """
+    pnl, sqn, vwr, sharpe_ratio e winrate ( solo quelle in `metrics` ) calcolate come gli analyzer usati da
+    OptunaOptimizeStrategy.backtest: SharpeRatio giornaliero, VWR sui periodi del timeframe dei dati, SQN e
+    TradeAnalyzer sui pnlcomm dei trade chiusi. Come in backtest, winrate senza trade persi solleva un'eccezione.
+    """
+    stats = {}
+    if 'pnl' in metrics:
+        stats['pnl'] = float(values[-1]) - start_cash
+
+    pnl = np.asarray(trades_pnlcomm, dtype=np.float64)
+    if 'sqn' in metrics:
+        if len(pnl) > 1:
+            pnl_av = _average(pnl)
+            try:
+                stats['sqn'] = math.sqrt(len(pnl)) * pnl_av / _standarddev(pnl, pnl_av)
+            except ZeroDivisionError:
+                stats['sqn'] = None
+        else:
+            stats['sqn'] = 0
+
+    if 'vwr' in metrics:
+        # VWR annota il valore prima di controllare il cambio di periodo: restano i valori delle barre che aprono un
+        # periodo ( piu' l'ultima barra ), quelli delle altre barre vengono sovrascritti
+        new = periods.new
+        pns = values[new] if new[-1] else np.r_[values[new], values[-1]]
+        nlrtot = values[-1] / start_cash
+        rtot = math.log(nlrtot) if nlrtot >= 0.0 else float('-inf')
+        ravg = rtot / np.count_nonzero(new)
+        rnorm100 = (math.expm1(ravg * periods.tann) if ravg > float('-inf') else ravg) * 100.0
+        pis = np.r_[start_cash, pns[:-1]]
+        dts = pns / (pis * np.exp(ravg * np.arange(1, len(pns) + 1))) - 1.0
+        sdev = _standarddev(dts, _average(dts), bessel=True)
+        stats['vwr'] = rnorm100 * (1.0 - pow(sdev / 2.0, 0.2))
+
+    if 'sharpe_ratio' in metrics:
+        # TimeReturn invece aggiorna il rendimento del giorno ad ogni barra: conta l'ultima barra del giorno
+        day_values = values[periods.day_last]
+        returns = day_values / np.r_[start_cash, day_values[:-1]] - 1.0
+        rate = pow(1.0 + 0.01, 1.0 / 252) - 1.0
+        sharpe_ratio = None
+        if len(returns):
+            ret_free = returns - rate
+            ret_free_avg = _average(ret_free)
+            try:
+                sharpe_ratio = ret_free_avg / _standarddev(ret_free, ret_free_avg)
+            except ZeroDivisionError:
+                pass
+        stats['sharpe_ratio'] = sharpe_ratio
+
+    if 'winrate' in metrics:
+        won = int(np.count_nonzero(pnl >= 0.0))
+        lost = len(pnl) - won
+        stats['winrate'] = (won / lost) * 100
+    return stats
+
+
+class FastBacktester(object):
+    """
+    Dati, indicatori e periodi degli analyzer preparati una volta sola per strategia e intervallo: ogni run()
+    valuta un set di parametri e gli indicatori uguali tra set diversi ( stessa ema, stesso mfi ) vengono
+    calcolati una volta sola ( `indicators.hits` / `indicators.misses` ).
+    Gli indicatori passano anche da `indicator_cache`, condivisa da tutti i FastBacktester del processo: i trial
+    successivi sugli stessi dati li ritrovano li' ( `indicators.shared` ).
+    """
+    # None: indicatori condivisi solo tra i run dello stesso FastBacktester
+    indicator_cache = IndicatorCache()
+    # impronte gia' calcolate per ( sorgente, date_from, date_to ): ogni trial ricrea il FastBacktester sugli stessi
+    # dati ( in sola lettura, come quelli di DatasetCache ) e l'hash di milioni di candele costa quanto un run
+    _fingerprints = {}
+    _fingerprints_lock = threading.Lock()
+
+    def __init__(self,
+                 df: Union[pd.DataFrame, MappedOHLCV],
+                 strategy: Type[BaseStrategy],
+                 date_from: datetime = None,
+                 date_to: datetime = None,
+                 perc_size=10,
+                 commission=0.00075,
+                 start_cash=1000.0,
+                 metrics: Iterable[str] = STATS):
+        if not fast_supported(strategy):
+            raise Exception(f"{strategy.__name__}: fast backtest not supported")
+        unknown = set(metrics) - set(STATS)
+        if unknown:
+            raise Exception(f"{sorted(unknown)}: metrics not supported by the fast backtest")
+        self.strategy = strategy
+        self.metrics = tuple(metrics)
+        self.perc_size = perc_size
+        self.commission = commission
+        self.start_cash = start_cash
+        self.data = fast_data(df, date_from, date_to)
+        cache = self.indicator_cache
+        dataset = self._fingerprint(df, date_from, date_to) if cache is not None else None
+        self.indicators = SharedIndicators(self.data, cache, dataset)
+        # ( indicatori richiesti, indicatori calcolati ) dall'ultimo run()
+        self.last_lookups = (0, 0)
+        timeframe, compression = infer_timeframe(bar_delta(self.data.timestamp))
+        self.timeframe = (timeframe, compression)
+        self.periods = stats_periods(self.data.timestamp, timeframe, compression)
+        # sottointervalli di run_periods: ( date_from, date_to ) -> ( start, end, dati, periodi degli analyzer )
+        self._slices: Dict[tuple, Tuple[int, int, FastData, StatsPeriods]] = {}
+
+    def _fingerprint(self, df, date_from, date_to) -> str:
+        key = (id(df), date_from, date_to)
+        with self._fingerprints_lock:
+            entry = self._fingerprints.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+        result = fingerprint(self.data)
+        with self._fingerprints_lock:
+            self._fingerprints[key] = (weakref.ref(df), result)
+        weakref.finalize(df, self._fingerprints.pop, key, None)
+        return result
+
+    def run(self, **kwargs) -> dict:
+        p = self.strategy.fast_params(**kwargs)
+        lookups, misses = self.indicators.lookups, self.indicators.misses
+        long_signal, short_signal = self.strategy.fast_signals(self.data, p, self.indicators)
+        self.last_lookups = (self.indicators.lookups - lookups, self.indicators.misses - misses)
+        # prima chiamata a next(): quando tutti gli indicatori della strategia hanno un valore
+        start = max(first_valid(long_signal), first_valid(short_signal))
+
+        broker = FastBroker(self.data, perc_size=self.perc_size, commission=self.commission,
+                            start_cash=self.start_cash)
+        values = broker.run(long_signal, short_signal, start, p.stop_loss)
+        return fast_stats(values, broker.trades_pnlcomm, self.start_cash, self.periods, self.metrics)
+
+    def run_periods(self, time_periods: List[Tuple[datetime, datetime]], **kwargs) -> Iterator[dict]:
+        """
+        stats di ogni periodo ( date_from, date_to ) con segnali e indicatori calcolati una volta sola su tutti i dati
+        del tester: un periodo parte con gli indicatori gia' caldi dalle candele precedenti invece di riscaldarli
+        da zero, il broker e le statistiche sono quelli di un backtest del solo periodo.
+        Generatore: i periodi sono valutati uno alla volta e un errore interrompe solo quelli successivi.
+        """
+        p = self.strategy.fast_params(**kwargs)
+        lookups, misses = self.indicators.lookups, self.indicators.misses
+        long_signal, short_signal = self.strategy.fast_signals(self.data, p, self.indicators)
+        self.last_lookups = (self.indicators.lookups - lookups, self.indicators.misses - misses)
+        first = max(first_valid(long_signal), first_valid(short_signal))
+
+        for date_from, date_to in time_periods:
+            start, end, data, periods = self._slice(date_from, date_to)
+            broker = FastBroker(data, perc_size=self.perc_size, commission=self.commission,
+                                start_cash=self.start_cash)
+            values = broker.run(long_signal[start:end], short_signal[start:end], max(first - start, 0), p.stop_loss)
+            yield fast_stats(values, broker.trades_pnlcomm, self.start_cash, periods, self.metrics)
+
+    def _slice(self, date_from: datetime, date_to: datetime) -> Tuple[int, int, FastData, StatsPeriods]:
+        key = (date_from, date_to)
+        if key not in self._slices:
+            start, end = date_bounds(self.data.timestamp, date_from, date_to)
+            if start == end:
+                raise Exception(f"{date_from} - {date_to}: no data")
+            data = FastData(*(column[start:end] for column in self.data))
+            self._slices[key] = (start, end, data, stats_periods(data.timestamp, *self.timeframe))
+        return self._slices[key]
+
+
+def fast_backtest(
+        df: Union[pd.DataFrame, MappedOHLCV],
+        strategy: Type[BaseStrategy],
+        date_from: datetime = None,
+        date_to: datetime = None,
+        perc_size=10,
+        commission=0.00075,
+        start_cash=1000.0,
+        metrics: Iterable[str] = STATS,
+        **kwargs
+) -> dict:
+    """
+    Stesse opzioni di backtest_strategy per le strategie con `fast_signals`: i segnali sono array interi e il
+    broker viene simulato solo sulle barre con eventi. Ritorna il dizionario stats di OptunaOptimizeStrategy.
+    """
+    return FastBacktester(df, strategy, date_from, date_to, perc_size, commission, start_cash,
+                          metrics).run(**kwargs)
@@ -0,0 +1,124 @@
+"""Cache degli indicatori NumPy indirizzata per contenuto: ( impronta del dataset, indicatore, parametri )"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+__all__ = ['IndicatorCache', 'fingerprint']
+
+
+def fingerprint(data) -> str:
+    """impronta dei dati ( namedtuple di array, es. FastData ): uguale per candele uguali, ovunque siano state lette"""
+    digest = hashlib.blake2b(digest_size=16)
+    for name in data._fields:
+        column = np.ascontiguousarray(getattr(data, name))
+        digest.update(f'{name}:{column.dtype.str}:{len(column)};'.encode())
+        digest.update(column.data)
+    return digest.hexdigest()
+
+
+class IndicatorCache(object):
+    """
+    Cache LRU di processo degli indicatori calcolati da SharedIndicators, limitata a `max_bytes`.
+    La chiave e' ( impronta del dataset, ricetta dell'indicatore ): trial diversi sugli stessi dati riusano le stesse
+    ema/sma/mfi invece di ricalcolarle. Con `data_dir` gli indicatori vengono anche salvati in `.npy` e ritrovati
+    da altri processi o da ottimizzazioni successive.
+    Gli array ritornati sono condivisi: vanno trattati in sola lettura.
+    """
+    # da incrementare quando cambia il calcolo di un indicatore: invalida i file gia' salvati
+    VERSION = 2
+
+    def __init__(self, max_bytes: int = 512 << 20, data_dir: str = None):
+        self.max_bytes = max_bytes
+        self.data_dir = data_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def get(self, dataset: str, recipe: tuple) -> Optional[np.ndarray]:
+        key = (dataset, recipe)
+        with self._lock:
+            array = self._entries.get(key)
+            if array is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return array
+        array = self._load(key)
+        with self._lock:
+            if array is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._put(key, array)
+        return array
+
+    def put(self, dataset: str, recipe: tuple, array: np.ndarray):
+        key = (dataset, recipe)
+        self._put(key, array)
+        self._save(key, array)
+
+    def _put(self, key, array: np.ndarray):
+        size = array.nbytes
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old.nbytes
+            if size > self.max_bytes:
+                return
+            while self._entries and self._size + size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+            self._entries[key] = array
+            self._size += size
+
+    def path(self, key) -> str:
+        name = hashlib.blake2b(repr((self.VERSION,) + key).encode(), digest_size=16).hexdigest()
+        return os.path.join(self.data_dir, f'{name}.npy')
+
+    def _load(self, key) -> Optional[np.ndarray]:
+        if not self.data_dir:
+            return None
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            array = np.load(path)
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"{path}: unreadable indicator cache file ({e})")
+            return None
+        array.flags.writeable = False
+        return array
+
+    def _save(self, key, array: np.ndarray):
+        if not self.data_dir:
+            return
+        os.makedirs(self.data_dir, exist_ok=True)
+        path = self.path(key)
+        # scrittura atomica: piu' processi possono salvare lo stesso indicatore insieme
+        fd, tmpfn = tempfile.mkstemp(dir=self.data_dir)
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array, allow_pickle=False)
+        os.replace(tmpfn, path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self._size}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
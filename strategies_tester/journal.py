@@ -0,0 +1,113 @@
+"""Journal dei batch scaricati: ogni batch e' su disco prima di essere compattato nella cache"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from strategies_tester.cache import CacheBackend, NpyCache
+
+__all__ = ['SyncJournal']
+
+
+class SyncJournal(object):
+    """
+    Segmenti di append per un dataset della cache, in `{data_dir}/{name}.journal/`.
+    `write()` salva subito il batch come segmento NpyCache ( directory rinominata atomicamente, quindi un segmento o
+    e' completo o non esiste ); `commit()` accoda i segmenti alla cache e solo dopo li cancella. Se il processo muore
+    prima del commit, i segmenti rimasti vengono riapplicati da `recover()`: l'append della cache sostituisce i
+    timestamp duplicati, quindi riapplicare un segmento gia' compattato non cambia il dataset.
+    Tiene anche l'elenco dei buchi gia' riscaricati ( `gaps.json` ) per non richiederli di nuovo all'exchange.
+    """
+    SEGMENT_RE = re.compile(r'^(\d{8})\.npyd$')
+    GAPS_FILENAME = 'gaps.json'
+
+    def __init__(self, cache: CacheBackend, name: str):
+        self.cache = cache
+        self.name = name
+        self.path = os.path.join(cache.data_dir, f'{name}.journal')
+        self.logger = logging.getLogger(__name__)
+        self._segments = NpyCache(self.path)
+        self._lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        segments = self.segments()
+        self._seq = int(segments[-1]) + 1 if segments else 0
+
+    def segments(self) -> List[str]:
+        if not os.path.exists(self.path):
+            return []
+        names = [m.group(1) for m in (self.SEGMENT_RE.match(f) for f in os.listdir(self.path)) if m]
+        return sorted(names)
+
+    def write(self, df: pd.DataFrame):
+        if len(df) == 0:
+            return
+        with self._lock:
+            seq = self._seq
+            self._seq += 1
+        os.makedirs(self.path, exist_ok=True)
+        self._segments.save(f'{seq:08d}', df)
+
+    def last_timestamp(self) -> Optional[pd.Timestamp]:
+        last = None
+        for segment in self.segments():
+            ts = np.load(os.path.join(self._segments.path(segment), f'{NpyCache.TIMESTAMP_COLUMN}.npy'),
+                         mmap_mode='r')
+            if len(ts) and (last is None or ts[-1] > last):
+                last = int(ts[-1])
+        return None if last is None else pd.Timestamp(last, tz='UTC')
+
+    def commit(self) -> int:
+        """compatta nella cache i segmenti presenti; ritorna il numero di righe applicate"""
+        with self._commit_lock:
+            segments = self.segments()
+            if not segments:
+                return 0
+            frames = [self._segments.load(segment) for segment in segments]
+            df = pd.concat(frames, sort=False) if len(frames) > 1 else frames[0]
+            self.cache.append(self.name, df)
+            for segment in segments:
+                shutil.rmtree(self._segments.path(segment))
+            return len(df)
+
+    def recover(self) -> int:
+        """da chiamare prima di scaricare: riapplica i segmenti rimasti da un'esecuzione interrotta"""
+        if os.path.exists(self.path):
+            self._cleanup()
+        rows = self.commit()
+        if rows:
+            self.logger.info(f"{self.name}: recovered {rows} rows from journal")
+        return rows
+
+    def checked_gaps(self) -> set:
+        path = os.path.join(self.path, self.GAPS_FILENAME)
+        if not os.path.exists(path):
+            return set()
+        with open(path) as fd:
+            return {tuple(gap) for gap in json.load(fd)}
+
+    def mark_gap_checked(self, start: pd.Timestamp, end: pd.Timestamp):
+        gaps = self.checked_gaps()
+        gaps.add((int(start.value), int(end.value)))
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmpfn = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(sorted(gaps), f)
+        os.replace(tmpfn, os.path.join(self.path, self.GAPS_FILENAME))
+
+    def _cleanup(self):
+        # directory temporanee lasciate da un crash durante write() ( mai in parallelo a write )
+        for filename in os.listdir(self.path):
+            path = os.path.join(self.path, filename)
+            if filename.startswith('tmp') and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
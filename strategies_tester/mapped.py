@@ -0,0 +1,76 @@
+"""Dataset OHLCV in sola lettura memory-mapped, condivisibile tra processi senza copie"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from strategies_tester.cache import NpyCache
+
+__all__ = ['MappedOHLCV']
+
+
+class MappedOHLCV(object):
+    """
+    Timestamp ( int64 ns UTC ) e colonne OHLCV ( float64 ) aperti con `np.load(mmap_mode='r')`.
+    Il pickle contiene solo il percorso: un processo worker che lo riceve si riaggancia agli stessi file e le pagine
+    vengono condivise dalla page cache del sistema operativo.
+    """
+    TIMESTAMP_COLUMN = NpyCache.TIMESTAMP_COLUMN
+    COLUMNS = tuple(NpyCache.OHLCV_COLUMNS)
+
+    def __init__(self, path: str):
+        self.path = path
+        self._attach()
+
+    @classmethod
+    def create(cls, df: pd.DataFrame, path: str) -> 'MappedOHLCV':
+        data_dir, filename = os.path.split(path)
+        writer = NpyCache(data_dir)
+        name = filename[:-len('.npyd')] if filename.endswith('.npyd') else filename
+        writer.save(name, df[list(cls.COLUMNS)])
+        return cls(writer.path(name))
+
+    @classmethod
+    def fingerprint(cls, df: pd.DataFrame) -> str:
+        """impronta di timestamp e colonne OHLCV: cambia se cambia una candela, anche a parita' di primo e ultimo"""
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(np.ascontiguousarray(NpyCache._timestamps(df.index)).data)
+        for column in cls.COLUMNS:
+            digest.update(np.ascontiguousarray(df[column].to_numpy(dtype=np.float64)).data)
+        return digest.hexdigest()
+
+    def _attach(self):
+        self.timestamp = np.load(os.path.join(self.path, f'{self.TIMESTAMP_COLUMN}.npy'), mmap_mode='r')
+        for column in self.COLUMNS:
+            setattr(self, column, np.load(os.path.join(self.path, f'{column}.npy'), mmap_mode='r'))
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._attach()
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    @property
+    def start(self) -> pd.Timestamp:
+        return pd.Timestamp(int(self.timestamp[0]), tz='UTC')
+
+    @property
+    def end(self) -> pd.Timestamp:
+        return pd.Timestamp(int(self.timestamp[-1]), tz='UTC')
+
+    @property
+    def index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(np.asarray(self.timestamp), tz='UTC', name=self.TIMESTAMP_COLUMN)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """copia in memoria come DataFrame ( per plot o analisi, non per i worker )"""
+        return pd.DataFrame({c: np.array(getattr(self, c)) for c in self.COLUMNS}, index=self.index)
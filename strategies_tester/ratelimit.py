@@ -0,0 +1,51 @@
+"""Rate limiter token-bucket condiviso tra i thread che interrogano lo stesso exchange"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import threading
+import time
+
+__all__ = ['TokenBucket']
+
+
+class TokenBucket(object):
+    """
+    `rate` richieste al secondo con burst massimo `capacity`.
+    `backoff()` va chiamato quando l'exchange risponde 'too many requests': blocca tutti i thread per un tempo che
+    raddoppia ad ogni errore consecutivo ( fino a `max_backoff` ) e si azzera alla prima richiesta andata a buon fine.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1, min_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._backoff = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if now >= self._blocked_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = max(self._blocked_until - now, (tokens - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def backoff(self) -> float:
+        with self._lock:
+            self._backoff = min(self.max_backoff, self._backoff * 2 if self._backoff else self.min_backoff)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + self._backoff)
+            self._tokens = 0.0
+            return self._backoff
+
+    def reset_backoff(self):
+        with self._lock:
+            self._backoff = 0.0
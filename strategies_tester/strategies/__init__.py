@@ -1,6 +1,7 @@
 from ._base import BaseStrategy
 from ._cross import *
 from ._ema_slope import *
+from ._events import *
 from ._mfi import *
 from ._optimize import *
 from ._rsi2 import *
@@ -9,8 +9,13 @@ __author__ = "Liquidator"
 __copyright__ = "Copyright 2020, Liquidator"
 
 import logging
+from types import SimpleNamespace
+from typing import Callable, Optional, Tuple
 
 import backtrader as bt
+import numpy as np
+
+from ._events import EventRecorder
 
 __all__ = ['BaseStrategy']
 
@@ -21,21 +26,98 @@ class BaseStrategy(bt.SignalStrategy):
         ('_accumulate', False),
         ('_concurrent', False),
         ('_data', None),
-        ('verbose', True)
+        ('verbose', True),
+        # checkpoint( strategy, bar ) chiamato ogni `checkpoint_bars` barre: se ritorna True il backtest si ferma
+        # ( es. pruning di optuna ) e gli analyzer chiudono con le statistiche parziali
+        ('checkpoint', None),
+        ('checkpoint_bars', 0),
+        # ordini, esecuzioni e trade chiusi in `self.events` ( EventRecorder ); None: solo con verbose
+        ('record_events', None)
     )
 
     def __init__(self):
         super().__init__()
         self.logger = logging.getLogger(__name__)
-        self.trades = []
+        record = self.p.verbose if self.p.record_events is None else self.p.record_events
+        self.events = EventRecorder() if record else None
+        # deciso una volta sola: con verbose=False ( ottimizzazioni ) le notifiche non formattano nulla
+        self.log_enabled = bool(self.p.verbose) and self.logger.isEnabledFor(logging.INFO)
+        # barra a cui un checkpoint ha fermato il backtest ( None: arrivato alla fine dei dati )
+        self.stopped_at = None
+
+    def start(self):
+        super().start()
+        # cerebro sceglie tra runonce e runnext solo dopo lo start delle strategie: se un indicatore ha solo next()
+        # ( once simulato barra per barra ) si torna al ciclo evento per evento
+        if self.env._dorunonce and not self.runonce_supported():
+            self.logger.debug(f"{type(self).__name__}: next() only indicators, runonce disabled")
+            self.env._dorunonce = False
+
+    def _next_signal(self):
+        # le strategie mandano gli ordini da next(): senza segnali registrati SignalStrategy valuta comunque una
+        # ventina di all() ad ogni barra per non fare nulla
+        if any(self._signals.values()):
+            super()._next_signal()
+
+    def _next_analyzers(self, minperstatus, once=False):
+        super()._next_analyzers(minperstatus, once=once)
+        # dopo next() e gli analyzer della barra, sia in runonce che in runnext
+        if self.p.checkpoint is None or not self.p.checkpoint_bars or minperstatus >= 0 or len(self) % self.p.checkpoint_bars:
+            return
+        if self.p.checkpoint(self, len(self)):
+            self.stopped_at = len(self)
+            self.env.runstop()
+
+    def runonce_supported(self) -> bool:
+        """True se tutti gli indicatori ( anche annidati ) hanno un once() vettoriale"""
+        pending = list(self._lineiterators[bt.LineIterator.IndType])
+        while pending:
+            indicator = pending.pop()
+            if getattr(type(indicator), 'once', None) is bt.Indicator.once_via_next:
+                return False
+            pending.extend(getattr(indicator, '_lineiterators', {}).get(bt.LineIterator.IndType, []))
+        return True
+
+    @classmethod
+    def fast_params(cls, **kwargs) -> SimpleNamespace:
+        """parametri della strategia ( default + kwargs ) con lo stesso accesso di `self.p`"""
+        params = dict(cls.params._getitems())
+        unknown = set(kwargs) - set(params)
+        if unknown:
+            raise Exception(f"{cls.__name__}: unknown parameters {sorted(unknown)}")
+        params.update(kwargs)
+        return SimpleNamespace(**params)
+
+    @classmethod
+    def fast_signals(cls, data, p: SimpleNamespace, ind) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Segnali long e short come array interi ( NaN prima del minperiod ) per strategies_tester.fastbacktest.
+        `data` ha gli array timestamp/open/high/low/close/volume, gli indicatori si chiedono a `ind`
+        ( _np_indicators.SharedIndicators ) per condividerli tra parametri diversi. None se non supportata.
+        """
+        return None
+
+    @classmethod
+    def stream_signals(cls, p: SimpleNamespace) -> Optional[Callable]:
+        """
+        Segnali una barra alla volta per strategies_tester.streaming: ritorna `push(bar) -> ( long, short )` che
+        aggiorna indicatori incrementali ( _stream_indicators ) con lo stato minimo, stessi valori di `fast_signals`.
+        `bar` ha gli attributi open/high/low/close/volume ( es. una riga di `df.itertuples()` ). None se non supportata.
+        """
+        return None
 
     def log(self, txt, dt=None):
+        if not self.log_enabled:
+            return
         dt = dt or self.datas[0].datetime.date(0)
-        if self.p.verbose:
-            self.logger.info(f'{dt.isoformat()}, {txt}')
+        self.logger.info(f'{dt.isoformat()}, {txt}')
 
     def notify_order(self, order):
         super().notify_order(order)
+        if self.events is not None:
+            self.events.order(order, len(self), self.datas[0].datetime[0])
+        if not self.log_enabled:
+            return
         price = f'{order.executed.price:.2f}'
         value = f'{order.executed.value:.2f}'
         comm = f'{order.executed.comm:.2f}'
@@ -59,7 +141,9 @@ class BaseStrategy(bt.SignalStrategy):
 
     def notify_trade(self, trade):
         super().notify_trade(trade)
-        if not trade.isclosed:
+        if self.events is not None and trade.isclosed:
+            self.events.trade(trade)
+        if not self.log_enabled or not trade.isclosed:
             return
         pnl = f'{trade.pnl:.2f}'
         pnlcomm = f'{trade.pnlcomm:.2f}'
@@ -11,8 +11,12 @@ from __future__ import (
 __author__ = "Liquidator"
 __copyright__ = "Copyright 2020, Liquidator"
 
+import operator
+
 import backtrader as bt
 
+from . import _np_indicators as npi
+from . import _stream_indicators as si
 from ._base import BaseStrategy
 from ._indicators import MFI
 
@@ -73,6 +77,75 @@ class CrossStrategy(BaseStrategy):
         self.market_order = None
         self.stop_order = None
 
+    @classmethod
+    def fast_signals(cls, data, p, ind):
+        if p.ma_fast_type == 'sma':
+            ma_fast = ind(npi.sma, data.close, p.ma_fast_period)
+        elif p.ma_fast_type == 'ema':
+            ma_fast = ind(npi.ema, data.close, p.ma_fast_period)
+        else:
+            raise Exception(f"{p.ma_fast_type}: not valid value for 'ma_fast_type'")
+
+        if p.ma_slow_type == 'sma':
+            ma_slow = ind(npi.sma, data.close, p.ma_slow_period)
+        elif p.ma_slow_type == 'ema':
+            ma_slow = ind(npi.ema, data.close, p.ma_slow_period)
+        else:
+            raise Exception(f"{p.ma_slow_type}: not valid value for 'ma_slow_type'")
+
+        long_signal = ind(npi.cross_up, ma_fast, ma_slow)
+        short_signal = ind(npi.cross_down, ma_fast, ma_slow)
+
+        if p.use_filter_fast:
+            long_signal = npi.logic_and(long_signal, npi.compare(operator.gt, data.close, ma_fast))
+            short_signal = npi.logic_and(short_signal, npi.compare(operator.lt, data.close, ma_fast))
+
+        if p.use_mfi:
+            mfi = ind(npi.mfi, data.high, data.low, data.close, data.volume)
+            long_signal = npi.logic_and(long_signal, npi.compare(operator.ge, mfi, p.mfi_high))
+            short_signal = npi.logic_and(short_signal, npi.compare(operator.lt, mfi, p.mfi_low))
+
+        return long_signal, short_signal
+
+    @classmethod
+    def stream_signals(cls, p):
+        if p.ma_fast_type == 'sma':
+            ma_fast = si.SMA(p.ma_fast_period)
+        elif p.ma_fast_type == 'ema':
+            ma_fast = si.EMA(p.ma_fast_period)
+        else:
+            raise Exception(f"{p.ma_fast_type}: not valid value for 'ma_fast_type'")
+
+        if p.ma_slow_type == 'sma':
+            ma_slow = si.SMA(p.ma_slow_period)
+        elif p.ma_slow_type == 'ema':
+            ma_slow = si.EMA(p.ma_slow_period)
+        else:
+            raise Exception(f"{p.ma_slow_type}: not valid value for 'ma_slow_type'")
+
+        cross_up = si.CrossUp()
+        cross_down = si.CrossDown()
+        mfi = si.MFI() if p.use_mfi else None
+
+        def push(bar):
+            fast = ma_fast.push(bar.close)
+            slow = ma_slow.push(bar.close)
+            long_signal = cross_up.push(fast, slow)
+            short_signal = cross_down.push(fast, slow)
+
+            if p.use_filter_fast:
+                long_signal = si.logic_and(long_signal, si.compare(operator.gt, bar.close, fast))
+                short_signal = si.logic_and(short_signal, si.compare(operator.lt, bar.close, fast))
+
+            if mfi is not None:
+                value = mfi.push(bar.high, bar.low, bar.close, bar.volume)
+                long_signal = si.logic_and(long_signal, si.compare(operator.ge, value, p.mfi_high))
+                short_signal = si.logic_and(short_signal, si.compare(operator.lt, value, p.mfi_low))
+
+            return long_signal, short_signal
+
+        return push
+
     def next(self):
 
         if self.long_signal:
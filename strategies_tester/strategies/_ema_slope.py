@@ -17,8 +17,12 @@ __author__ = "Liquidator"
 __copyright__ = "Copyright 2020, Liquidator"
 __credits__ = ["The Crypto Gateway ( www.thecryptogateway.it )"]
 
+import operator
+
 import backtrader as bt
 
+from . import _np_indicators as npi
+from . import _stream_indicators as si
 from ._base import BaseStrategy
 from ._indicators import Slope
 
@@ -80,6 +84,61 @@ class EMASplopeStrategy(BaseStrategy):
         self.market_order = None
         self.stop_order = None
 
+    @classmethod
+    def fast_signals(cls, data, p, ind):
+        if p.slope_average == 'ema':
+            ma = ind(npi.ema, data.close, p.slope_ma_length)
+        elif p.slope_average == 'sma':
+            ma = ind(npi.sma, data.close, p.slope_ma_length)
+        else:
+            raise Exception(f"{p.slope_average}: not valid value for 'slope_average'")
+
+        slp = ind(npi.slope, ma)
+        emaslope_fast = ind(npi.ema, slp, p.slope_fast_length)
+        emaslope_slow = ind(npi.ema, slp, p.slope_slow_length)
+
+        long_signal = ind(npi.cross_up, emaslope_fast, emaslope_slow)
+        short_signal = ind(npi.cross_down, emaslope_fast, emaslope_slow)
+
+        if p.slope_trend_filter_enable:
+            trend_filter = ind(npi.ema, data.close, p.slope_trend_filter_length)
+            long_signal = npi.logic_and(long_signal, npi.compare(operator.gt, data.close, trend_filter))
+            short_signal = npi.logic_and(short_signal, npi.compare(operator.lt, data.close, trend_filter))
+
+        return long_signal, short_signal
+
+    @classmethod
+    def stream_signals(cls, p):
+        if p.slope_average == 'ema':
+            ma = si.EMA(p.slope_ma_length)
+        elif p.slope_average == 'sma':
+            ma = si.SMA(p.slope_ma_length)
+        else:
+            raise Exception(f"{p.slope_average}: not valid value for 'slope_average'")
+
+        slp = si.Slope()
+        emaslope_fast = si.EMA(p.slope_fast_length)
+        emaslope_slow = si.EMA(p.slope_slow_length)
+        cross_up = si.CrossUp()
+        cross_down = si.CrossDown()
+        trend_filter = si.EMA(p.slope_trend_filter_length) if p.slope_trend_filter_enable else None
+
+        def push(bar):
+            value = slp.push(ma.push(bar.close))
+            fast = emaslope_fast.push(value)
+            slow = emaslope_slow.push(value)
+            long_signal = cross_up.push(fast, slow)
+            short_signal = cross_down.push(fast, slow)
+
+            if trend_filter is not None:
+                trend = trend_filter.push(bar.close)
+                long_signal = si.logic_and(long_signal, si.compare(operator.gt, bar.close, trend))
+                short_signal = si.logic_and(short_signal, si.compare(operator.lt, bar.close, trend))
+
+            return long_signal, short_signal
+
+        return push
+
     def next(self):
 
         if self.long_signal and self.position.size <= 0:
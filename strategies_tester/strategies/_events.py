@@ -0,0 +1,116 @@
+"""
+Registro strutturato degli eventi di una strategia: ordini ( ogni cambio di stato ), esecuzioni e trade chiusi in
+array.array di double con i tipi delle colonne per l'export, senza stringhe ne' oggetti python per evento. Si esporta in DataFrame o Parquet
+per analizzare un backtest dopo la fine senza leggere i log.
+"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+from array import array
+from typing import Dict, Sequence, Tuple
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+__all__ = ['EventTable', 'EventRecorder']
+
+NAN = float('nan')
+
+# giorni tra il numero di backtrader ( date2num, giorni dal 0001-01-01 + 1 ) e il 1970-01-01
+EPOCH_NUM = 719163.0
+
+
+def num2timestamp(num: np.ndarray) -> pd.DatetimeIndex:
+    """bt.num2date vettoriale, arrotondato al millisecondo ( un float di giorni non e' preciso al microsecondo )"""
+    ms = np.round((num - EPOCH_NUM) * 86400e3).astype(np.int64)
+    return pd.to_datetime(ms, unit='ms', utc=True)
+
+
+class EventTable(object):
+    """
+    una riga per evento, tutte le colonne in un solo array.array di double ( riga dopo riga ): `append` e' un solo
+    extend in C. `columns` ( nome, dtype ) da' i tipi dell'export: interi e booleani sono esatti in un double
+    """
+    __slots__ = ('names', 'dtypes', 'values')
+
+    def __init__(self, columns: Sequence[Tuple[str, str]]):
+        self.names = tuple(name for name, _ in columns)
+        self.dtypes = tuple(dtype for _, dtype in columns)
+        self.values = array('d')
+
+    def append(self, *values):
+        self.values.extend(values)
+
+    def __len__(self) -> int:
+        return len(self.values) // len(self.names)
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.itemsize * len(self.values)
+
+    def to_numpy(self) -> Dict[str, np.ndarray]:
+        # copia: una vista sul buffer impedirebbe ad array.array di crescere
+        rows = np.array(self.values, dtype=np.float64).reshape(-1, len(self.names))
+        return {name: rows[:, i].astype(dtype) for i, (name, dtype) in enumerate(zip(self.names, self.dtypes))}
+
+
+class EventRecorder(object):
+    """
+    Eventi di BaseStrategy ( `strategy.events` ): `orders` una riga per notifica ( stato, prezzo e size richiesti,
+    totale eseguito ), `fills` una riga per esecuzione ( OrderExecutionBit ), `trades` una riga per trade chiuso.
+    Le date restano numeri di backtrader fino all'export.
+    """
+    ORDER_COLUMNS = (('datetime', 'f8'), ('bar', 'i8'), ('ref', 'i8'), ('buy', 'bool'), ('exectype', 'i1'),
+                     ('status', 'i1'), ('price', 'f8'), ('size', 'f8'), ('executed_price', 'f8'),
+                     ('executed_size', 'f8'), ('executed_value', 'f8'), ('executed_comm', 'f8'))
+    FILL_COLUMNS = (('datetime', 'f8'), ('bar', 'i8'), ('ref', 'i8'), ('price', 'f8'), ('size', 'f8'),
+                    ('value', 'f8'), ('comm', 'f8'), ('pnl', 'f8'))
+    TRADE_COLUMNS = (('ref', 'i8'), ('long', 'bool'), ('dtopen', 'f8'), ('dtclose', 'f8'), ('baropen', 'i8'),
+                     ('barclose', 'i8'), ('barlen', 'i8'), ('price', 'f8'), ('pnl', 'f8'), ('pnlcomm', 'f8'),
+                     ('commission', 'f8'))
+    DATETIME_COLUMNS = ('datetime', 'dtopen', 'dtclose')
+
+    def __init__(self):
+        self.orders = EventTable(self.ORDER_COLUMNS)
+        self.fills = EventTable(self.FILL_COLUMNS)
+        self.trades = EventTable(self.TRADE_COLUMNS)
+
+    def order(self, order: bt.Order, bar: int, dt: float):
+        created, executed = order.created, order.executed
+        # prezzo richiesto None per i market
+        price = NAN if created.price is None else created.price
+        self.orders.append(dt, bar, order.ref, order.ordtype == bt.Order.Buy, order.exectype, order.status, price,
+                           created.size, executed.price, executed.size, executed.value, executed.comm)
+        for exbit in executed.iterpending():
+            if exbit is None:
+                break
+            self.fills.append(exbit.dt, bar, order.ref, exbit.price, exbit.size, exbit.value, exbit.comm, exbit.pnl)
+
+    def trade(self, trade: bt.Trade):
+        self.trades.append(trade.ref, trade.long, trade.dtopen, trade.dtclose, trade.baropen, trade.barclose,
+                           trade.barlen, trade.price, trade.pnl, trade.pnlcomm, trade.commission)
+
+    def __len__(self) -> int:
+        return len(self.orders) + len(self.fills) + len(self.trades)
+
+    @property
+    def nbytes(self) -> int:
+        return self.orders.nbytes + self.fills.nbytes + self.trades.nbytes
+
+    def to_frame(self, table: str) -> pd.DataFrame:
+        """'orders', 'fills' o 'trades' come DataFrame, con date UTC e nomi di stato e tipo degli ordini"""
+        df = pd.DataFrame(getattr(self, table).to_numpy())
+        for column in self.DATETIME_COLUMNS:
+            if column in df:
+                df[column] = num2timestamp(df[column].to_numpy())
+        if 'status' in df:
+            df['status'] = pd.Categorical.from_codes(df['status'], categories=bt.Order.Status)
+            df['exectype'] = pd.Categorical.from_codes(df['exectype'], categories=bt.Order.ExecTypes)
+        return df
+
+    def to_parquet(self, path: str):
+        """un file per tabella, `{path}_orders.parquet` ecc. ( serve pyarrow o fastparquet, come per pandas )"""
+        for table in ('orders', 'fills', 'trades'):
+            self.to_frame(table).to_parquet(f'{path}_{table}.parquet', index=False)
@@ -9,10 +9,124 @@ __author__ = "Liquidator"
 __copyright__ = "Copyright 2020, Liquidator"
 
 import math
+from array import array
+from collections import deque
 
 import backtrader as bt
+import numpy as np
 
-__all__ = ['MFI', 'SuperTrendBand', 'SuperTrend', 'Slope', 'SlopeGrad', 'StochasticSlow', 'STC']
+from strategies_tester.strategies import _np_indicators
+
+__all__ = ['MFI', 'SuperTrendBand', 'SuperTrend', 'Slope', 'SlopeGrad', 'StochasticSlow', 'STC', 'RunningSumN',
+           'RunningHighest', 'RunningLowest']
+
+# periodo da cui le finestre Running* battono quelle di backtrader: sotto, fsum/max in C di pochi valori costano meno
+# del lavoro python per barra ( benchmarks/bench_rolling_windows.py ). Lo stesso di _np_indicators.sum_n
+RUNNING_MIN_PERIOD = _np_indicators.RUNNING_MIN_PERIOD
+
+
+def _once_from(line, values: np.ndarray, start: int, end: int):
+    """copia in `line` i valori calcolati su tutto l'array da una funzione di _np_indicators"""
+    line.array[start:end] = array('d', values[start:end])
+
+
+class RunningSumN(bt.Indicator):
+    """
+    bt.ind.SumN con una somma corrente: ad ogni barra entra un valore ed esce quello di `period` barre prima, la
+    somma esatta ( math.fsum come SumN ) viene ricalcolata ogni `period` barre per non accumulare errori.
+    Costo per barra indipendente dal periodo, anche in runonce ( _np_indicators.running_sum_n ).
+    """
+    lines = ('sumn',)
+    params = (('period', 1),)
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+        super(RunningSumN, self).__init__()
+
+    def nextstart(self):
+        self._sum = math.fsum(self.data.get(size=self.p.period))
+        self._bars = 0
+        self.l.sumn[0] = self._sum
+
+    def next(self):
+        self._bars += 1
+        if self._bars == self.p.period:
+            self.nextstart()
+            return
+        self._sum += self.data[0] - self.data[-self.p.period]
+        self.l.sumn[0] = self._sum
+
+    def once(self, start, end):
+        values = _np_indicators.running_sum_n(np.frombuffer(self.data.array), self.p.period)
+        _once_from(self.l.sumn, values, start, end)
+
+
+class _RunningExtreme(bt.Indicator):
+    """
+    finestra di RunningHighest / RunningLowest con una deque monotona: ( barra, valore ) ordinati da `_dominates`, il
+    primo e' l'estremo della finestra. Costo per barra ammortizzato O(1), in runonce estremo mobile O(n) di
+    `_extreme`. Senza `lines`: backtrader le eredita, ogni sottoclasse dichiara la sua
+    """
+    params = (('period', 1),)
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+        self._window = deque()
+        super(_RunningExtreme, self).__init__()
+
+    def _dominates(self, a: float, b: float) -> bool:
+        raise NotImplementedError()
+
+    def _push(self):
+        bar, value = len(self), self.data[0]
+        window = self._window
+        if value == value:  # i NaN prima del minperiod dei dati non entrano
+            while window and self._dominates(value, window[-1][1]):
+                window.pop()
+            window.append((bar, value))
+        while window and window[0][0] <= bar - self.p.period:
+            window.popleft()
+
+    def prenext(self):
+        self._push()
+
+    def next(self):
+        self._push()
+        self.lines[0][0] = self._window[0][1]
+
+    def once(self, start, end):
+        _once_from(self.lines[0], self._extreme(np.frombuffer(self.data.array), self.p.period), start, end)
+
+
+class RunningHighest(_RunningExtreme):
+    """bt.ind.Highest con la deque monotona di _RunningExtreme ( valori decrescenti )"""
+    lines = ('highest',)
+    _extreme = staticmethod(_np_indicators.highest)
+
+    def _dominates(self, a: float, b: float) -> bool:
+        return a >= b
+
+
+class RunningLowest(_RunningExtreme):
+    """bt.ind.Lowest con la deque monotona di _RunningExtreme ( valori crescenti )"""
+    lines = ('lowest',)
+    _extreme = staticmethod(_np_indicators.lowest)
+
+    def _dominates(self, a: float, b: float) -> bool:
+        return a <= b
+
+
+def _sum_n(data, period: int) -> bt.Indicator:
+    """SumN usata dagli indicatori: RunningSumN per i periodi lunghi, bt.ind.SumN per quelli corti ( stessi valori )"""
+    return (RunningSumN if period >= RUNNING_MIN_PERIOD else bt.ind.SumN)(data, period=period)
+
+
+def _highest(data, period: int) -> bt.Indicator:
+    return (RunningHighest if period >= RUNNING_MIN_PERIOD else bt.ind.Highest)(data, period=period)
+
+
+def _lowest(data, period: int) -> bt.Indicator:
+    return (RunningLowest if period >= RUNNING_MIN_PERIOD else bt.ind.Lowest)(data, period=period)
 
 
 class MFI(bt.Indicator):
@@ -23,8 +137,8 @@ class MFI(bt.Indicator):
         tprice = (self.data.close + self.data.low + self.data.high) / 3.0
         mfraw = tprice * self.data.volume
 
-        flowpos = bt.ind.SumN(mfraw * (tprice > tprice(-1)), period=self.p.period)
-        flowneg = bt.ind.SumN(mfraw * (tprice < tprice(-1)), period=self.p.period)
+        flowpos = _sum_n(mfraw * (tprice > tprice(-1)), self.p.period)
+        flowneg = _sum_n(mfraw * (tprice < tprice(-1)), self.p.period)
 
         mfiratio = bt.ind.DivByZero(flowpos, flowneg, zero=100.0)
         self.l.mfi = 100.0 - 100.0 / (1.0 + mfiratio)
@@ -61,6 +175,26 @@ class SuperTrendBand(bt.Indicator):
             else:
                 self.l.st_lower_level[0] = self.l.st_lower_level[-1]
 
+    def once(self, start, end):
+        basic_ub = self.l.basic_ub.array
+        basic_lb = self.l.basic_lb.array
+        upper = self.l.st_upper_level.array
+        lower = self.l.st_lower_level.array
+        close = self.data.close.array
+        for i in range(start, end):
+            if i == self.p.period:
+                upper[i] = basic_ub[i]
+                lower[i] = basic_lb[i]
+                continue
+            if basic_ub[i] < upper[i - 1] or close[i - 1] > upper[i - 1]:
+                upper[i] = basic_ub[i]
+            else:
+                upper[i] = upper[i - 1]
+            if basic_lb[i] > lower[i - 1] or close[i - 1] < lower[i - 1]:
+                lower[i] = basic_lb[i]
+            else:
+                lower[i] = lower[i - 1]
+
 
 class SuperTrend(bt.Indicator):
     """
@@ -103,6 +237,34 @@ class SuperTrend(bt.Indicator):
 
         # st := st == -1 and close > upper_level_prev ? 1 : st == 1 and close < lower_level_prev ? -1 : st
 
+    def once(self, start, end):
+        # stesso calcolo di next() sugli array: il primo valore e' sempre alla barra `period` ( minperiod della ATR )
+        upper = self.stb.st_upper_level.array
+        lower = self.stb.st_lower_level.array
+        super_trend = self.l.super_trend.array
+        st_trend = self.l.st_trend.array
+        close = self.data.close.array
+        for i in range(start, end):
+            if i == self.p.period:
+                super_trend[i] = upper[i]
+                continue
+
+            if super_trend[i - 1] == upper[i - 1]:
+                if close[i] <= upper[i]:
+                    super_trend[i] = upper[i]
+                    st_trend[i] = -1
+                else:
+                    super_trend[i] = lower[i]
+                    st_trend[i] = 1
+
+            if super_trend[i - 1] == lower[i - 1]:
+                if close[i] >= lower[i]:
+                    super_trend[i] = lower[i]
+                    st_trend[i] = 1
+                else:
+                    super_trend[i] = upper[i]
+                    st_trend[i] = -1
+
 
 class Slope(bt.Indicator):
     lines = ('slp',)
@@ -114,6 +276,12 @@ class Slope(bt.Indicator):
     def next(self):
         self.l.slp[0] = (self.data[0] - self.data[-1]) / self.data[0]
 
+    def once(self, start, end):
+        src = self.data.array
+        dst = self.l.slp.array
+        for i in range(start, end):
+            dst[i] = (src[i] - src[i - 1]) / src[i]
+
 
 class SlopeGrad(bt.Indicator):
     lines = ('slope',)
@@ -130,8 +298,15 @@ class SlopeGrad(bt.Indicator):
             (self.data[0] - self.data[-self.p.period]) / self.p.period
         )
 
+    def once(self, start, end):
+        src = self.data.array
+        dst = self.slope.array
+        period = self.p.period
+        for i in range(start, end):
+            dst[i] = 180 / math.pi * math.atan((src[i] - src[i - period]) / period)
+
 
-from backtrader.indicators import Indicator, MovAv, Highest, Lowest, DivByZero
+from backtrader.indicators import Indicator, MovAv, DivByZero
 
 
 class StochasticSlow(Indicator):
@@ -154,8 +329,8 @@ class StochasticSlow(Indicator):
         self.plotinfo.plotyhlines = [self.p.upperband, self.p.lowerband]
 
     def __init__(self):
-        lowestlow = Lowest(self.data.low, period=self.p.period)
-        highesthigh = Highest(self.data.high, period=self.p.period)
+        lowestlow = _lowest(self.data.low, self.p.period)
+        highesthigh = _highest(self.data.high, self.p.period)
 
         if self.p.safediv:
             self.l.k = self.p.movav(
@@ -191,8 +366,8 @@ class Stoch(Indicator):
 
     def __init__(self):
         #self.addminperiod(self.p.period * self.p.period_dfast)
-        self.highesthigh = Highest(self.p.high, period=self.p.period)
-        self.lowestlow = Lowest(self.p.low, period=self.p.period)
+        self.highesthigh = _highest(self.p.high, self.p.period)
+        self.lowestlow = _lowest(self.p.low, self.p.period)
         self.knum = self.p.src - self.lowestlow
         self.kden = self.highesthigh - self.lowestlow
 
@@ -205,10 +380,6 @@ class Stoch(Indicator):
 
         super(Stoch, self).__init__()
 
-    def next(self):
-        if not self.l.d[0]:
-            pass
-
 class STC(Indicator):
     params = {
         'fastLength': 23,
@@ -263,6 +434,16 @@ class STC(Indicator):
         else:
             self.lines.stc[0] = self.stochK.l.d[0]
 
+    def once(self, start, end):
+        src = self.stochK.l.d.array
+        dst = self.lines.stc.array
+        for i in range(start, end):
+            if src[i] > 100:
+                dst[i] = 100
+            elif src[i] < 0:
+                dst[i] = 0
+            else:
+                dst[i] = src[i]
 
     def print(self, *args, **kwargs):
         pass
\ No newline at end of file
@@ -12,6 +12,8 @@ __copyright__ = "Copyright 2020, Liquidator"
 
 import backtrader as bt
 
+from . import _np_indicators as npi
+from . import _stream_indicators as si
 from ._base import BaseStrategy
 from ._indicators import MFI
 
@@ -42,6 +44,23 @@ class MFIStrategy(BaseStrategy):
         self.market_order = None
         self.stop_order = None
 
+    @classmethod
+    def fast_signals(cls, data, p, ind):
+        mfi = ind(npi.mfi, data.high, data.low, data.close, data.volume, period=p.mfi_length)
+        return ind(npi.cross_up, mfi, p.mfi_limit_high), ind(npi.cross_down, mfi, p.mfi_limit_low)
+
+    @classmethod
+    def stream_signals(cls, p):
+        mfi = si.MFI(period=p.mfi_length)
+        cross_up = si.CrossUp()
+        cross_down = si.CrossDown()
+
+        def push(bar):
+            value = mfi.push(bar.high, bar.low, bar.close, bar.volume)
+            return cross_up.push(value, p.mfi_limit_high), cross_down.push(value, p.mfi_limit_low)
+
+        return push
+
     def next(self):
         if self.long_signal and self.position.size <= 0:
             # close previous position
@@ -0,0 +1,387 @@
+"""
+Gemelli NumPy degli indicatori backtrader usati dalle strategie a segnali ( per strategies_tester.fastbacktest ).
+Ogni funzione lavora su array interi e ritorna NaN prima del minperiod dell'indicatore backtrader corrispondente,
+cosi' il primo valore valido dei segnali coincide con la prima chiamata a next() della strategia.
+Gli indicatori con piu' linee ( supertrend, stoch, ... ) ritornano una tupla di array nell'ordine di `lines`.
+"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import inspect
+import math
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+__all__ = ['SharedIndicators', 'first_valid', 'sum_n', 'running_sum_n', 'highest', 'lowest', 'sma', 'ema', 'smma', 'true_range', 'atr',
+           'macd', 'slope', 'slope_grad', 'mfi', 'supertrend_band', 'supertrend', 'stochastic_slow', 'stoch', 'stc',
+           'div_by_zero', 'cross_up', 'cross_down', 'compare', 'logic_and']
+
+
+class SharedIndicators(object):
+    """
+    Indicatori calcolati una volta sola per gli stessi dati: `ind(ema, data.close, 9)` ritorna lo stesso array a
+    tutte le strategie ( e parametri ) che lo chiedono. La chiave e' la ricetta dell'indicatore: funzione, parametri
+    e ricetta degli array in ingresso ( colonne dei dati o risultati precedenti ), cosi' anche gli indicatori
+    derivati ( es. slope dell'ema ) vengono riconosciuti.
+    Con `cache` ( IndicatorCache ) e l'impronta `dataset` dei dati gli indicatori vengono cercati e salvati anche li',
+    condivisi con gli altri SharedIndicators sugli stessi dati ( trial successivi, altri processi via disco ).
+    """
+
+    def __init__(self, data, cache=None, dataset: str = None):
+        if cache is not None and dataset is None:
+            raise Exception("SharedIndicators: a shared cache needs the dataset fingerprint")
+        self.data = data
+        self.cache = cache
+        self.dataset = dataset
+        self._memo = {}
+        self._keys = {id(getattr(data, c)): (c,) for c in data._fields}
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.hits + self.shared + self.misses
+
+    def key(self, func, *args, **kwargs) -> tuple:
+        # argomenti normalizzati con i default: mfi(h, l, c, v) e mfi(h, l, c, v, period=14) sono lo stesso indicatore
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        return (func.__name__,) + tuple((name, self._arg_key(arg)) for name, arg in bound.arguments.items())
+
+    def _arg_key(self, arg):
+        if isinstance(arg, np.ndarray):
+            if id(arg) not in self._keys:
+                raise Exception("array not produced by SharedIndicators: pass data columns or indicators")
+            return self._keys[id(arg)]
+        return arg
+
+    def __call__(self, func, *args, **kwargs) -> np.ndarray:
+        key = self.key(func, *args, **kwargs)
+        result = self._memo.get(key)
+        if result is not None:
+            self.hits += 1
+            return result
+        if self.cache is not None:
+            result = self.cache.get(self.dataset, key)
+        if result is not None:
+            self.shared += 1
+        else:
+            self.misses += 1
+            result = func(*args, **kwargs)
+            result.flags.writeable = False  # condiviso: nessuno deve modificarlo
+            if self.cache is not None:
+                self.cache.put(self.dataset, key, result)
+        self._memo[key] = result
+        self._keys[id(result)] = key
+        return result
+
+
+def first_valid(x: np.ndarray) -> int:
+    """indice del primo valore non NaN ( len(x) se non ce ne sono )"""
+    valid = ~np.isnan(x)
+    return int(valid.argmax()) if valid.any() else len(x)
+
+
+# periodo da cui la somma corrente di running_sum_n costa meno della somma di ogni finestra ( e da cui
+# _indicators usa RunningSumN, che fa le stesse operazioni )
+RUNNING_MIN_PERIOD = 50
+
+
+def sum_n(x: np.ndarray, period: int) -> np.ndarray:
+    """
+    bt.ind.SumN: somma mobile su `period` valori in O(n). Sotto RUNNING_MIN_PERIOD ogni finestra e' sommata per
+    intero ( al piu' RUNNING_MIN_PERIOD somme per barra ), da RUNNING_MIN_PERIOD in su running_sum_n
+    """
+    if period >= RUNNING_MIN_PERIOD:
+        return running_sum_n(x, period)
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    start = first_valid(x)
+    if len(x) - start >= period:
+        # somma a coppie sulla finestra: molto piu' vicina a math.fsum di backtrader di una differenza di cumsum
+        out[start + period - 1:] = sliding_window_view(x[start:], period).sum(axis=1)
+    return out
+
+
+def running_sum_n(x: np.ndarray, period: int) -> np.ndarray:
+    """
+    somma mobile in O(n) indipendente da `period`: ogni `period` barre la somma della finestra e' calcolata esatta
+    con math.fsum, nelle barre in mezzo si aggiunge il valore nuovo e si toglie quello uscito ( stesse operazioni,
+    nello stesso ordine, di _indicators.RunningSumN.next )
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    start = first_valid(x)
+    first = start + period - 1
+    if first >= len(x):
+        return out
+    windows = len(x) - first
+    steps = np.zeros(windows + (-windows % period))
+    steps[1:windows] = x[first + 1:] - x[start:len(x) - period]
+    steps = steps.reshape(-1, period)
+    steps[:, 0] = [math.fsum(x[end - period + 1:end + 1]) for end in range(first, len(x), period)]
+    out[first:] = np.add.accumulate(steps, axis=1).ravel()[:windows]
+    return out
+
+
+def _rolling_extreme(x: np.ndarray, period: int, op) -> np.ndarray:
+    """
+    massimo ( op=np.maximum ) o minimo mobile in O(n) indipendente da `period` ( van Herk / Gil-Werman ): a blocchi
+    di `period` valori, il risultato di una finestra e' op( estremo dal suo inizio a fine blocco, estremo da inizio
+    blocco alla sua fine )
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    start = first_valid(x)
+    n = len(x) - start
+    if n < period:
+        return out
+    # blocchi completi: i valori aggiunti in coda finiscono solo nelle finestre oltre la fine dei dati
+    blocks = np.concatenate([x[start:], np.full(-n % period, x[-1])]).reshape(-1, period)
+    prefix = op.accumulate(blocks, axis=1).ravel()
+    suffix = op.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    out[start + period - 1:] = op(suffix[:n - period + 1], prefix[period - 1:n])
+    return out
+
+
+def highest(x: np.ndarray, period: int) -> np.ndarray:
+    """bt.ind.Highest"""
+    return _rolling_extreme(x, period, np.maximum)
+
+
+def lowest(x: np.ndarray, period: int) -> np.ndarray:
+    """bt.ind.Lowest"""
+    return _rolling_extreme(x, period, np.minimum)
+
+
+def sma(x: np.ndarray, period: int) -> np.ndarray:
+    """bt.ind.MovingAverageSimple"""
+    return sum_n(x, period) / period
+
+
+def _smoothing(x: np.ndarray, period: int, alpha: float) -> np.ndarray:
+    """bt.ind.ExponentialSmoothing: seme con la media semplice dei primi `period` valori"""
+    out = sma(x, period)
+    seed = first_valid(out)
+    if seed < len(out):
+        alpha1 = 1.0 - alpha
+        values = np.asarray(x, dtype=np.float64).tolist()
+        result = out.tolist()
+        prev = result[seed]
+        # ricorsivo: stesso ciclo ( e stessi arrotondamenti ) di ExponentialSmoothing.once
+        for i in range(seed + 1, len(values)):
+            result[i] = prev = prev * alpha1 + values[i] * alpha
+        out = np.array(result)
+    return out
+
+
+def ema(x: np.ndarray, period: int) -> np.ndarray:
+    """bt.ind.ExponentialMovingAverage"""
+    return _smoothing(x, period, 2.0 / (1.0 + period))
+
+
+def smma(x: np.ndarray, period: int) -> np.ndarray:
+    """bt.ind.SmoothedMovingAverage ( Wilder )"""
+    return _smoothing(x, period, 1.0 / period)
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """bt.ind.TrueRange: max( high, close precedente ) - min( low, close precedente )"""
+    out = np.full(len(close), np.nan)
+    out[1:] = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    return out
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    """bt.ind.AverageTrueRange"""
+    return smma(true_range(high, low, close), period)
+
+
+def macd(x: np.ndarray, period_me1: int = 12, period_me2: int = 26, movav=ema) -> np.ndarray:
+    """linea macd di bt.ind.MACD"""
+    return movav(x, period_me1) - movav(x, period_me2)
+
+
+def div_by_zero(a: np.ndarray, b: np.ndarray, zero: float = 0.0) -> np.ndarray:
+    """bt.ind.DivByZero: a / b, `zero` dove b e' 0"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(b != 0.0, a / b, zero)
+
+
+def slope(x: np.ndarray) -> np.ndarray:
+    """_indicators.Slope"""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    out[1:] = (x[1:] - x[:-1]) / x[1:]
+    return out
+
+
+def slope_grad(x: np.ndarray, period: int = 3) -> np.ndarray:
+    """
+    _indicators.SlopeGrad. Backtrader calcola un primo valore alla barra `period - 1` leggendo data[-period] fuori
+    dai dati ( l'ultimo elemento dell'array ): qui quella barra resta NaN
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    out[period:] = 180 / math.pi * np.arctan((x[period:] - x[:-period]) / period)
+    return out
+
+
+def mfi(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray, period: int = 14) -> np.ndarray:
+    """_indicators.MFI"""
+    tprice = (close + low + high) / 3.0
+    mfraw = tprice * volume
+    up = np.full(len(tprice), np.nan)
+    down = np.full(len(tprice), np.nan)
+    up[1:] = mfraw[1:] * (tprice[1:] > tprice[:-1])
+    down[1:] = mfraw[1:] * (tprice[1:] < tprice[:-1])
+    flowpos = sum_n(up, period)
+    flowneg = sum_n(down, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mfiratio = np.where(flowneg != 0.0, flowpos / flowneg, 100.0)
+    mfiratio[np.isnan(flowneg)] = np.nan
+    return 100.0 - 100.0 / (1.0 + mfiratio)
+
+
+def supertrend_band(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 7,
+                    multiplier: float = 3) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """_indicators.SuperTrendBand: ( basic_ub, basic_lb, st_upper_level, st_lower_level )"""
+    band = atr(high, low, close, period) * multiplier
+    basic_ub = ((high + low) / 2) + band
+    basic_lb = ((high + low) / 2) - band
+    upper = np.full(len(close), np.nan)
+    lower = np.full(len(close), np.nan)
+    if period < len(close):
+        # ricorsivo sul livello precedente: stesso ciclo di SuperTrendBand.once, su liste
+        ub, lb, c = basic_ub.tolist(), basic_lb.tolist(), close.tolist()
+        up, lo = ub[:], lb[:]
+        for i in range(period + 1, len(c)):
+            if not (ub[i] < up[i - 1] or c[i - 1] > up[i - 1]):
+                up[i] = up[i - 1]
+            if not (lb[i] > lo[i - 1] or c[i - 1] < lo[i - 1]):
+                lo[i] = lo[i - 1]
+        upper[period:] = up[period:]
+        lower[period:] = lo[period:]
+    return basic_ub, basic_lb, upper, lower
+
+
+def supertrend(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 7,
+               multiplier: float = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """_indicators.SuperTrend: ( super_trend, st_trend ), st_trend NaN dove backtrader non lo assegna"""
+    _, _, upper, lower = supertrend_band(high, low, close, period, multiplier)
+    super_trend = np.full(len(close), np.nan)
+    st_trend = np.full(len(close), np.nan)
+    if period < len(close):
+        up, lo, c = upper.tolist(), lower.tolist(), close.tolist()
+        st, trend = super_trend.tolist(), st_trend.tolist()
+        st[period] = up[period]
+        for i in range(period + 1, len(c)):
+            # entrambi i confronti sul valore precedente, come SuperTrend.once
+            if st[i - 1] == up[i - 1]:
+                st[i], trend[i] = (up[i], -1) if c[i] <= up[i] else (lo[i], 1)
+            if st[i - 1] == lo[i - 1]:
+                st[i], trend[i] = (lo[i], 1) if c[i] >= lo[i] else (up[i], -1)
+        super_trend = np.array(st)
+        st_trend = np.array(trend)
+    return super_trend, st_trend
+
+
+def stochastic_slow(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 10, period_smoothk: int = 6,
+                    period_smoothd: int = 3, movav=sma, safediv: bool = False,
+                    safezero: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    _indicators.StochasticSlow: ( k, d ). Senza safediv un massimo uguale al minimo da' inf/NaN dove backtrader
+    solleva ZeroDivisionError
+    """
+    lowestlow = lowest(low, period)
+    highesthigh = highest(high, period)
+    if safediv:
+        raw = 100.0 * div_by_zero(close - lowestlow, highesthigh - lowestlow, zero=safezero)
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            raw = 100.0 * ((close - lowestlow) / (highesthigh - lowestlow))
+    k = movav(raw, period_smoothk)
+    return k, movav(k, period_smoothd)
+
+
+def stoch(src: np.ndarray, high: np.ndarray, low: np.ndarray, period: int = 14, period_dfast: int = 3, movav=ema,
+          safediv: bool = False, safezero: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """_indicators.Stoch: ( k, d )"""
+    highesthigh = highest(high, period)
+    lowestlow = lowest(low, period)
+    knum = src - lowestlow
+    kden = highesthigh - lowestlow
+    if safediv:
+        k = 100.0 * div_by_zero(knum, kden, zero=safezero)
+    else:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k = 100.0 * (knum / kden)
+    return k, movav(k, period_dfast)
+
+
+def stc(close: np.ndarray, fastLength: int = 23, slowLength: int = 50, cycleLength: int = 10, d1Length: int = 3,
+        d2Length: int = 3, movav=ema) -> np.ndarray:
+    """_indicators.STC: due Stoch sul macd, limitato a [ 0, 100 ]"""
+    line = macd(close, fastLength, slowLength, movav=movav)
+    _, d = stoch(line, line, line, period=cycleLength, period_dfast=d1Length, movav=movav, safediv=True)
+    _, d = stoch(d, d, d, period=cycleLength, period_dfast=d2Length, movav=movav, safediv=True)
+    return np.clip(d, 0, 100)
+
+
+def _non_zero_difference(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """bt.ind.NonZeroDifference: a - b, ripetendo l'ultima differenza non nulla quando e' zero"""
+    d = a - b
+    start = first_valid(d)
+    out = np.full(len(d), np.nan)
+    if start < len(d):
+        tail = d[start:]
+        keep = tail != 0.0
+        keep[0] = True
+        out[start:] = tail[np.maximum.accumulate(np.where(keep, np.arange(len(tail)), 0))]
+    return out
+
+
+def _cross(a, b, up: bool) -> np.ndarray:
+    a = np.asarray(a, dtype=np.float64)
+    b = np.broadcast_to(np.asarray(b, dtype=np.float64), a.shape)
+    nzd = _non_zero_difference(a, b)
+    out = np.full(len(a), np.nan)
+    before = nzd[:-1] < 0.0 if up else nzd[:-1] > 0.0
+    after = a[1:] > b[1:] if up else a[1:] < b[1:]
+    out[1:] = before & after
+    out[1:][np.isnan(nzd[:-1])] = np.nan
+    return out
+
+
+def cross_up(a, b) -> np.ndarray:
+    """bt.ind.CrossUp ( `b` anche scalare )"""
+    return _cross(a, b, up=True)
+
+
+def cross_down(a, b) -> np.ndarray:
+    """bt.ind.CrossDown ( `b` anche scalare )"""
+    return _cross(a, b, up=False)
+
+
+def compare(op, a, b) -> np.ndarray:
+    """confronto tra linee ( es. `close > ma` ): 1.0/0.0, NaN dove uno dei due e' NaN"""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.broadcast_to(np.asarray(b, dtype=np.float64), a.shape)
+    out = op(a, b).astype(np.float64)
+    out[np.isnan(a) | np.isnan(b)] = np.nan
+    return out
+
+
+def logic_and(*xs) -> np.ndarray:
+    """bt.ind.And: 1.0/0.0, NaN finche' uno degli argomenti e' NaN"""
+    out = np.ones(len(xs[0]))
+    invalid = np.zeros(len(xs[0]), dtype=bool)
+    for x in xs:
+        invalid |= np.isnan(x)
+        out *= x != 0.0
+    out[invalid] = np.nan
+    return out
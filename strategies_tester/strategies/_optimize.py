@@ -11,9 +11,11 @@ __author__ = "Liquidator"
 __copyright__ = "Copyright 2020, Liquidator"
 
 import logging
+import math
 import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
-from typing import List, Tuple
+from typing import Any, List, Optional, Tuple
 
 import optuna
 import optuna.storages
@@ -21,13 +23,41 @@ import optuna.storages.rdb.models
 from optuna.trial import TrialState
 
 from strategies_tester.datafetcher import DataFetcher
+from strategies_tester.fastbacktest import STATS, FastBacktester, fast_supported
+from strategies_tester.indicator_cache import IndicatorCache
+from strategies_tester.trial_writer import TrialResults, TrialWriter
 from strategies_tester.utils_backtest import BaseStrategy, backtest_strategy
 
 __all__ = ['OptunaOptimizeStrategy']
 
+# ottimizzatore del processo worker, ricevuto una volta sola all'avvio del pool ( _optimize_processes )
+_worker_optimizer = None
+
+
+def _init_worker(optimizer: 'OptunaOptimizeStrategy', indicator_cache: Optional[Tuple[int, str]]):
+    global _worker_optimizer
+    _worker_optimizer = optimizer
+    # ogni worker ha la sua cache in memoria, la cartella su disco ( se c'e' ) e' condivisa
+    FastBacktester.indicator_cache = IndicatorCache(*indicator_cache) if indicator_cache else None
+
+
+def _worker_evaluate(params_list: List[dict]) -> list:
+    return _worker_optimizer._evaluate_many(params_list)
+
+
+def _worker_backtest_period(period: int, kwargs: dict) -> Tuple[Any, dict, Optional[Tuple[int, int]]]:
+    return _worker_optimizer.backtest_many(_worker_optimizer.data[period], [kwargs])[0]
+
 
 class OptunaOptimizeStrategy(object):
     strategy = BaseStrategy
+    # pruner dello studio per nome ( `pruner` ), con i checkpoint gli step sono le barre dall'inizio del primo periodo,
+    # senza sono i periodi ( checkpoint_bars None )
+    pruners = {
+        'none': lambda checkpoint_bars: optuna.pruners.NopPruner(),
+        'median': lambda checkpoint_bars: optuna.pruners.MedianPruner(n_startup_trials=5),
+        'hyperband': lambda checkpoint_bars: optuna.pruners.HyperbandPruner(min_resource=checkpoint_bars or 1),
+    }
 
     def __init__(self,
                  study_name: str,
@@ -39,10 +69,53 @@ class OptunaOptimizeStrategy(object):
                  perc_size: int = 10,
                  commission: float = 0.00075,
                  start_cash: float = 10000,
-                 optuna_storage: str = None
+                 optuna_storage: str = None,
+                 use_mmap: bool = False,
+                 engine: str = 'backtrader',
+                 user_attrs: List[str] = None,
+                 update_data: bool = True,
+                 pruner: str = 'none',
+                 checkpoint_bars: int = None,
+                 shared_warmup: bool = False,
+                 period_workers: int = None,
+                 buffered_writes: bool = True,
+                 write_behind: bool = False
                  ):
         analyzer = (analyzer or 'none').lower().replace(" ", "_")
-        assert analyzer in ['sharpe_ratio', 'sqn', 'vwr', 'winrate', 'none']
+        assert analyzer in ['sharpe_ratio', 'sqn', 'vwr', 'winrate', 'pnl', 'none']
+        # user_attrs: metriche salvate nei trial come `backtest_{k}` ( None: tutte ). Insieme all'obiettivo decidono
+        # quali analyzer vengono aggiunti a cerebro: con user_attrs=[] e analyzer 'sqn' solo SQN
+        user_attrs = list(STATS) if user_attrs is None else list(user_attrs)
+        assert all(k in STATS for k in user_attrs)
+        objective = 'pnl' if analyzer == 'none' else analyzer
+        self.user_attrs = user_attrs
+        self.metrics = [k for k in STATS if k == objective or k in user_attrs]
+        # engine: 'numpy' valuta i trial con strategies_tester.fastbacktest ( pre-screen, niente cerebro )
+        assert engine in ['backtrader', 'numpy']
+        if engine == 'numpy' and not fast_supported(self.strategy):
+            raise Exception(f"{self.strategy.__name__}: numpy engine not supported")
+        self.engine = engine
+        # checkpoint_bars: con backtrader il pnl corrente viene riportato al trial ogni N barre, cosi' il pruner puo'
+        # fermare un trial a meta' periodo ( solo nei trial di study.optimize, non con batch e processi )
+        assert pruner in self.pruners
+        self.pruner = pruner
+        self.checkpoint_bars = checkpoint_bars
+        # shared_warmup: ( solo numpy ) un dataset dall'inizio del primo periodo alla fine dell'ultimo, indicatori
+        # calcolati una volta e tagliati per periodo ( FastBacktester.run_periods ): i periodi successivi al primo
+        # partono con gli indicatori gia' caldi e aggiungere periodi non moltiplica il costo del trial
+        if shared_warmup and engine != 'numpy':
+            raise Exception("shared_warmup: only the numpy engine supports it")
+        self.shared_warmup = shared_warmup
+        self.time_periods = list(time_periods)
+        # period_workers: i periodi di un trial valutati in parallelo da un pool di processi ( creato da run() )
+        self.period_workers = period_workers
+        self._period_pool = None
+        # buffered_writes: user attrs e valori intermedi di un trial scritti nello storage in una sola transazione
+        # ( TrialWriter ) invece di una per chiamata; write_behind: i trial chiusi con ask/tell ( batch_size,
+        # processes ) sono accodati e scritti insieme da un thread
+        self.buffered_writes = buffered_writes
+        self.write_behind = write_behind
+        self._writer = None
         self.study_name = study_name
         self.perc_size = perc_size
         self.commission = commission
@@ -52,9 +125,20 @@ class OptunaOptimizeStrategy(object):
         self.logger = logging.getLogger(__name__)
 
         self.logger.info("download data")
+        # use_mmap: un MappedOHLCV per periodo, condiviso senza copie con eventuali processi worker
+        # update_data=False: solo la cache locale, senza scaricare le candele nuove
         self.data = []
+        if shared_warmup and time_periods:
+            time_periods = [(min(start for start, _ in time_periods), max(end for _, end in time_periods))]
         for start, end in time_periods:
-            self.data.append(DataFetcher().download_data(
+            dfetch = DataFetcher()
+            if use_mmap:
+                download = dfetch.mapped_data
+            elif update_data:
+                download = dfetch.download_data
+            else:
+                download = dfetch.load_data
+            self.data.append(download(
                 exchange=exchange,
                 symbol=symbol,
                 bin_size=bin_size,
@@ -62,6 +146,13 @@ class OptunaOptimizeStrategy(object):
                 date_to=end
             ))
 
+    def __getstate__(self):
+        # l'ottimizzatore viene copiato nei processi worker, il pool dei periodi resta in questo processo
+        state = self.__dict__.copy()
+        state['_period_pool'] = None
+        state['_writer'] = None
+        return state
+
     def backtest(self, df, date_from: datetime = None, date_to: datetime = None, verbose=False, **kwargs):
         try:
             cerebro, thestrats = backtest_strategy(
@@ -73,6 +164,7 @@ class OptunaOptimizeStrategy(object):
                 commission=self.commission,
                 start_cash=self.start_cash,
                 verbose=verbose,
+                metrics=self.metrics,
 
                 **kwargs
             )
@@ -80,65 +172,382 @@ class OptunaOptimizeStrategy(object):
             portvalue = cerebro.broker.getvalue()
             pnl = portvalue - self.start_cash
 
-            thestrat = thestrats[0]
-            trade_analyzer = thestrat.analyzers.trade.get_analysis()
-            stats = {
-                'pnl': pnl,
-                'sqn': thestrat.analyzers.sqn.get_analysis()['sqn'],
-                'vwr': thestrat.analyzers.vwr.get_analysis()['vwr'],
-                'sharpe_ratio': thestrat.analyzers.sharpe_ratio.get_analysis()['sharperatio'],
-                'winrate': (trade_analyzer.won.total / trade_analyzer.lost.total) * 100
+            analyzers = thestrats[0].analyzers
+
+            def winrate():
+                trade_analyzer = analyzers.trade.get_analysis()
+                return (trade_analyzer.won.total / trade_analyzer.lost.total) * 100
+
+            # solo le metriche richieste: gli analyzer delle altre non sono stati aggiunti
+            getters = {
+                'pnl': lambda: pnl,
+                'sqn': lambda: analyzers.sqn.get_analysis()['sqn'],
+                'vwr': lambda: analyzers.vwr.get_analysis()['vwr'],
+                'sharpe_ratio': lambda: analyzers.sharpe_ratio.get_analysis()['sharperatio'],
+                'winrate': winrate
             }
+            stats = {k: getters[k]() for k in self.metrics}
 
-            if self.analyzer == 'sqn':
-                result = stats['sqn']
-            elif self.analyzer == 'vwr':
-                result = stats['vwr']
-            elif self.analyzer == 'sharpe_ratio':
-                result = stats['sharpe_ratio']
-            elif self.analyzer == 'winrate':
-                result = stats['winrate']
-            elif self.analyzer == 'none' or self.analyzer == 'pnl':
-                result = pnl
-            else:
-                raise Exception(f"{self.analyzer}: analyzer not found")
-            return result, stats, cerebro, thestrats
+            return self._result(stats), stats, cerebro, thestrats
         except Exception as e:
             self.logger.error(e)
             return None, None, None, None
 
+    def fast_backtest(self, df, date_from: datetime = None, date_to: datetime = None, **kwargs):
+        """
+        come backtest() ma con il broker NumPy di fastbacktest: ritorna ( result, stats, lookups ) con lookups =
+        ( indicatori richiesti, indicatori calcolati ) per l'hit rate della cache degli indicatori
+        """
+        try:
+            tester = FastBacktester(df, self.strategy, date_from, date_to, perc_size=self.perc_size,
+                                    commission=self.commission, start_cash=self.start_cash, metrics=self.metrics)
+            stats = tester.run(**kwargs)
+            return self._result(stats), stats, tester.last_lookups
+        except Exception as e:
+            self.logger.error(e)
+            return None, None, None
+
+    def backtest_many(self, df, params_list: List[dict], date_from: datetime = None,
+                      date_to: datetime = None) -> List[Tuple[Any, dict, Optional[Tuple[int, int]]]]:
+        """
+        Valuta piu' set di parametri sugli stessi dati e ritorna ( result, stats, lookups ) per ciascuno
+        ( None, None, None se fallisce ). Con engine 'numpy' dati, periodi degli analyzer e indicatori uguali sono
+        calcolati una volta sola per tutto il batch; con backtrader ogni set resta un cerebro separato e lookups e'
+        None.
+        """
+        if self.engine != 'numpy':
+            return [self.backtest(df, date_from=date_from, date_to=date_to, **kwargs)[:2] + (None,)
+                    for kwargs in params_list]
+
+        try:
+            tester = FastBacktester(df, self.strategy, date_from, date_to, perc_size=self.perc_size,
+                                    commission=self.commission, start_cash=self.start_cash, metrics=self.metrics)
+        except Exception as e:
+            self.logger.error(e)
+            return [(None, None, None)] * len(params_list)
+
+        results = []
+        for kwargs in params_list:
+            try:
+                stats = tester.run(**kwargs)
+                results.append((self._result(stats), stats, tester.last_lookups))
+            except Exception as e:
+                self.logger.error(e)
+                results.append((None, None, None))
+        self.logger.debug(f"backtest_many: {len(params_list)} parameter sets, indicators computed "
+                          f"{tester.indicators.misses} shared {tester.indicators.hits + tester.indicators.shared}")
+        return results
+
+    def backtest_periods(self, df, params_list: List[dict]) -> List[List[Tuple[Any, dict, Optional[Tuple[int, int]]]]]:
+        """
+        ( result, stats, lookups ) di ogni periodo di `time_periods` per ogni set di parametri, con gli indicatori
+        calcolati una volta su `df` ( che contiene tutti i periodi ) e tagliati per periodo. I lookups sono sul primo
+        periodo, un set si ferma al primo periodo senza risultato.
+        """
+        try:
+            tester = FastBacktester(df, self.strategy, perc_size=self.perc_size, commission=self.commission,
+                                    start_cash=self.start_cash, metrics=self.metrics)
+        except Exception as e:
+            self.logger.error(e)
+            return [[(None, None, None)] for _ in params_list]
+
+        results = []
+        for kwargs in params_list:
+            periods = []
+            try:
+                for stats in tester.run_periods(self.time_periods, **kwargs):
+                    lookups = None if periods else tester.last_lookups
+                    periods.append((self._result(stats), stats, lookups))
+                    if periods[-1][0] is None:
+                        break
+            except Exception as e:
+                self.logger.error(e)
+                periods.append((None, None, None))
+            results.append(periods)
+        return results
+
+    @staticmethod
+    def _until_failed(periods: list) -> list:
+        """periodi fino al primo senza risultato compreso, come la valutazione periodo per periodo"""
+        for i, (result, _, _) in enumerate(periods):
+            if result is None:
+                return periods[:i + 1]
+        return periods
+
+    def _result(self, stats: dict):
+        if self.analyzer == 'sqn':
+            result = stats['sqn']
+        elif self.analyzer == 'vwr':
+            result = stats['vwr']
+        elif self.analyzer == 'sharpe_ratio':
+            result = stats['sharpe_ratio']
+        elif self.analyzer == 'winrate':
+            result = stats['winrate']
+        elif self.analyzer == 'none' or self.analyzer == 'pnl':
+            result = stats['pnl']
+        else:
+            raise Exception(f"{self.analyzer}: analyzer not found")
+        return result
+
     def get_parameters(self, trial: optuna.Trial):
         return {}
 
     def _objective(self, trial: optuna.Trial):
 
         kwargs = self.get_parameters(trial)
+        results = self._trial_results(trial)
+        try:
+            return self._objective_periods(results, kwargs)
+        finally:
+            # prima di tornare a optuna, che chiude il trial leggendo i valori intermedi dallo storage
+            results.flush()
+
+    def _objective_periods(self, results: TrialResults, kwargs: dict):
+        if self.shared_warmup or self._period_pool is not None:
+            # periodi valutati tutti insieme ( indicatori condivisi o in parallelo ), poi report in ordine
+            return self._report_periods(results, self._evaluate_many([kwargs])[0])
 
         step = 0
+        bars = 0
         result = None
+        lookups = []
         for df in self.data:
             step += 1
 
-            result, stats, cerebro, thestrats = self.backtest(df, **kwargs)
+            checkpoint = self._checkpoint(results, bars)
+            if self.engine == 'numpy':
+                result, stats, period_lookups = self.fast_backtest(df, **kwargs)
+                lookups.append(period_lookups)
+            else:
+                result, stats, cerebro, thestrats = self.backtest(df, **checkpoint, **kwargs)
 
             if result is None:
                 raise optuna.exceptions.TrialPruned("no result")
 
+            for k in self.user_attrs:
+                results.set_user_attr(f'backtest_{k}', stats[k])
+            self._report_hit_rate(results, lookups)
+
+            if checkpoint:
+                # i valori intermedi sono i pnl dei checkpoint: il risultato del periodo non viene riportato
+                stopped_at = thestrats[0].stopped_at
+                if stopped_at is not None:
+                    results.set_user_attr('stopped_at_bar', bars + stopped_at)
+                    raise optuna.exceptions.TrialPruned(f"should_prune at bar {bars + stopped_at}")
+                bars += len(df)
+                continue
+
+            results.report(result, step)
+
+            if results.should_prune():
+                raise optuna.exceptions.TrialPruned("should_prune")
+
+        # result = self.backtest(self.data[0], **kwargs)
+        if result is None:
+            raise optuna.exceptions.TrialPruned("no result")
+        return result
+
+    def _checkpoint(self, results: TrialResults, bars: int) -> dict:
+        """
+        parametri della strategia per il pruning dentro un periodo ( BaseStrategy.checkpoint ): ogni `checkpoint_bars`
+        barre il pnl corrente viene riportato al trial con step = `bars` dei periodi precedenti + barra del periodo.
+        Passa da `results`: una transazione per checkpoint ( valore e attrs in sospeso ) e nessuna con NopPruner
+        """
+        if not self.checkpoint_bars or self.engine != 'backtrader':
+            return {}
+        start_cash = self.start_cash
+
+        def checkpoint(strategy: BaseStrategy, bar: int) -> bool:
+            results.report(strategy.broker.getvalue() - start_cash, bars + bar)
+            return results.should_prune()
+
+        return {'checkpoint': checkpoint, 'checkpoint_bars': self.checkpoint_bars}
+
+    def uses_parallel_periods(self, processes: int = None) -> bool:
+        """i periodi di un trial sono valutati in parallelo solo senza `processes` e senza shared_warmup"""
+        return bool(self.period_workers) and not processes and not self.shared_warmup and len(self.data) > 1
+
+    def uses_checkpoints(self, batch_size: int = None, processes: int = None) -> bool:
+        """i checkpoint servono solo se i periodi di un trial sono valutati uno alla volta con backtrader"""
+        return bool(self.checkpoint_bars) and self.engine == 'backtrader' and not (
+                processes or batch_size or self.uses_parallel_periods(processes) or self.shared_warmup)
+
+    def make_pruner(self, checkpoints: bool = True) -> optuna.pruners.BasePruner:
+        """`checkpoints` False: gli step riportati sono i periodi anche con checkpoint_bars ( es. hyperband da 1 )"""
+        return self.pruners[self.pruner](self.checkpoint_bars if checkpoints else None)
+
+    def _report_hit_rate(self, trial: TrialResults, lookups: List[Optional[Tuple[int, int]]]):
+        """hit rate della cache degli indicatori nei periodi valutati finora dal trial ( solo engine numpy )"""
+        requested = sum(x[0] for x in lookups if x)
+        if not requested:
+            return
+        hit_rate = 1.0 - sum(x[1] for x in lookups if x) / requested
+        trial.set_user_attr('indicator_hit_rate', hit_rate)
+        self.logger.debug(f"trial {trial.number}: indicator hit rate {hit_rate:.0%} ({requested} lookups)")
+
+    def _ask(self, study: optuna.Study) -> optuna.Trial:
+        """study.ask() ( non ancora in optuna 1.4 ): nuovo trial RUNNING, come in Study._run_trial"""
+        trial_id = study._pop_waiting_trial_id()
+        if trial_id is None:
+            trial_id = study._storage.create_new_trial(study._study_id)
+        return optuna.Trial(study, trial_id)
+
+    def _tell(self, study: optuna.Study, trial: optuna.Trial, value=None, state=TrialState.COMPLETE, reason=None,
+              results: TrialResults = None):
+        """
+        study.tell(): chiude il trial con le stesse regole di Study._run_trial, insieme ai risultati in sospeso di
+        `results` ( una transazione, accodata con write_behind )
+        """
+        results = results or TrialResults(trial)
+        if state == TrialState.COMPLETE:
+            try:
+                value = float(value)
+            except (ValueError, TypeError):
+                value = float('nan')
+            if math.isnan(value):
+                state, reason = TrialState.FAIL, f"objective value {value!r}"
+        if state == TrialState.PRUNED:
+            # come per i trial pruned di optuna: vale l'ultimo valore intermedio
+            value = results.last_value
+            if value is None and results.writer is None:
+                frozen_trial = study._storage.get_trial(trial._trial_id)
+                if frozen_trial.last_step is not None:
+                    value = frozen_trial.intermediate_values[frozen_trial.last_step]
+        elif state != TrialState.COMPLETE:
+            value = None
+        results.finish(value, state, reason if state == TrialState.FAIL else None)
+
+    def _ask_parameters(self, study: optuna.Study, n: int) -> Tuple[List[optuna.Trial], List[dict]]:
+        """ask di `n` trial e parametri campionati ( i trial pruned o falliti in get_parameters vengono chiusi )"""
+        trials, params = [], []
+        for _ in range(n):
+            trial = self._ask(study)
+            try:
+                params.append(self.get_parameters(trial))
+                trials.append(trial)
+            except optuna.exceptions.TrialPruned:
+                self._tell(study, trial, state=TrialState.PRUNED)
+            except Exception as e:
+                self._tell(study, trial, state=TrialState.FAIL, reason=repr(e))
+                raise
+        return trials, params
+
+    def _evaluate_many(self, params_list: List[dict]) -> List[List[Tuple[Any, dict, Optional[Tuple[int, int]]]]]:
+        """
+        ( result, stats, lookups ) di ogni periodo per ogni set di parametri, con backtest_many periodo per periodo.
+        Un set si ferma al primo periodo senza risultato. Non tocca lo storage: gira anche nei processi worker.
+        """
+        if self.shared_warmup:
+            return self.backtest_periods(self.data[0], params_list) if self.data else [[] for _ in params_list]
+        if self._period_pool is not None:
+            futures = [[self._period_pool.submit(_worker_backtest_period, period, kwargs)
+                        for period in range(len(self.data))] for kwargs in params_list]
+            return [self._until_failed([future.result() for future in period_futures]) for period_futures in futures]
+
+        periods = [[] for _ in params_list]
+        alive = list(range(len(params_list)))
+        for df in self.data:
+            if not alive:
+                break
+            evaluated = self.backtest_many(df, [params_list[i] for i in alive])
+            still_alive = []
+            for i, evaluation in zip(alive, evaluated):
+                periods[i].append(evaluation)
+                if evaluation[0] is not None:
+                    still_alive.append(i)
+            alive = still_alive
+        return periods
+
+    def _report_periods(self, trial: TrialResults, periods: list):
+        """
+        report, user attrs e pruning dei periodi gia' valutati come in _objective: ritorna il risultato dell'ultimo
+        periodo o solleva TrialPruned
+        """
+        result = None
+        lookups = []
+        for step, (result, stats, period_lookups) in enumerate(periods, 1):
+            if result is None:
+                raise optuna.exceptions.TrialPruned("no result")
+
             trial.report(result, step)
 
-            for k in stats.keys():
+            for k in self.user_attrs:
                 trial.set_user_attr(f'backtest_{k}', stats[k])
+            lookups.append(period_lookups)
+            self._report_hit_rate(trial, lookups)
 
             if trial.should_prune():
                 raise optuna.exceptions.TrialPruned("should_prune")
 
-        # result = self.backtest(self.data[0], **kwargs)
         if result is None:
             raise optuna.exceptions.TrialPruned("no result")
         return result
 
-    def run(self, max_evals, n_jobs=None, engine_kwargs=None):
-        n_jobs = self._default_n_jobs(n_jobs)
+    def _trial_results(self, trial: optuna.Trial) -> TrialResults:
+        """risultati del trial da scrivere insieme ( buffered_writes ) o direttamente nello storage"""
+        if not self.buffered_writes:
+            return TrialResults(trial)
+        if self._writer is None:
+            # fuori da run() ( es. worker distribuiti ): scritture raggruppate senza write-behind
+            self._writer = TrialWriter(trial.study._storage)
+        return TrialResults(trial, self._writer)
+
+    def _finish_trial(self, study: optuna.Study, trial: optuna.Trial, periods: list):
+        """_report_periods e tell del trial"""
+        results = self._trial_results(trial)
+        try:
+            result = self._report_periods(results, periods)
+        except optuna.exceptions.TrialPruned:
+            self._tell(study, trial, state=TrialState.PRUNED, results=results)
+            return
+        self._tell(study, trial, result, results=results)
+
+    def _optimize_batch(self, study: optuna.Study, batch_size: int):
+        """
+        Stessa logica di _objective per `batch_size` trial insieme: ask di tutti i trial, backtest_many per ogni
+        periodo e tell finale di ciascuno.
+        """
+        trials, params = self._ask_parameters(study, batch_size)
+        for trial, periods in zip(trials, self._evaluate_many(params)):
+            self._finish_trial(study, trial, periods)
+
+    def _optimize_processes(self, study: optuna.Study, n_trials: int, processes: int, batch_size: int = None):
+        """
+        Trial valutati da `processes` processi worker: questo processo ( coordinatore ) e' l'unico che usa lo
+        storage, campiona i parametri, manda ai worker i batch ( `batch_size` trial, 1 se None ) da valutare con
+        _evaluate_many e registra i risultati man mano che arrivano.
+        """
+        batch_size = batch_size or 1
+        cache = FastBacktester.indicator_cache
+        cache_settings = (cache.max_bytes, cache.data_dir) if cache is not None else None
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(self, cache_settings)) as pool:
+            running = {}
+            while n_trials > 0 or running:
+                while n_trials > 0 and len(running) < processes:
+                    trials, params = self._ask_parameters(study, min(batch_size, n_trials))
+                    n_trials -= batch_size
+                    if trials:
+                        running[pool.submit(_worker_evaluate, params)] = trials
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    trials = running.pop(future)
+                    try:
+                        evaluated = future.result()
+                    except Exception as e:
+                        for trial in trials:
+                            self._tell(study, trial, state=TrialState.FAIL, reason=repr(e))
+                        raise
+                    for trial, periods in zip(trials, evaluated):
+                        self._finish_trial(study, trial, periods)
+
+    def run(self, max_evals, n_jobs=None, engine_kwargs=None, batch_size: int = None, processes: int = None):
+        """
+        `processes`: trial valutati da un pool di processi ( niente GIL ) con un solo processo che scrive nello
+        storage, anche sqlite; n_jobs viene ignorato e a postgresql basta una connessione.
+        Senza `processes` e con `period_workers` i periodi di ogni trial sono valutati in parallelo.
+        """
+        n_jobs = 1 if processes else self._default_n_jobs(n_jobs)
         engine_kwargs = self._default_engine_kwargs(engine_kwargs, n_jobs)
 
         storage = optuna.storages.RDBStorage(
@@ -146,29 +555,62 @@ class OptunaOptimizeStrategy(object):
             engine_kwargs=engine_kwargs
         )
 
+        checkpoints = self.uses_checkpoints(batch_size, processes)
+        if self.checkpoint_bars and not checkpoints:
+            self.logger.warning("checkpoint_bars: intermediate pruning is used only with the backtrader engine when "
+                                "periods are evaluated one by one, without batch_size and processes")
+        if batch_size and self.engine != 'numpy':
+            self.logger.warning(f"batch_size: the {self.engine} engine evaluates the trials of a batch one by one, "
+                                f"indicators are shared between trials only with the numpy engine")
         study = optuna.create_study(
             study_name=self.study_name,
             direction='maximize',
             storage=storage,
             load_if_exists=True,
-            pruner=optuna.pruners.NopPruner()
-            # pruner=optuna.pruners.MedianPruner(n_startup_trials=len(self.data))
+            pruner=self.make_pruner(checkpoints)
         )
+        parallel_periods = self.uses_parallel_periods(processes)
 
         n_trials = self._calc_n_trials(study_name=study.study_name, storage=storage, max_evals=max_evals)
 
-        if n_trials > 0:
-            study.optimize(
-                self._objective,
-                n_trials=n_trials,
-                n_jobs=n_jobs
-            )
+        if n_trials > 0 and parallel_periods:
+            cache = FastBacktester.indicator_cache
+            cache_settings = (cache.max_bytes, cache.data_dir) if cache is not None else None
+            self._period_pool = ProcessPoolExecutor(max_workers=min(self.period_workers, len(self.data)),
+                                                    initializer=_init_worker, initargs=(self, cache_settings))
+        if self.buffered_writes:
+            self._writer = TrialWriter(storage, write_behind=self.write_behind)
+        try:
+            self._optimize(study, n_trials, n_jobs, batch_size, processes)
+        finally:
+            if self._period_pool is not None:
+                self._period_pool.shutdown()
+                self._period_pool = None
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
 
         study = optuna.load_study(study_name=self.study_name, storage=storage)
 
         self.logger.info(f"study best value: {study.best_value}")
         return study.best_params
 
+    def _optimize(self, study: optuna.Study, n_trials: int, n_jobs: int, batch_size: int = None,
+                  processes: int = None):
+        if n_trials > 0 and processes:
+            self._optimize_processes(study, n_trials, processes, batch_size)
+        elif n_trials > 0 and batch_size:
+            # batch ask/tell: i trial di un batch sono campionati insieme e valutati con backtest_many
+            while n_trials > 0:
+                self._optimize_batch(study, min(batch_size, n_trials))
+                n_trials -= batch_size
+        elif n_trials > 0:
+            study.optimize(
+                self._objective,
+                n_trials=n_trials,
+                n_jobs=n_jobs
+            )
+
     def _calc_n_trials(self, study_name, storage, max_evals):
         session = storage.scoped_session()
 
@@ -0,0 +1,186 @@
+"""
+Indicatori incrementali per la valutazione in streaming ( strategies_tester.streaming ): una barra alla volta con
+`push()`, lavoro O(1) per barra e solo lo stato necessario ( ultimo valore dell'ema, buffer circolare di `period`
+valori per le somme mobili ), cosi' la memoria resta costante per tutta la durata del flusso.
+Stessi valori dei gemelli in _np_indicators: NaN prima del minperiod di backtrader, 1.0/0.0 per i segnali.
+"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import math
+
+__all__ = ['NAN', 'SumN', 'SMA', 'EMA', 'SMMA', 'Slope', 'MFI', 'CrossUp', 'CrossDown', 'compare', 'logic_and']
+
+NAN = float('nan')
+
+
+class SumN(object):
+    """
+    bt.ind.SumN su un buffer circolare di `period` valori: somma corrente ri-ancorata con math.fsum ogni `period`
+    barre, stesse operazioni di _np_indicators.running_sum_n. I NaN iniziali ( prima del primo valore ) sono saltati
+    """
+    __slots__ = ('period', 'buffer', 'index', 'count', 'total')
+
+    def __init__(self, period: int):
+        self.period = period
+        self.buffer = [0.0] * period
+        self.index = 0  # posizione del valore piu' vecchio della finestra
+        self.count = 0
+        self.total = NAN
+
+    def push(self, x: float) -> float:
+        if not self.count and x != x:
+            return NAN
+        old = self.buffer[self.index]
+        self.buffer[self.index] = x
+        self.index = (self.index + 1) % self.period
+        self.count += 1
+        windows = self.count - self.period
+        if windows < 0:
+            return NAN
+        if windows % self.period == 0:
+            self.total = math.fsum(self.buffer)
+        else:
+            self.total += x - old
+        return self.total
+
+
+class SMA(object):
+    """bt.ind.MovingAverageSimple"""
+    __slots__ = ('period', 'sum_n')
+
+    def __init__(self, period: int):
+        self.period = period
+        self.sum_n = SumN(period)
+
+    def push(self, x: float) -> float:
+        return self.sum_n.push(x) / self.period
+
+
+class _Smoothing(object):
+    """bt.ind.ExponentialSmoothing: seme con la media semplice dei primi `period` valori, poi solo l'ultimo valore"""
+    __slots__ = ('alpha', 'alpha1', 'seed', 'value')
+
+    def __init__(self, period: int, alpha: float):
+        self.alpha = alpha
+        self.alpha1 = 1.0 - alpha
+        self.seed = SMA(period)
+        self.value = NAN
+
+    def push(self, x: float) -> float:
+        if self.seed is None:
+            self.value = self.value * self.alpha1 + x * self.alpha
+        else:
+            self.value = self.seed.push(x)
+            if self.value == self.value:
+                self.seed = None  # il buffer del seme non serve piu'
+        return self.value
+
+
+class EMA(_Smoothing):
+    """bt.ind.ExponentialMovingAverage"""
+    __slots__ = ()
+
+    def __init__(self, period: int):
+        super().__init__(period, 2.0 / (1.0 + period))
+
+
+class SMMA(_Smoothing):
+    """bt.ind.SmoothedMovingAverage ( Wilder )"""
+    __slots__ = ()
+
+    def __init__(self, period: int):
+        super().__init__(period, 1.0 / period)
+
+
+class Slope(object):
+    """_indicators.Slope"""
+    __slots__ = ('prev',)
+
+    def __init__(self):
+        self.prev = NAN
+
+    def push(self, x: float) -> float:
+        prev, self.prev = self.prev, x
+        return (x - prev) / x
+
+
+class MFI(object):
+    """_indicators.MFI"""
+    __slots__ = ('prev', 'flowpos', 'flowneg')
+
+    def __init__(self, period: int = 14):
+        self.prev = NAN
+        self.flowpos = SumN(period)
+        self.flowneg = SumN(period)
+
+    def push(self, high: float, low: float, close: float, volume: float) -> float:
+        tprice = (close + low + high) / 3.0
+        prev, self.prev = self.prev, tprice
+        if prev != prev:
+            return NAN
+        mfraw = tprice * volume
+        flowpos = self.flowpos.push(mfraw * (tprice > prev))
+        flowneg = self.flowneg.push(mfraw * (tprice < prev))
+        if flowneg != flowneg:
+            return NAN
+        mfiratio = flowpos / flowneg if flowneg != 0.0 else 100.0
+        return 100.0 - 100.0 / (1.0 + mfiratio)
+
+
+class _Cross(object):
+    """
+    bt.ind.CrossUp / CrossDown ( `b` anche costante ): tiene solo l'ultima differenza non nulla tra le linee
+    ( bt.ind.NonZeroDifference )
+    """
+    __slots__ = ('up', 'nzd')
+
+    def __init__(self, up: bool):
+        self.up = up
+        self.nzd = NAN
+
+    def push(self, a: float, b: float) -> float:
+        prev = self.nzd
+        d = a - b
+        if d == d and (d != 0.0 or prev != prev):
+            self.nzd = d
+        if prev != prev:
+            return NAN
+        if self.up:
+            return float(prev < 0.0 and a > b)
+        return float(prev > 0.0 and a < b)
+
+
+class CrossUp(_Cross):
+    """bt.ind.CrossUp"""
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(up=True)
+
+
+class CrossDown(_Cross):
+    """bt.ind.CrossDown"""
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(up=False)
+
+
+def compare(op, a: float, b: float) -> float:
+    """confronto tra valori ( es. `close > ma` ): 1.0/0.0, NaN se uno dei due e' NaN"""
+    if a != a or b != b:
+        return NAN
+    return float(op(a, b))
+
+
+def logic_and(*xs: float) -> float:
+    """bt.ind.And: 1.0/0.0, NaN se uno degli argomenti e' NaN"""
+    result = 1.0
+    for x in xs:
+        if x != x:
+            return NAN
+        if x == 0.0:
+            result = 0.0
+    return result
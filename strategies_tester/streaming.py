@@ -0,0 +1,107 @@
+"""
+Valutazione in streaming delle strategie a segnali: le barre ( chiuse ) arrivano una alla volta, gli indicatori
+incrementali di `stream_signals` tengono solo lo stato necessario, quindi lavoro O(1) per barra e memoria costante
+anche su mesi di candele da 1m. `replay` fa passare nel flusso i dati della cache e `replay_check` controlla che i
+segnali coincidano con quelli calcolati sull'intera serie da `fast_signals`.
+"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+from datetime import datetime
+from typing import Iterator, NamedTuple, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+
+from strategies_tester.fastbacktest import fast_data
+from strategies_tester.mapped import MappedOHLCV
+from strategies_tester.strategies import BaseStrategy
+from strategies_tester.strategies._np_indicators import SharedIndicators
+
+__all__ = ['StreamBar', 'StreamingSignals', 'ReplayReport', 'stream_supported', 'stream_bars', 'replay',
+           'replay_check']
+
+
+class StreamBar(NamedTuple):
+    timestamp: int  # ns UTC
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+class ReplayReport(NamedTuple):
+    bars: int
+    long_mismatches: int  # barre con segnale long diverso da fast_signals ( NaN uguale a NaN )
+    short_mismatches: int
+    first_mismatch: int  # indice della prima barra diversa, -1 se nessuna
+
+    @property
+    def ok(self) -> bool:
+        return not self.long_mismatches and not self.short_mismatches
+
+
+def stream_supported(strategy: Type[BaseStrategy]) -> bool:
+    return strategy.stream_signals.__func__ is not BaseStrategy.stream_signals.__func__
+
+
+class StreamingSignals(object):
+    """
+    Segnali di `strategy` con i parametri `kwargs` ( default della strategia per gli altri ): `push(bar)` ritorna
+    ( long, short ) della barra, 1.0/0.0 oppure NaN durante il warm-up degli indicatori.
+    Le barre devono essere chiuse e in ordine: una barra con timestamp non successivo all'ultima e' rifiutata.
+    """
+
+    def __init__(self, strategy: Type[BaseStrategy], **kwargs):
+        if not stream_supported(strategy):
+            raise Exception(f"{strategy.__name__}: streaming signals not supported")
+        self.strategy = strategy
+        self.params = strategy.fast_params(**kwargs)
+        self._push = strategy.stream_signals(self.params)
+        self.bars = 0
+        self.last_timestamp = None
+
+    def push(self, bar) -> Tuple[float, float]:
+        timestamp = getattr(bar, 'timestamp', None)
+        if timestamp is not None:
+            if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+                raise Exception(f"{self.strategy.__name__}: bar {timestamp} not after {self.last_timestamp}")
+            self.last_timestamp = timestamp
+        self.bars += 1
+        return self._push(bar)
+
+
+def stream_bars(df: Union[pd.DataFrame, MappedOHLCV], date_from: datetime = None,
+                date_to: datetime = None) -> Iterator[StreamBar]:
+    """barre della cache come StreamBar, una alla volta ( letti a blocchi per non copiare tutto in liste python )"""
+    data = fast_data(df, date_from, date_to)
+    block = 65536
+    for start in range(0, len(data.timestamp), block):
+        yield from map(StreamBar._make, zip(*(column[start:start + block].tolist() for column in data)))
+
+
+def replay(strategy: Type[BaseStrategy], df: Union[pd.DataFrame, MappedOHLCV], date_from: datetime = None,
+           date_to: datetime = None, **kwargs) -> Tuple[np.ndarray, np.ndarray]:
+    """segnali long e short ottenuti spingendo le barre di `df` una alla volta"""
+    stream = StreamingSignals(strategy, **kwargs)
+    signals = [stream.push(bar) for bar in stream_bars(df, date_from, date_to)]
+    long_signal, short_signal = np.array(signals, dtype=np.float64).reshape(-1, 2).T
+    return long_signal, short_signal
+
+
+def _mismatches(expected: np.ndarray, actual: np.ndarray) -> np.ndarray:
+    return ~((expected == actual) | (np.isnan(expected) & np.isnan(actual)))
+
+
+def replay_check(strategy: Type[BaseStrategy], df: Union[pd.DataFrame, MappedOHLCV], date_from: datetime = None,
+                 date_to: datetime = None, **kwargs) -> ReplayReport:
+    """confronta i segnali di `replay` con quelli di `fast_signals` sugli stessi dati"""
+    data = fast_data(df, date_from, date_to)
+    expected = strategy.fast_signals(data, strategy.fast_params(**kwargs), SharedIndicators(data))
+    actual = replay(strategy, df, date_from, date_to, **kwargs)
+    long_diff, short_diff = (_mismatches(e, a) for e, a in zip(expected, actual))
+    different = np.flatnonzero(long_diff | short_diff)
+    return ReplayReport(len(data.timestamp), int(long_diff.sum()), int(short_diff.sum()),
+                        int(different[0]) if len(different) else -1)
@@ -0,0 +1,268 @@
+"""
+Scritture dei risultati dei trial optuna raggruppate: user attrs, system attrs, valori intermedi, valore e stato di
+un trial ( o di piu' trial ) vanno nello storage con una sola transazione invece di una per chiamata a
+`trial.set_user_attr` / `trial.report`. Con `write_behind` i trial chiusi sono messi in coda e scritti da un thread,
+piu' trial per transazione ( pensato per sqlite, dove ogni commit e' un fsync ).
+"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import optuna
+import optuna.storages
+from optuna.storages.rdb import models
+from optuna.trial import TrialState
+
+__all__ = ['TrialRecord', 'TrialWriter', 'TrialResults']
+
+
+class TrialRecord(object):
+    """risultati di un trial in attesa di essere scritti ( value e state None: il trial resta RUNNING )"""
+    __slots__ = ('trial_id', 'user_attrs', 'system_attrs', 'intermediate_values', 'value', 'state')
+
+    def __init__(self, trial_id: int):
+        self.trial_id = trial_id
+        self.user_attrs = {}
+        self.system_attrs = {}
+        self.intermediate_values = {}
+        self.value = None
+        self.state = None
+
+    def __bool__(self) -> bool:
+        return bool(self.user_attrs or self.system_attrs or self.intermediate_values or self.state is not None)
+
+
+class TrialWriter(object):
+    """
+    Scrive TrialRecord nello storage: con RDBStorage una transazione per chiamata a `write` ( le righe nuove con un
+    solo insert per tabella ), con gli altri storage le normali chiamate una per valore.
+    `write_behind`: `submit` mette in coda e ritorna subito, un thread scrive ogni `interval` secondi ( o appena ci
+    sono `max_pending` record ) tutti i record in coda insieme. `flush()` aspetta che la coda sia scritta.
+    """
+
+    def __init__(self, storage: optuna.storages.BaseStorage, write_behind: bool = False, interval: float = 1.0,
+                 max_pending: int = 64):
+        self.storage = storage
+        self.logger = logging.getLogger(__name__)
+        self.write_behind = write_behind
+        self.interval = interval
+        self.max_pending = max_pending
+        self._queue = None
+        self._thread = None
+        self._error = None
+        if write_behind:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._write_loop, name='trial-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, record: TrialRecord):
+        """scrive subito ( o accoda con write_behind ); RuntimeError se il trial e' gia' chiuso, come optuna"""
+        if not record:
+            return
+        if self._queue is None:
+            if self.write([record]):
+                raise RuntimeError(f"Trial id {record.trial_id} has already finished and can not be updated.")
+            return
+        self._raise_error()
+        self._queue.put(record)
+
+    def flush(self):
+        if self._queue is not None:
+            self._queue.join()
+            self._raise_error()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
+            self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _write_loop(self):
+        stop = False
+        while not stop:
+            records = [self._queue.get()]
+            try:
+                # aspetta altri record per `interval` secondi ( o fino a max_pending ) e li scrive insieme
+                while records[-1] is not None and len(records) < self.max_pending:
+                    try:
+                        records.append(self._queue.get(timeout=self.interval))
+                    except queue.Empty:
+                        break
+                stop = records[-1] is None
+                pending = [record for record in records if record is not None]
+                if pending:
+                    skipped = self.write(pending)
+                    if skipped:
+                        self.logger.warning(f"trials {skipped} already finished: results not written")
+            except Exception as e:
+                self.logger.error(f"trial writer: {e!r}")
+                self._error = e
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+
+    def write(self, records: List[TrialRecord]) -> List[int]:
+        """scrive i record e ritorna gli id dei trial saltati perche' gia' chiusi ( es. ripresi da un coordinatore )"""
+        if not isinstance(self.storage, optuna.storages.RDBStorage):
+            return self._write_each(records)
+
+        session = self.storage.scoped_session()
+        try:
+            ids = [record.trial_id for record in records]
+            trials = {trial.trial_id: trial for trial in session.query(models.TrialModel).filter(
+                models.TrialModel.trial_id.in_(ids)).with_for_update()}
+            missing = set(ids) - set(trials)
+            if missing:
+                raise ValueError(f"trials {sorted(missing)}: {models.NOT_FOUND_MSG}")
+            skipped = [trial_id for trial_id in ids if trials[trial_id].state.is_finished()]
+            records = [record for record in records if record.trial_id not in skipped]
+
+            self._write_attrs(session, models.TrialUserAttributeModel, {r.trial_id: r.user_attrs for r in records})
+            self._write_attrs(session, models.TrialSystemAttributeModel,
+                              {r.trial_id: r.system_attrs for r in records})
+            self._write_intermediate_values(session, {r.trial_id: r.intermediate_values for r in records})
+            for record in records:
+                trial = trials[record.trial_id]
+                if record.value is not None:
+                    trial.value = record.value
+                if record.state is not None:
+                    trial.state = record.state
+                    if record.state.is_finished():
+                        trial.datetime_complete = datetime.now()
+        except Exception:
+            session.rollback()
+            raise
+        self.storage._commit(session)
+        return skipped
+
+    @staticmethod
+    def _write_attrs(session, model, attrs: Dict[int, Dict[str, Any]]):
+        ids = [trial_id for trial_id, values in attrs.items() if values]
+        if not ids:
+            return
+        existing = {(a.trial_id, a.key): a for a in session.query(model).filter(model.trial_id.in_(ids))}
+        rows = []
+        for trial_id in ids:
+            for key, value in attrs[trial_id].items():
+                value_json = json.dumps(value)
+                attribute = existing.get((trial_id, key))
+                if attribute is None:
+                    rows.append({'trial_id': trial_id, 'key': key, 'value_json': value_json})
+                else:
+                    attribute.value_json = value_json
+        if rows:
+            session.execute(model.__table__.insert(), rows)
+
+    @staticmethod
+    def _write_intermediate_values(session, values: Dict[int, Dict[int, float]]):
+        ids = [trial_id for trial_id, steps in values.items() if steps]
+        if not ids:
+            return
+        model = models.TrialValueModel
+        # come set_trial_intermediate_value: un passo gia' riportato non viene sovrascritto
+        existing = set(session.query(model.trial_id, model.step).filter(model.trial_id.in_(ids)))
+        rows = [{'trial_id': trial_id, 'step': step, 'value': value} for trial_id in ids
+                for step, value in values[trial_id].items() if (trial_id, step) not in existing]
+        if rows:
+            session.execute(model.__table__.insert(), rows)
+
+    def _write_each(self, records: List[TrialRecord]) -> List[int]:
+        skipped = []
+        for record in records:
+            try:
+                for key, value in record.user_attrs.items():
+                    self.storage.set_trial_user_attr(record.trial_id, key, value)
+                for key, value in record.system_attrs.items():
+                    self.storage.set_trial_system_attr(record.trial_id, key, value)
+                for step, value in record.intermediate_values.items():
+                    self.storage.set_trial_intermediate_value(record.trial_id, step, value)
+                if record.value is not None:
+                    self.storage.set_trial_value(record.trial_id, record.value)
+                if record.state is not None:
+                    self.storage.set_trial_state(record.trial_id, record.state)
+            except RuntimeError:
+                skipped.append(record.trial_id)
+        return skipped
+
+
+class TrialResults(object):
+    """
+    Stesse chiamate di optuna.Trial usate dall'ottimizzatore ( set_user_attr, report, should_prune ) tenute in un
+    TrialRecord e scritte da `flush()` o, con lo stato finale, da `finish()`. Senza `writer` ogni chiamata va
+    direttamente al trial. `should_prune` scrive prima i valori in sospeso ( il pruner li legge dallo storage ), con
+    NopPruner non interroga nemmeno lo storage.
+    """
+
+    def __init__(self, trial: optuna.Trial, writer: Optional[TrialWriter] = None):
+        self.trial = trial
+        self.writer = writer
+        self.record = TrialRecord(trial._trial_id)
+        self.last_value = None  # ultimo valore intermedio, per i trial pruned
+
+    @property
+    def number(self) -> int:
+        return self.trial.number
+
+    def set_user_attr(self, key: str, value: Any):
+        if self.writer is None:
+            self.trial.set_user_attr(key, value)
+        else:
+            self.record.user_attrs[key] = value
+
+    def set_system_attr(self, key: str, value: Any):
+        if self.writer is None:
+            self.trial.set_system_attr(key, value)
+        else:
+            self.record.system_attrs[key] = value
+
+    def report(self, value: float, step: int):
+        self.last_value = float(value)
+        if self.writer is None:
+            self.trial.report(value, step)
+        else:
+            self.record.intermediate_values.setdefault(step, self.last_value)
+
+    def should_prune(self) -> bool:
+        if isinstance(self.trial.study.pruner, optuna.pruners.NopPruner):
+            return False
+        self.flush()
+        return self.trial.should_prune()
+
+    def flush(self):
+        """scrive subito i risultati in sospeso, anche con write-behind: servono prima di tornare a optuna"""
+        if self.writer is not None and self.record:
+            record, self.record = self.record, TrialRecord(self.record.trial_id)
+            if self.writer.write([record]):
+                raise RuntimeError(f"Trial id {record.trial_id} has already finished and can not be updated.")
+
+    def finish(self, value: Optional[float], state: TrialState, reason: str = None):
+        """chiude il trial insieme ai risultati in sospeso ( accodato con write-behind )"""
+        if self.writer is None:
+            storage, trial_id = self.trial.study._storage, self.trial._trial_id
+            if value is not None:
+                storage.set_trial_value(trial_id, value)
+            if reason is not None:
+                storage.set_trial_system_attr(trial_id, "fail_reason", reason)
+            storage.set_trial_state(trial_id, state)
+            return
+        if value is not None:
+            self.record.value = value
+        if reason is not None:
+            self.record.system_attrs['fail_reason'] = reason
+        self.record.state = state
+        record, self.record = self.record, TrialRecord(self.record.trial_id)
+        self.writer.submit(record)
@@ -1,31 +1,112 @@
+import math
+import sys
 from datetime import datetime
-from typing import Type, Any, Tuple
+from typing import Type, Any, Tuple, Union, Iterable, List
 
 import backtrader as bt
+import numpy as np
 import pandas as pd
 
+from strategies_tester.mapped import MappedOHLCV
 from strategies_tester.strategies import BaseStrategy
 
-__all__ = ['BacktestData', 'backtest_strategy']
+__all__ = ['ANALYZERS', 'METRICS', 'BacktestData', 'MappedData', 'backtest_strategy', 'metric_analyzers']
+
+# analyzer di backtest_strategy: nome ( _name ) -> ( classe, parametri )
+ANALYZERS = {
+    'sharpe_ratio': (bt.analyzers.SharpeRatio, {'timeframe': bt.TimeFrame.Days}),
+    'log_returns_rolling': (bt.analyzers.LogReturnsRolling, {}),
+    'returns': (bt.analyzers.Returns, {}),
+    'draw_down': (bt.analyzers.DrawDown, {}),
+    'sqn': (bt.analyzers.SQN, {}),
+    'vwr': (bt.analyzers.VWR, {}),
+    'trade': (bt.analyzers.TradeAnalyzer, {}),
+    'gross_leverage': (bt.analyzers.GrossLeverage, {}),
+}
+
+# metrica -> analyzer necessari per calcolarla ( pnl viene dal valore finale del broker )
+METRICS = {
+    'pnl': (),
+    'sqn': ('sqn',),
+    'vwr': ('vwr',),
+    'sharpe_ratio': ('sharpe_ratio',),
+    'winrate': ('trade',),
+    'draw_down': ('draw_down',),
+    'gross_leverage': ('gross_leverage',),
+    'returns': ('returns',),
+    'log_returns_rolling': ('log_returns_rolling',),
+}
 
 
 class BacktestData(bt.feeds.PandasData):
     pass
 
 
-def backtrader_data(dataname: pd.DataFrame, compression=None, timeframe=None, *args, **kwargs):
-    td = dataname.index[2] - dataname.index[1]
+class MappedData(bt.feed.DataBase):
+    """feed che legge barra per barra da un MappedOHLCV ( `dataname` ) senza costruire un DataFrame"""
+    # date2num di backtrader conta i giorni dal 0001-01-01 ( 1970-01-01 == 719163.0 )
+    EPOCH_NUM = 719163.0
+    NS_PER_DAY = 86400 * 10 ** 9
+
+    def start(self):
+        super(MappedData, self).start()
+        mapped = self.p.dataname
+        self._ts = mapped.timestamp
+        self._open, self._high, self._low = mapped.open, mapped.high, mapped.low
+        self._close, self._volume = mapped.close, mapped.volume
+        self._idx = None
+
+    def _load(self):
+        if self._idx is None:
+            # fromdate e' disponibile solo dopo start(): salta direttamente alla prima barra utile
+            self._idx = 0
+            if math.isfinite(self.fromdate):
+                ns = int(round((self.fromdate - self.EPOCH_NUM) * self.NS_PER_DAY))
+                self._idx = int(np.searchsorted(self._ts, ns, side='left'))
+        i = self._idx
+        if i >= len(self._ts):
+            return False
+        self._idx += 1
+        self.lines.datetime[0] = self.EPOCH_NUM + float(self._ts[i]) / self.NS_PER_DAY
+        self.lines.open[0] = float(self._open[i])
+        self.lines.high[0] = float(self._high[i])
+        self.lines.low[0] = float(self._low[i])
+        self.lines.close[0] = float(self._close[i])
+        self.lines.volume[0] = float(self._volume[i])
+        self.lines.openinterest[0] = 0.0
+        return True
+
+
+def infer_timeframe(td: pd.Timedelta) -> Tuple[int, int]:
+    timeframe, compression = None, None
+    if td.resolution_string == 'H':  # hours
+        timeframe = bt.TimeFrame.Minutes
+        compression = td.components.minutes + (td.components.hours * 60)
+    elif td.resolution_string == 'T':  # minutes
+        timeframe = bt.TimeFrame.Minutes
+        compression = td.components.minutes + (td.components.hours * 60)
+    elif td.resolution_string == 'D':  # days
+        timeframe = bt.TimeFrame.Days
+        compression = td.components.days
+    return timeframe, compression
+
+
+def bar_delta(timestamps: np.ndarray) -> pd.Timedelta:
+    # distanza minima tra le prime candele: un buco o una candela duplicata non cambiano il timeframe
+    diffs = np.diff(np.asarray(timestamps[:1000], dtype=np.int64))
+    return pd.Timedelta(int(diffs[diffs > 0].min()))
+
+
+def backtrader_data(dataname: Union[pd.DataFrame, MappedOHLCV], compression=None, timeframe=None, *args, **kwargs):
+    if isinstance(dataname, MappedOHLCV):
+        td = bar_delta(dataname.timestamp)
+        data_cls = MappedData
+    else:
+        td = bar_delta(dataname.index.asi8)
+        data_cls = BacktestData
     if timeframe is None or compression is None:
-        if td.resolution_string == 'H':  # hours
-            timeframe = bt.TimeFrame.Minutes
-            compression = td.components.minutes + (td.components.hours * 60)
-        elif td.resolution_string == 'T':  # minutes
-            timeframe = bt.TimeFrame.Minutes
-            compression = td.components.minutes + (td.components.hours * 60)
-        elif td.resolution_string == 'D':  # days
-            timeframe = bt.TimeFrame.Days
-            compression = td.components.days
-    return BacktestData(
+        timeframe, compression = infer_timeframe(td)
+    return data_cls(
         dataname=dataname,
         timeframe=timeframe,
         compression=compression,
@@ -34,8 +115,18 @@ def backtrader_data(dataname: pd.DataFrame, compression=None, timeframe=None, *a
     )
 
 
+def metric_analyzers(metrics: Iterable[str]) -> List[str]:
+    """analyzer da aggiungere per le metriche richieste, nell'ordine di ANALYZERS"""
+    needed = set()
+    for metric in metrics:
+        if metric not in METRICS:
+            raise Exception(f"{metric}: metric not found")
+        needed.update(METRICS[metric])
+    return [name for name in ANALYZERS if name in needed]
+
+
 def backtest_strategy(
-        df: pd.DataFrame,
+        df: Union[pd.DataFrame, MappedOHLCV],
         strategy: Type[BaseStrategy],
         date_from: datetime = None,
         date_to: datetime = None,
@@ -48,15 +139,21 @@ def backtest_strategy(
         timeframe=bt.TimeFrame.Minutes,
         compression=60,
         output=None,
+        runonce=True,
+        metrics: Iterable[str] = None,
         *args, **kwargs
 ) -> Tuple[bt.Cerebro, Any]:
+    """
+    `metrics`: metriche che servono al chiamante ( chiavi di METRICS ), vengono aggiunti solo gli analyzer necessari;
+    None aggiunge tutti gli analyzer ( Returns e LogReturnsRolling solo con `returns_analyzer` ).
+    """
     cerebro = bt.Cerebro()
 
     if date_from is None:
-        date_from = df.index.min().to_pydatetime()
+        date_from = (df.start if isinstance(df, MappedOHLCV) else df.index.min()).to_pydatetime()
 
     if date_to is None:
-        date_to = df.index.max().to_pydatetime()
+        date_to = (df.end if isinstance(df, MappedOHLCV) else df.index.max()).to_pydatetime()
 
     # data
     data = backtrader_data(
@@ -85,16 +182,14 @@ def backtest_strategy(
     # strategy
     cerebro.addstrategy(strategy, *args, **kwargs)
 
-    # analysers
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe_ratio', timeframe=bt.TimeFrame.Days)
-    if returns_analyzer:
-        cerebro.addanalyzer(bt.analyzers.LogReturnsRolling, _name='log_returns_rolling')
-        cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
-    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='draw_down')
-    cerebro.addanalyzer(bt.analyzers.SQN, _name='sqn')
-    cerebro.addanalyzer(bt.analyzers.VWR, _name='vwr')
-    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trade')
-    cerebro.addanalyzer(bt.analyzers.GrossLeverage, _name='gross_leverage')
+    # analysers: GrossLeverage, VWR e gli altri lavorano ad ogni barra, in ottimizzazione servono solo quelli usati
+    if metrics is None:
+        analyzers = [name for name in ANALYZERS if returns_analyzer or name not in ('log_returns_rolling', 'returns')]
+    else:
+        analyzers = metric_analyzers(list(metrics) + (['log_returns_rolling', 'returns'] if returns_analyzer else []))
+    for name in analyzers:
+        analyzer, analyzer_kwargs = ANALYZERS[name]
+        cerebro.addanalyzer(analyzer, _name=name, **analyzer_kwargs)
     # cerebro.addanalyzer(bt.analyzers.Calmar, _name='calmar')
 
     # params
@@ -103,15 +198,12 @@ def backtest_strategy(
     cerebro.addsizer(bt.sizers.PercentSizer, percents=perc_size)
     cerebro.signal_accumulate(False)
     cerebro.signal_concurrent(False)
-    if output is None:
-        if 'verbose' in kwargs and kwargs['verbose']:
-            import sys
-            output = sys.stdout
-        else:
-            import os
-            output = open(os.devnull, "w")
-    cerebro.addwriter(bt.WriterFile, csv=True, out=output)
-    # run
-    thestrats = cerebro.run(runonce=False)
+    # writer solo se serve un output: in modalita' silenziosa ( ottimizzazioni ) niente csv formattato ad ogni barra
+    if output is None and kwargs.get('verbose'):
+        output = sys.stdout
+    if output is not None:
+        cerebro.addwriter(bt.WriterFile, csv=True, out=output)
+    # run: runonce viene disattivato da BaseStrategy.start() se un indicatore ha solo next() e da backtrader con replay
+    thestrats = cerebro.run(runonce=runonce)
 
     return cerebro, thestrats
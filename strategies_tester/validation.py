@@ -0,0 +1,112 @@
+"""Controllo e riparazione vettorizzati delle candele OHLCV lette dalla cache"""
+
+__author__ = "Liquidator"
+__copyright__ = "Copyright 2020, Liquidator"
+
+from typing import List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+
+__all__ = ['ValidationReport', 'validate_ohlcv']
+
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+class ValidationReport(NamedTuple):
+    rows: int  # righe dopo la riparazione
+    unsorted: bool  # righe non in ordine di timestamp ( riordinate )
+    duplicates: int  # timestamp ripetuti ( tenuta l'ultima candela )
+    invalid: int  # candele con NaN o prezzi non positivi ( scartate )
+    inconsistent: int  # high/low che non contengono open e close ( solo segnalate )
+    gaps: List[Tuple[pd.Timestamp, pd.Timestamp]]  # candele mancanti: prima e ultima di ogni buco
+    missing_bars: int
+    zero_volume_runs: List[Tuple[pd.Timestamp, pd.Timestamp]]  # sequenze di almeno `zero_volume_run` candele
+    zero_volume_bars: int
+
+    @property
+    def repaired(self) -> bool:
+        return self.unsorted or self.duplicates > 0 or self.invalid > 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.repaired and not self.inconsistent and not self.gaps and not self.zero_volume_runs
+
+    def summary(self) -> str:
+        return (f"rows {self.rows}, unsorted {self.unsorted}, duplicates {self.duplicates}, invalid {self.invalid}, "
+                f"inconsistent {self.inconsistent}, gaps {len(self.gaps)} ( {self.missing_bars} bars ), "
+                f"zero volume runs {len(self.zero_volume_runs)} ( {self.zero_volume_bars} bars )")
+
+
+def validate_ohlcv(df: pd.DataFrame, bin_minutes: int = None,
+                   zero_volume_run: int = 5) -> Tuple[pd.DataFrame, ValidationReport]:
+    """
+    Ordina, rimuove i timestamp duplicati e le candele non valide, poi cerca buchi ( se e' noto `bin_minutes` ) e
+    sequenze di candele a volume zero. Tutto su array NumPy: se non serve nessuna riparazione `df` viene ritornato
+    senza copie.
+    """
+    timestamps = df.index.asi8
+    unsorted = bool(len(timestamps) > 1 and np.any(timestamps[1:] < timestamps[:-1]))
+    if unsorted:
+        order = np.argsort(timestamps, kind='stable')
+        df = df.iloc[order]
+        timestamps = timestamps[order]
+
+    # a parita' di timestamp vince l'ultima candela, come in merge_ohlcv
+    keep = np.r_[timestamps[1:] != timestamps[:-1], True] if len(timestamps) else np.ones(0, dtype=bool)
+    duplicates = int(len(keep) - keep.sum())
+
+    columns = [c for c in OHLCV_COLUMNS if c in df]
+    values = {c: df[c].to_numpy(dtype=np.float64) for c in columns}
+    valid = np.ones(len(timestamps), dtype=bool)
+    for c in columns:
+        valid &= ~np.isnan(values[c])
+        valid &= values[c] > 0 if c != 'volume' else values[c] >= 0
+    invalid = int((keep & ~valid).sum())
+
+    keep &= valid
+    if not keep.all():
+        df = df[keep]
+        timestamps = timestamps[keep]
+        values = {c: v[keep] for c, v in values.items()}
+
+    inconsistent = 0
+    if all(c in values for c in ('open', 'high', 'low', 'close')):
+        body_high = np.maximum(values['open'], values['close'])
+        body_low = np.minimum(values['open'], values['close'])
+        inconsistent = int(np.count_nonzero((values['high'] < body_high) | (values['low'] > body_low)))
+
+    gaps, missing_bars = [], 0
+    if bin_minutes and len(timestamps) > 1:
+        step = bin_minutes * 60 * 10 ** 9
+        diffs = np.diff(timestamps)
+        holes = np.flatnonzero(diffs > step)
+        missing_bars = int((diffs[holes] // step - 1).sum())
+        gaps = [
+            (pd.Timestamp(int(timestamps[i]) + step, tz='UTC'), pd.Timestamp(int(timestamps[i + 1]) - step, tz='UTC'))
+            for i in holes
+        ]
+
+    zero_volume_runs, zero_volume_bars = [], 0
+    if 'volume' in values and len(timestamps):
+        zero = np.r_[False, values['volume'] == 0, False]
+        edges = np.flatnonzero(zero[1:] != zero[:-1])
+        starts, ends = edges[::2], edges[1::2]
+        long_runs = (ends - starts) >= zero_volume_run
+        zero_volume_bars = int((ends - starts)[long_runs].sum())
+        zero_volume_runs = [
+            (pd.Timestamp(int(timestamps[s]), tz='UTC'), pd.Timestamp(int(timestamps[e - 1]), tz='UTC'))
+            for s, e in zip(starts[long_runs], ends[long_runs])
+        ]
+
+    return df, ValidationReport(
+        rows=len(df),
+        unsorted=unsorted,
+        duplicates=duplicates,
+        invalid=invalid,
+        inconsistent=inconsistent,
+        gaps=gaps,
+        missing_bars=missing_bars,
+        zero_volume_runs=zero_volume_runs,
+        zero_volume_bars=zero_volume_bars,
+    )
@@ -0,0 +1,40 @@
+"""
+Parita' del backtest NumPy ( strategies_tester.fastbacktest ) con backtrader: stessi parametri ( default + combinazioni
+casuali ) con OptunaOptimizeStrategy.backtest e .fast_backtest, statistiche confrontate con le TOLERANCES del benchmark.
+"""
+import logging
+
+import numpy as np
+import pytest
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_fastbacktest import STATS, STRATEGIES, TOLERANCES, same_value
+from strategies_tester.strategies import OptunaOptimizeStrategy
+
+BARS = 4000
+FREQ = '1h'
+RANDOM_SETS = 2
+
+
+@pytest.fixture(scope='module')
+def df():
+    # gli errori di backtest() ( es. winrate senza trade persi ) vengono loggati: qui conta solo che coincidano
+    logging.getLogger('strategies_tester').setLevel(logging.CRITICAL)
+    return synthetic_ohlcv(BARS, freq=FREQ, seed=0)
+
+
+@pytest.mark.parametrize('perc_size', [10, 50, 100])
+@pytest.mark.parametrize('strategy, random_params', STRATEGIES, ids=[s.__name__ for s, _ in STRATEGIES])
+def test_fast_backtest_matches_backtrader(df, strategy, random_params, perc_size):
+    rng = np.random.default_rng(perc_size)
+    opt = OptunaOptimizeStrategy('test', 'bitmex', 'XBTUSD', FREQ, [], perc_size=perc_size,
+                                 start_cash=1000 if perc_size >= 100 else 10000)
+    opt.strategy = strategy
+    for params in [{}] + [random_params(rng) for _ in range(RANDOM_SETS)]:
+        slow = opt.backtest(df, **params)[1]
+        fast = opt.fast_backtest(df, **params)[1]
+        if slow is None or fast is None:
+            assert slow is None and fast is None, f"{params}: backtrader {slow}, numpy {fast}"
+            continue
+        for k in STATS:
+            assert same_value(slow[k], fast[k], TOLERANCES[k]), f"{params} {k}: backtrader {slow[k]}, numpy {fast[k]}"
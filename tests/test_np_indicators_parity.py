@@ -0,0 +1,50 @@
+"""
+Parita' dei gemelli NumPy ( strategies/_np_indicators.py ) con gli indicatori backtrader in runonce: stesse barre NaN
+prima del minperiod ed errore relativo entro MAX_ERROR per ogni linea. MFI e SMA sono controllati anche con un periodo
+appena sotto e uno da RUNNING_MIN_PERIOD, cosi' sum_n passa da entrambe le somme mobili.
+"""
+import logging
+
+import backtrader as bt
+import numpy as np
+import pytest
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_np_indicators import CASES, compare, run_backtrader
+from strategies_tester.strategies import _np_indicators as npi
+from strategies_tester.strategies._indicators import MFI
+
+BARS = 3000
+MAX_ERROR = 1e-9
+UNDER, OVER = npi.RUNNING_MIN_PERIOD - 1, npi.RUNNING_MIN_PERIOD
+
+RUNNING_CASES = [
+    (f'MFI {period}', lambda d, period=period: MFI(d, period=period),
+     lambda h, l, c, v, period=period: npi.mfi(h, l, c, v, period), ('mfi',))
+    for period in (UNDER, OVER)
+] + [
+    (f'SMA {period}', lambda d, period=period: bt.ind.SMA(d.close, period=period),
+     lambda h, l, c, v, period=period: npi.sma(c, period), ('sma',))
+    for period in (UNDER, OVER)
+]
+
+
+@pytest.fixture(scope='module')
+def df():
+    logging.getLogger('strategies_tester').setLevel(logging.CRITICAL)
+    return synthetic_ohlcv(BARS, freq='1h', seed=0)
+
+
+@pytest.mark.parametrize('name, bt_factory, np_func, lines', CASES + RUNNING_CASES,
+                         ids=[case[0] for case in CASES + RUNNING_CASES])
+def test_np_indicator_matches_backtrader(df, name, bt_factory, np_func, lines):
+    indicator, _ = run_backtrader(df, bt_factory, repeat=1)
+    result = np_func(*(df[k].to_numpy() for k in ('high', 'low', 'close', 'volume')))
+    result = result if isinstance(result, tuple) else (result,)
+    assert len(result) == len(lines)
+    for line, values in zip(lines, result):
+        expected = np.array(getattr(indicator.lines, line).array)[-len(df):]
+        # SlopeGrad: backtrader legge fuori dai dati alla prima barra ( vedi npi.slope_grad )
+        same_nan, error = compare(expected, values, skip=5 if name == 'SlopeGrad' else 0)
+        assert same_nan, f"{name}.{line}: different NaN bars"
+        assert error <= MAX_ERROR, f"{name}.{line}: relative error {error:.2e}"
@@ -0,0 +1,35 @@
+"""
+Parita' di runonce: gli indicatori con once() ( _indicators.py ) e le strategie incluse danno gli stessi valori e
+risultati con runonce=True e con il ciclo evento per evento ( runonce=False ).
+"""
+import logging
+
+import numpy as np
+import pytest
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_runonce import STRATEGIES, indicator_values, run
+
+BARS = 3000
+
+
+@pytest.fixture(scope='module')
+def df():
+    logging.getLogger('strategies_tester').setLevel(logging.CRITICAL)
+    return synthetic_ohlcv(BARS, freq='1min', seed=0)
+
+
+def test_indicators_runonce_matches_runnext(df):
+    slow = indicator_values(df, runonce=False)
+    fast = indicator_values(df, runonce=True)
+    assert {name.split('.')[0] for name in slow} >= {'slope', 'slope_grad', 'super_trend_band', 'super_trend', 'stc'}
+    different = [name for name in slow if not np.allclose(slow[name], fast[name], equal_nan=True)]
+    assert not different, f"different between runnext and runonce: {different}"
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES, ids=[s.__name__ for s in STRATEGIES])
+def test_strategy_runonce_matches_runnext(df, strategy):
+    _, slow_value, slow_trades = run(df, strategy, runonce=False)
+    _, fast_value, fast_trades = run(df, strategy, runonce=True)
+    assert np.isclose(slow_value, fast_value)
+    assert slow_trades == fast_trades
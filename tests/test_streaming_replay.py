@@ -0,0 +1,30 @@
+"""
+Parita' dello streaming ( strategies_tester.streaming ): i segnali calcolati candela per candela coincidono con
+fast_signals per le strategie a segnali, con i parametri di default e con combinazioni casuali.
+"""
+import numpy as np
+import pytest
+
+from benchmarks._synthetic import synthetic_ohlcv
+from benchmarks.bench_fastbacktest import STRATEGIES
+from strategies_tester.streaming import replay_check
+
+BARS = 5000
+RANDOM_SETS = 3
+
+
+@pytest.fixture(scope='module')
+def df():
+    return synthetic_ohlcv(BARS, freq='1min', seed=1)
+
+
+def params_sets(random_params):
+    rng = np.random.default_rng(0)
+    return [{}] + [random_params(rng) for _ in range(RANDOM_SETS)]
+
+
+@pytest.mark.parametrize('strategy, random_params', STRATEGIES, ids=[s.__name__ for s, _ in STRATEGIES])
+def test_replay_matches_fast_signals(df, strategy, random_params):
+    for params in params_sets(random_params):
+        report = replay_check(strategy, df, **params)
+        assert report.ok, f"{params}: {report}"